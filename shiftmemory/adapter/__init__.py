@@ -1,2 +1,5 @@
 from .redis import Redis
 from .dummy import Dummy
+from .shared import Shared
+from .sqlite import Sqlite
+from .local import Local
@@ -0,0 +1,344 @@
+import fnmatch
+import threading
+import time
+from shiftmemory import times, policy
+
+
+class Local:
+    """
+    Local adapter
+    Implements bounded cache in process memory. Useful as the fastest tier
+    in front of shared caches or for data that does not need to be shared
+    between processes.
+
+    Number of items is limited and the choice of items to keep is made by
+    configurable policy: lru, lfu or tinylfu (default). The latter admits
+    new items into main cache only if they are used more often than items
+    they would replace, so one-off keys and scans do not flush hot data.
+    Expired items are dropped when read or on optimization.
+    """
+
+    def __init__(self, namespace, ttl=60, **config):
+        """
+        Create adapter
+        Instantiates adapter with namespace, default ttl and optional
+        configuration parameters
+
+        :param namespace:           namespace name
+        :param ttl:                 default ttl for all items (default=60)
+        :param config:              cache config (falls back to defaults)
+        :return:                    None
+        """
+        self.ttl = ttl
+        self.namespace = namespace
+        self.config = None
+        self.items = dict()
+        self.tags = dict()
+        self.lock = threading.RLock()
+
+        # get cache config
+        cache_config = config
+        if 'config' in cache_config:
+            cache_config = cache_config['config']
+
+        self.configure(cache_config)
+        self.policy = policy.create(
+            self.config['policy'],
+            self.config['max_items'],
+            **self.config['policy_options']
+        )
+
+    def configure(self, config=None):
+        """
+        Configure
+        Configures an adapter with optional config. If no config provided
+        or it misses some settings, defaults will be used.
+
+        :param config:          config dictionary
+        :return:                None
+        """
+        default_config = dict(
+            max_items=10000,
+            policy='tinylfu',
+            policy_options=dict(),
+        )
+
+        if config is None: config = dict()
+        self.config = dict(list(default_config.items()) + list(config.items()))
+
+    # -------------------------------------------------------------------------
+    # Caching
+    # -------------------------------------------------------------------------
+
+    def exists(self, key):
+        """
+        Item exists?
+        Checks item existence by the given key to return a boolean result
+
+        :param key:             string, item key
+        :return:                bool
+        """
+        with self.lock:
+            return self.find(key) is not None
+
+    def set(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        """
+        Set item
+        Creates or updates an item. Can optionally accept an iterable
+        of tags to add to item and either ttl or expiration date for custom
+        item expiration, otherwise falls back to default adapter ttl.
+        Returns false if policy did not admit new item.
+
+        :param key:             string, cache key
+        :param value:           data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        with self.lock:
+            return self.write(key, value, tags, ttl, expires_at)
+
+    def add(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        """
+        Add
+        Similar to set item but only saves an item if it does not exist yet.
+        Will return false in case in does.
+
+        :param key:             string, cache key
+        :param value:           data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        with self.lock:
+            if self.find(key) is not None:
+                return False
+            return self.write(key, value, tags, ttl, expires_at)
+
+    def write(self, key, value, tags, ttl, expires_at):
+        """
+        Write
+        Stores an item and evicts items chosen by policy. Must be called
+        under lock.
+
+        :param key:             string, cache key
+        :param value:           data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        if expires_at:
+            ttl = times.ttl_from_expiration(expires_at)
+        if not ttl:
+            ttl = self.ttl
+
+        tags = tuple(sorted(set(tags))) if tags else ()
+        expires = time.time() + ttl
+
+        if key in self.items:
+            self.untag(key)
+            self.policy.access(key)
+        else:
+            evicted = self.policy.admit(key)
+            for evicted_key in evicted:
+                if evicted_key != key:
+                    self.drop(evicted_key, forget=False)
+            if key in evicted:
+                return False
+
+        self.items[key] = (value, tags, expires)
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+        return True
+
+    def get(self, key=None):
+        """
+        Get
+        Get single item by key.
+
+        :param key:             item key
+        :return:                value or None
+        """
+        with self.lock:
+            item = self.find(key)
+            if item is None:
+                return None
+
+            self.policy.access(key)
+            return item[0]
+
+    def find(self, key):
+        """
+        Find
+        Returns fresh item tuple (value, tags, expires) by key dropping it if
+        expired. Must be called under lock.
+
+        :param key:             item key
+        :return:                tuple or None
+        """
+        item = self.items.get(key)
+        if item is None:
+            return None
+
+        if item[2] <= time.time():
+            self.drop(key)
+            return None
+
+        return item
+
+    def delete(self, key=None, *, tags=None, disjunction=False):
+        """
+        Delete
+        Removes an item by key or several items marked with tags.
+        If disjunction is False (default) all tags must match
+        otherwise any tag can match.
+
+        :param key:             int, item key
+        :param tags:            Iterable, tags to fetch by
+        :return:                bool
+        """
+        with self.lock:
+            if key:
+                return self.drop(key)
+
+            keys = [self.get_tagged_items(tag) for tag in tags]
+            if not keys:
+                return False
+
+            if disjunction:
+                keys = set.union(*keys)
+            else:
+                keys = set.intersection(*keys)
+
+            for item_key in keys:
+                self.drop(item_key)
+
+            return bool(keys)
+
+    def drop(self, key, forget=True):
+        """
+        Drop
+        Removes item and its tags. Must be called under lock.
+
+        :param key:             item key
+        :param forget:          bool, remove key from policy as well
+        :return:                bool
+        """
+        if key not in self.items:
+            return False
+
+        self.untag(key)
+        del self.items[key]
+        if forget:
+            self.policy.remove(key)
+        return True
+
+    def untag(self, key):
+        """
+        Untag
+        Removes item from sets of its tags. Must be called under lock.
+
+        :param key:             item key
+        :return:                None
+        """
+        for tag in self.items[key][1]:
+            tagged = self.tags.get(tag)
+            if tagged is None:
+                continue
+            tagged.discard(key)
+            if not tagged:
+                del self.tags[tag]
+
+    def delete_all(self):
+        """
+        Delete all
+        Removes all cached items
+
+        :return:                bool
+        """
+        with self.lock:
+            for key in list(self.items):
+                self.drop(key)
+        return True
+
+    def get_tagged_items(self, tag):
+        """
+        Get tagged items
+        Returns a set of item keys marked with the given tag.
+
+        :param tag: string, tag
+        :return: set
+        """
+        with self.lock:
+            return set(self.tags.get(tag, ()))
+
+    def get_item_tags(self, key):
+        """
+        Get item tags
+        Returns a list of items tags by item key
+
+        :param key: string, item key
+        :return: list | None
+        """
+        with self.lock:
+            item = self.find(key)
+            if not item or not item[1]:
+                return
+            return list(item[1])
+
+    def iter_items(self, match=None, *, tag=None, batch_size=1000):
+        """
+        Iter items
+        Lazily walks items, optionally only the ones with keys matching
+        pattern or marked with a tag, and yields (key, value, ttl, tags)
+        records with ttl in milliseconds. Items are read in batches under
+        lock, so writers are not blocked for the whole walk. Items written
+        during the walk may or may not be seen.
+
+        :param match:           string, optional key pattern
+        :param tag:             string, optional tag
+        :param batch_size:      int, items per batch
+        :return:                generator of tuples
+        """
+        with self.lock:
+            if tag is not None:
+                keys = list(self.tags.get(tag, ()))
+            else:
+                keys = list(self.items)
+
+        if match:
+            keys = [key for key in keys if fnmatch.fnmatchcase(key, match)]
+
+        for start in range(0, len(keys), batch_size):
+            records = []
+            now = time.time()
+            with self.lock:
+                for key in keys[start:start + batch_size]:
+                    item = self.items.get(key)
+                    if item is None or item[2] <= now:
+                        continue
+                    ttl = max(1, int((item[2] - now) * 1000))
+                    tags = list(item[1]) or None
+                    records.append((key, item[0], ttl, tags))
+            yield from records
+
+    # -------------------------------------------------------------------------
+    # Optimizing
+    # -------------------------------------------------------------------------
+
+    def optimize(self):
+        """
+        Optimize
+        Removes expired items.
+
+        :return:                bool
+        """
+        now = time.time()
+        with self.lock:
+            expired = [k for k, item in self.items.items() if item[2] <= now]
+            for key in expired:
+                self.drop(key)
+        return True
@@ -1,6 +1,26 @@
+import base64
 import calendar
+import fnmatch
+import hashlib
+import heapq
+import json
+import math
+import threading
+import time
+import uuid
+import zlib
 from redis import StrictRedis
-from shiftmemory import exceptions, times
+from redis.client import Pipeline
+from redis.exceptions import ResponseError
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from shiftmemory import exceptions, times, stats, hooks
+from shiftmemory.adapter.local import Local
+from shiftmemory.batcher import Batcher
+from shiftmemory.profiler import Profiler, NearCache
+from shiftmemory.resilience import Guard, guarded
+from shiftmemory.sketch import BloomFilter
+from shiftmemory.writebehind import WriteBuffer
 from datetime import datetime
 
 
@@ -14,11 +34,367 @@ class Redis:
 
     The way it works is that each cached item is stored as redis hash
     consisting of data and tags. Each tag is stored as redis set consisting
-    of hash ids for tagged items.
+    of hash ids for tagged items. Optionally untagged items can be stored
+    as plain strings (string layout), which takes less memory and a single
+    command to write. Both layouts are always read transparently.
 
     It is important to notice that expired items won't be removed from
     tags automatically, that is why you can optimize your cache with optimize
     command and there is a simple garbage collection in place.
+
+    Optionally tags can be versioned. In this mode each tag has a generation
+    counter and every tagged item remembers generations of its tags at the
+    time of writing. Invalidating a tag is then a single increment of its
+    counter, and items carrying stale generations are treated as missing on
+    read and removed lazily or expire with their ttl.
+
+    Namespaces can be versioned as well. Then item keys include namespace
+    generation which is read once and refreshed periodically. Dropping all
+    items becomes an increment of namespace generation, while items of
+    previous generations expire or get swept on optimization.
+
+    Access profiling is opt-in. Sampled gets and sets are counted in
+    process to find hot keys, which are periodically flushed to a shared
+    sorted set, and values of hot keys can be kept in a near cache.
+
+    Misses can be short-circuited in process as well. Known missing keys
+    can be remembered for a short negative ttl, and a bloom filter of
+    written keys, shared by all processes as a redis bitmap and synced
+    periodically, lets reads of never written keys skip redis. Both may
+    report a miss for an item just written by another process, which is
+    safe for a cache, but never serve stale data.
+
+    To save memory on large namespaces keys can be compacted. Namespace
+    name is then replaced with a short id from a shared registry, long keys
+    and tags are replaced by their hashes and tag sets store keys without
+    namespace prefix. Items written before switching can still be read and
+    deleted in compat mode until they expire.
+
+    Tiny untagged values can be packed. Instead of a hash per item they are
+    stored as fields of bucket hashes, chosen by key hash, which redis keeps
+    in compact listpack encoding. Every field embeds its expiration time,
+    expired fields are dropped on read and on optimization.
+
+    Non-critical writes can be buffered. With write-behind enabled set()
+    only queues items in process and a background flusher writes them in
+    pipelined batches, coalescing repeated writes of the same key.
+
+    Reads can be batched as well. With batch_reads enabled concurrent
+    gets and existence checks from different threads issued within a short
+    window are served by a single pipelined request.
+
+    Optional resilience settings bound the cost of a failing server.
+    Connections get short timeouts, failed calls are retried with jittered
+    backoff and a circuit breaker opens after consecutive failures. While
+    open, calls do not touch redis at all: reads miss, writes and deletes
+    are skipped (returning false) or served by an in-process fallback.
+
+    Items can be used as atomic counters. Increments run server side and
+    expiration is only set when counter is created. There is also a
+    sliding window rate limiter kept in sorted sets of request timestamps.
+    """
+
+    # registry of short namespace ids used with compact keys
+    namespace_registry_key = 'shiftmemory::__namespaces'
+    namespace_counter_key = 'shiftmemory::__namespace_ids'
+
+    # returns item data regardless of layout (string or hash)
+    get_any_script = """
+        local kind = redis.call('TYPE', KEYS[1])['ok']
+        if kind == 'string' then return redis.call('GET', KEYS[1]) end
+        if kind ~= 'hash' then return false end
+        return redis.call('HGET', KEYS[1], 'data')
+    """
+
+    # validates item tag generations and returns data in one round trip
+    get_versioned_script = """
+        local kind = redis.call('TYPE', KEYS[1])['ok']
+        if kind == 'string' then return redis.call('GET', KEYS[1]) end
+        if kind ~= 'hash' then return false end
+
+        local item = redis.call('HMGET', KEYS[1], 'data', 'tags', 'versions')
+        if not item[1] then return false end
+        if not item[2] or not item[3] then return item[1] end
+
+        local versions = {}
+        for version in string.gmatch(item[3], '[^,]+') do
+            table.insert(versions, version)
+        end
+
+        local i = 1
+        for tag in string.gmatch(item[2], '[^,]+') do
+            local current = redis.call('GET', ARGV[1] .. tag) or '0'
+            if current ~= versions[i] then
+                redis.call('DEL', KEYS[1])
+                return false
+            end
+            i = i + 1
+        end
+
+        return item[1]
+    """
+
+    # reads packed item from bucket falling back to item hash
+    get_packed_script = """
+        local packed = redis.call('HGET', KEYS[1], ARGV[1])
+        if packed then
+            local sep = string.find(packed, '|', 1, true)
+            local expires = tonumber(string.sub(packed, 1, sep - 1))
+            if expires > tonumber(ARGV[2]) then
+                return string.sub(packed, sep + 1)
+            end
+            redis.call('HDEL', KEYS[1], ARGV[1])
+        end
+
+        if not KEYS[2] then return false end
+        local kind = redis.call('TYPE', KEYS[2])['ok']
+        if kind == 'string' then return redis.call('GET', KEYS[2]) end
+        if kind ~= 'hash' then return false end
+        return redis.call('HGET', KEYS[2], 'data')
+    """
+
+    # writes packed item, drops item hash and extends bucket ttl
+    set_packed_script = """
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+        redis.call('DEL', KEYS[2])
+        local ttl = tonumber(ARGV[3])
+        if redis.call('TTL', KEYS[1]) < ttl then
+            redis.call('EXPIRE', KEYS[1], ttl)
+        end
+        return 1
+    """
+
+    # writes item in any layout with tags and expiration, optionally only
+    # if no fresh item exists (stale generations count as missing). Returns
+    # 0 if skipped, otherwise 1 or tags the rewritten item no longer has
+    write_script = """
+        local key, bucket = KEYS[1], KEYS[2]
+        local value, ttl, now = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+        local field, mode, tags, prefix = ARGV[4], ARGV[5], ARGV[6], ARGV[7]
+        local only_new = ARGV[10] == '1'
+
+        if bucket ~= '' then
+            local packed = redis.call('HGET', bucket, field)
+            if packed then
+                local sep = string.find(packed, '|', 1, true)
+                local expires = tonumber(string.sub(packed, 1, sep - 1))
+                if only_new and expires > now then return 0 end
+                redis.call('HDEL', bucket, field)
+            end
+        end
+
+        local kind = redis.call('TYPE', key)['ok']
+        if only_new and kind == 'string' then return 0 end
+        if only_new and kind == 'hash' then
+            local item = redis.call('HMGET', key, 'data', 'tags', 'versions')
+            local fresh = item[1] ~= false
+            if fresh and prefix ~= '' and item[2] and item[3] then
+                local versions = {}
+                for version in string.gmatch(item[3], '[^,]+') do
+                    table.insert(versions, version)
+                end
+                local i = 1
+                for tag in string.gmatch(item[2], '[^,]+') do
+                    local current = redis.call('GET', prefix .. tag) or '0'
+                    if current ~= versions[i] then fresh = false end
+                    i = i + 1
+                end
+            end
+            if fresh then return 0 end
+        end
+
+        local result = 1
+        if kind == 'hash' then
+            local old = redis.call('HGET', key, 'tags')
+            if old then
+                local new, stale = {}, {}
+                for tag in string.gmatch(tags, '[^,]+') do new[tag] = true end
+                for tag in string.gmatch(old, '[^,]+') do
+                    if not new[tag] then table.insert(stale, tag) end
+                end
+                if #stale > 0 then result = table.concat(stale, ',') end
+            end
+        end
+        if kind ~= 'none' then redis.call('DEL', key) end
+
+        if mode == 'packed' then
+            redis.call('HSET', bucket, field, ARGV[8])
+            local seconds = math.ceil(ttl / 1000)
+            if redis.call('TTL', bucket) < seconds then
+                redis.call('EXPIRE', bucket, seconds)
+            end
+            return result
+        end
+
+        if mode == 'string' then
+            redis.call('SET', key, value, 'PX', ttl)
+            return result
+        end
+
+        redis.call('HSET', key, 'data', value)
+        if tags ~= '' then
+            redis.call('HSET', key, 'tags', tags)
+            if prefix ~= '' and ARGV[11] ~= '' then
+                redis.call('HSET', key, 'versions', ARGV[11])
+            elseif prefix ~= '' then
+                local current = {}
+                for tag in string.gmatch(tags, '[^,]+') do
+                    local version = redis.call('GET', prefix .. tag) or '0'
+                    table.insert(current, version)
+                end
+                local versions = table.concat(current, ',')
+                redis.call('HSET', key, 'versions', versions)
+            end
+        end
+        redis.call('PEXPIRE', key, ttl)
+        for i = 3, #KEYS do
+            redis.call('SADD', KEYS[i], ARGV[9])
+        end
+        return result
+    """
+
+    # increments counter setting expiration on create, takes over packed value
+    incr_script = """
+        local key, bucket = KEYS[1], KEYS[2]
+        local amount, ttl = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local layout, field, now = ARGV[3], ARGV[4], tonumber(ARGV[5])
+
+        if bucket ~= '' then
+            local packed = redis.call('HGET', bucket, field)
+            if packed then
+                redis.call('HDEL', bucket, field)
+                local sep = string.find(packed, '|', 1, true)
+                local expires = tonumber(string.sub(packed, 1, sep - 1))
+                if expires > now then
+                    redis.call('DEL', key)
+                    redis.call('SET', key, string.sub(packed, sep + 1))
+                    ttl = math.ceil((expires - now) * 1000)
+                end
+            end
+        end
+
+        local kind = redis.call('TYPE', key)['ok']
+        if kind == 'string' then
+            local value = redis.call('INCRBY', key, amount)
+            if redis.call('PTTL', key) < 0 then
+                redis.call('PEXPIRE', key, ttl)
+            end
+            return value
+        end
+        if kind == 'hash' then
+            return redis.call('HINCRBY', key, 'data', amount)
+        end
+
+        local value
+        if layout == 'string' then
+            value = redis.call('INCRBY', key, amount)
+        else
+            value = redis.call('HINCRBY', key, 'data', amount)
+        end
+        redis.call('PEXPIRE', key, ttl)
+        return value
+    """
+
+    # sliding window rate limiter over a sorted set of request timestamps
+    rate_limit_script = """
+        local key, limit = KEYS[1], tonumber(ARGV[1])
+        local window, now = tonumber(ARGV[2]), tonumber(ARGV[3])
+
+        redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+        local count = redis.call('ZCARD', key)
+        if count < limit then
+            redis.call('ZADD', key, now, ARGV[4])
+            redis.call('PEXPIRE', key, math.ceil(window * 1000))
+            return {1, limit - count - 1, '0'}
+        end
+
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local retry = tonumber(oldest[2]) + window - now
+        return {0, 0, tostring(retry)}
+    """
+
+    # reads items marked with all (inter) or any (union) of the tags,
+    # items invalidated by tag generations are skipped
+    get_by_tags_script = """
+        local unpack = unpack or table.unpack
+        local members
+        if ARGV[1] == 'union' then
+            members = redis.call('SUNION', unpack(KEYS))
+        else
+            members = redis.call('SINTER', unpack(KEYS))
+        end
+
+        local limit, prefix = tonumber(ARGV[2]), ARGV[3]
+        local result = {}
+        for _, member in ipairs(members) do
+            if limit > 0 and #result >= limit * 2 then break end
+            local key = prefix .. member
+            local kind = redis.call('TYPE', key)['ok']
+            local data = false
+            if kind == 'string' then
+                data = redis.call('GET', key)
+            elseif kind == 'hash' then
+                local item = redis.call(
+                    'HMGET', key, 'data', 'tags', 'versions'
+                )
+                data = item[1]
+                if data and item[2] and item[3] and ARGV[4] ~= '' then
+                    local versions = {}
+                    for version in string.gmatch(item[3], '[^,]+') do
+                        table.insert(versions, version)
+                    end
+                    local i = 1
+                    for tag in string.gmatch(item[2], '[^,]+') do
+                        local current = redis.call('GET', ARGV[4] .. tag)
+                        if (current or '0') ~= versions[i] then
+                            data = false
+                        end
+                        i = i + 1
+                    end
+                end
+            end
+            if data then
+                table.insert(result, key)
+                table.insert(result, data)
+            end
+        end
+        return result
+    """
+
+    # reads data, tags and remaining ttl of several items for a snapshot,
+    # items invalidated by tag generations are read as missing
+    export_script = """
+        local result = {}
+        for _, key in ipairs(KEYS) do
+            local kind = redis.call('TYPE', key)['ok']
+            local data, tags = false, false
+            if kind == 'string' then
+                data = redis.call('GET', key)
+            elseif kind == 'hash' then
+                local item = redis.call(
+                    'HMGET', key, 'data', 'tags', 'versions'
+                )
+                data, tags = item[1], item[2]
+                if data and tags and item[3] and ARGV[1] ~= '' then
+                    local versions = {}
+                    for version in string.gmatch(item[3], '[^,]+') do
+                        table.insert(versions, version)
+                    end
+                    local i = 1
+                    for tag in string.gmatch(tags, '[^,]+') do
+                        local current = redis.call('GET', ARGV[1] .. tag)
+                        if (current or '0') ~= versions[i] then
+                            data = false
+                        end
+                        i = i + 1
+                    end
+                end
+            end
+            table.insert(result, data)
+            table.insert(result, tags)
+            table.insert(result, redis.call('PTTL', key))
+        end
+        return result
     """
 
     def __init__(
@@ -27,6 +403,19 @@ class Redis:
         ttl=60,
         namespace_separator=None,
         optimize_after='+2 days',
+        tag_versioning=False,
+        namespace_versioning=False,
+        namespace_refresh=1,
+        profile=None,
+        negative_ttl=None,
+        negative_size=10000,
+        bloom=None,
+        compact_keys=None,
+        packed=None,
+        layout='hash',
+        write_behind=None,
+        batch_reads=None,
+        resilience=None,
         **config
     ):
         """
@@ -38,22 +427,88 @@ class Redis:
         :param ttl:                 default ttl for all items (default=60)
         :param namespace_separator: string
         :param optimize_after:      collect garbage after period (None=off)
+        :param tag_versioning:      invalidate tags with generation counters
+        :param namespace_versioning: drop namespace with generation counter
+        :param namespace_refresh:   seconds to cache namespace generation
+        :param profile:             dict, access profiler options (None=off)
+        :param negative_ttl:        seconds to remember misses (None=off)
+        :param negative_size:       maximum number of misses to remember
+        :param bloom:               dict, bloom filter options (None=off)
+        :param compact_keys:        dict, compact keys options (None=off)
+        :param packed:              dict, packing options (None=off)
+        :param layout:              untagged items layout, hash or string
+        :param write_behind:        dict, write buffer options (None=off)
+        :param batch_reads:         dict, read batching options (None=off)
+        :param resilience:          dict, resilience options (None=off)
         :param config:              connection config (falls back to redis defaults)
         :return:                    None
         """
         self.redis = None
+        self.raw_redis = None
         self.config = None
 
         self.ttl = ttl
         self.namespace = namespace
+        self.tag_versioning = tag_versioning
+        self.scripts = dict()
+        self.guard = None
+
+        if layout not in ('hash', 'string'):
+            error = 'Unknown layout [{}], use hash or string'.format(layout)
+            raise exceptions.ConfigurationException(error)
+        self.layout = layout
 
         self.namespace_separator = '::'
         if namespace_separator:
             self.namespace_separator = namespace_separator
 
-        # key prefixes for items and tags
-        self.item_prefix = self.namespace + self.namespace_separator
-        self.tag_prefix = self.item_prefix + 'tags' + self.namespace_separator
+        # namespace generation
+        self.namespace_versioning = namespace_versioning
+        self.namespace_refresh = namespace_refresh
+        self.namespace_generation = None
+        self.namespace_checked_at = None
+        self.namespace_prefix = self.namespace + self.namespace_separator
+        self.namespace_generation_key = self.namespace_prefix + '__generation'
+
+        # key prefixes
+        self.item_prefix = None
+        self.tag_prefix = None
+        self.bucket_prefix = None
+        self.service_prefix = None
+        self.tag_version_prefix = None
+        self.rate_limit_prefix = None
+        self.update_prefixes()
+
+        # telemetry syncs running in background
+        self.background = dict()
+        self.background_lock = threading.Lock()
+
+        # access profiling
+        self.profiler = None
+        self.near_cache = None
+        self.profile_config = None
+        self.profile_flushed = dict()
+        self.profile_flushed_at = time.monotonic()
+        self.hot_keys_prefix = self.namespace_prefix + '__hotkeys'
+        self.hot_keys_prefix += self.namespace_separator
+        self.slow_log_key = self.namespace_prefix + '__slowlog'
+        self.slow_log_retention = 604800
+        if profile:
+            self.configure_profiler(profile)
+
+        # miss short-circuiting
+        self.negative_cache = None
+        if negative_ttl:
+            self.negative_cache = NearCache(negative_size, negative_ttl)
+
+        self.bloom = None
+        self.bloom_config = None
+        self.bloom_pending = []
+        self.bloom_ready = False
+        self.bloom_synced_at = None
+        self.bloom_lock = threading.Lock()
+        if bloom:
+            self.configure_bloom(bloom)
 
         # get connection config
         connection_config = config
@@ -62,6 +517,35 @@ class Redis:
 
         # init redis connection
         self.configure(connection_config)
+        if resilience:
+            self.configure_resilience(resilience)
+
+        # packing tiny values
+        self.packed_config = None
+        if packed:
+            self.packed_config = dict(buckets=4096, max_size=48)
+            if isinstance(packed, dict):
+                self.packed_config.update(packed)
+
+        # compact keys
+        self.compact_config = None
+        self.legacy = None
+        if compact_keys:
+            self.configure_compact_keys(compact_keys)
+
+        # write-behind
+        self.write_buffer = None
+        if write_behind:
+            options = write_behind if isinstance(write_behind, dict) else {}
+            self.write_buffer = WriteBuffer(self.write_batch, **options)
+
+        # read batching
+        self.get_batcher = None
+        self.exists_batcher = None
+        if batch_reads:
+            options = batch_reads if isinstance(batch_reads, dict) else {}
+            self.get_batcher = Batcher(self.fetch_many, **options)
+            self.exists_batcher = Batcher(self.check_many, **options)
 
         # collect garbage if it's time
         if optimize_after:
@@ -90,6 +574,189 @@ class Redis:
         if 'unix_socket_path' in self.config:
             del self.config['host'], self.config['port']
 
+    def configure_resilience(self, resilience):
+        """
+        Configure resilience
+        Enables timeouts, retries and circuit breaker. Accepts true for
+        defaults or a dictionary of options: timeout and connect_timeout
+        (seconds, unless set in connection config), retries, backoff,
+        max_backoff (seconds), failure_threshold, reset_timeout (see
+        Guard) and fallback, which is true or local adapter config for an
+        in-process cache serving calls while redis is failing.
+
+        :param resilience:      bool or dict, resilience options
+        :return:                None
+        """
+        config = dict(
+            timeout=0.1,
+            connect_timeout=0.1,
+            retries=1,
+            backoff=0.005,
+            max_backoff=0.05,
+            failure_threshold=5,
+            reset_timeout=5,
+            fallback=None,
+        )
+        if isinstance(resilience, dict):
+            config.update(resilience)
+
+        self.config.setdefault('socket_timeout', config['timeout'])
+        connect_timeout = config['connect_timeout']
+        self.config.setdefault('socket_connect_timeout', connect_timeout)
+
+        fallback = None
+        if config['fallback']:
+            options = config['fallback']
+            options = options if isinstance(options, dict) else dict()
+            fallback = Local(self.namespace, self.ttl, **options)
+
+        self.guard = Guard(
+            (RedisConnectionError, RedisTimeoutError),
+            retries=config['retries'],
+            backoff=config['backoff'],
+            max_backoff=config['max_backoff'],
+            failure_threshold=config['failure_threshold'],
+            reset_timeout=config['reset_timeout'],
+            fallback=fallback
+        )
+
+    def resilience_stats(self):
+        """
+        Resilience stats
+        Returns circuit breaker state and counters (see Guard.stats()) or
+        None if resilience is off.
+
+        :return:                dict or None
+        """
+        if not self.guard:
+            return None
+        return self.guard.stats()
+
+    def configure_profiler(self, profile):
+        """
+        Configure profiler
+        Enables sampling access profiler. Accepts true for defaults or a
+        dictionary of options: sample_rate, top, width, depth (see Profiler),
+        flush_interval (seconds between flushes to redis), keep (hot keys
+        to keep in redis), retention (seconds to keep them) and near_cache
+        with near_ttl to serve hot keys from process memory.
+
+        :param profile:         bool or dict, profiler options
+        :return:                None
+        """
+        config = dict(
+            sample_rate=0.01,
+            top=20,
+            width=2048,
+            depth=4,
+            flush_interval=10,
+            keep=1000,
+            retention=86400,
+            near_cache=False,
+            near_ttl=1,
+        )
+        if isinstance(profile, dict):
+            config.update(profile)
+
+        self.profile_config = config
+        self.profiler = Profiler(
+            sample_rate=config['sample_rate'],
+            top=config['top'],
+            width=config['width'],
+            depth=config['depth'],
+        )
+        if config['near_cache']:
+            self.near_cache = NearCache(config['top'], config['near_ttl'])
+
+    def configure_bloom(self, bloom):
+        """
+        Configure bloom
+        Enables bloom filter of written keys. Accepts true for defaults or
+        a dictionary of options: size (bits), hashes and sync_interval
+        (seconds between syncs with redis).
+
+        :param bloom:           bool or dict, bloom filter options
+        :return:                None
+        """
+        config = dict(size=2 ** 22, hashes=5, sync_interval=5)
+        if isinstance(bloom, dict):
+            config.update(bloom)
+
+        self.bloom_config = config
+        self.bloom = BloomFilter(config['size'], config['hashes'])
+
+    def configure_compact_keys(self, compact_keys):
+        """
+        Configure compact keys
+        Switches to compact keys. Accepts true for defaults or a dictionary
+        of options: threshold (keys and tags longer than that get hashed)
+        and compat (also read and delete items stored with full keys,
+        while migrating).
+
+        :param compact_keys:    bool or dict, compact keys options
+        :return:                None
+        """
+        config = dict(threshold=32, compat=False)
+        if isinstance(compact_keys, dict):
+            config.update(compact_keys)
+        self.compact_config = config
+
+        if config['compat']:
+            self.legacy = Redis(
+                self.namespace,
+                self.ttl,
+                namespace_separator=self.namespace_separator,
+                optimize_after=None,
+                tag_versioning=self.tag_versioning,
+                namespace_versioning=self.namespace_versioning,
+                namespace_refresh=self.namespace_refresh,
+                config=self.config
+            )
+            self.legacy.redis = self.get_redis()
+
+        sep = self.namespace_separator
+        self.namespace_prefix = '@' + self.get_namespace_id() + sep
+        self.namespace_generation_key = self.namespace_prefix + '__generation'
+        self.hot_keys_prefix = self.namespace_prefix + '__hotkeys' + sep
+        self.slow_log_key = self.namespace_prefix + '__slowlog'
+        self.update_prefixes()
+
+    def get_namespace_id(self):
+        """
+        Get namespace id
+        Returns short id of current namespace from shared registry,
+        registering namespace if necessary.
+
+        :return:                string, base 36 id
+        """
+        redis = self.get_redis()
+        registry = self.namespace_registry_key
+        namespace_id = redis.hget(registry, self.namespace)
+        if namespace_id is None:
+            counter = redis.incr(self.namespace_counter_key)
+            redis.hsetnx(registry, self.namespace, to_base36(counter))
+            namespace_id = redis.hget(registry, self.namespace)
+
+        return namespace_id
+
+    def compact(self, key):
+        """
+        Compact
+        Returns key or tag as is, or its hash if it is longer than
+        threshold with compact keys enabled. Hashes are 22 characters of
+        url-safe base64 of 128-bit digest prefixed with ~.
+
+        :param key:             string, key or tag
+        :return:                string
+        """
+        if not self.compact_config:
+            return key
+        if len(key) <= self.compact_config['threshold']:
+            return key
+
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        return '~' + base64.urlsafe_b64encode(digest).decode()[:22]
+
     def get_redis(self):
         """
         Get redis
@@ -99,14 +766,96 @@ class Redis:
         :return:                redis.client.StrictRedis
         """
         if not self.redis:
-            self.redis = StrictRedis(**self.config)
+            self.redis = InstrumentedRedis(**self.config)
 
         return self.redis
 
+    def get_raw_redis(self):
+        """
+        Get raw redis
+        Returns a separate connection that does not decode responses to be
+        used for binary data.
+
+        :return:                redis.client.StrictRedis
+        """
+        if not self.raw_redis:
+            config = dict(self.config, decode_responses=False)
+            self.raw_redis = InstrumentedRedis(**config)
+
+        return self.raw_redis
+
+    def get_script(self, name):
+        """
+        Get script
+        Registers lua script by name with current connection and preserves
+        it for future use. Registered scripts are executed with EVALSHA and
+        loaded transparently on first call.
+
+        :param name:            string, script name
+        :return:                redis.client.Script
+        """
+        if name not in self.scripts:
+            source = getattr(self, name + '_script')
+            self.scripts[name] = self.get_redis().register_script(source)
+
+        return self.scripts[name]
+
     # -------------------------------------------------------------------------
     # Keys
     # -------------------------------------------------------------------------
 
+    def update_prefixes(self, generation=None):
+        """
+        Update prefixes
+        Builds key prefixes for items, tags and service keys. If namespace
+        generation is given it will be included into every prefix.
+
+        :param generation:      int or string, namespace generation
+        :return:                None
+        """
+        sep = self.namespace_separator
+        if generation is not None:
+            self.namespace_generation = str(generation)
+
+        self.item_prefix = self.namespace_prefix
+        if self.namespace_generation is not None:
+            self.item_prefix += self.namespace_generation + sep
+
+        self.tag_prefix = self.item_prefix + 'tags' + sep
+        self.bucket_prefix = self.item_prefix + 'buckets' + sep
+
+        # service keys (gc timestamp, tag generations etc.)
+        self.service_prefix = self.item_prefix + '__'
+        self.tag_version_prefix = self.service_prefix + 'tagversions' + sep
+        self.rate_limit_prefix = self.service_prefix + 'ratelimits' + sep
+
+    def check_namespace_generation(self, force=False):
+        """
+        Check namespace generation
+        With namespace versioning enabled reads current namespace generation
+        from redis, unless it was checked recently, and updates key prefixes
+        if it changed.
+
+        :param force:           bool, ignore refresh interval
+        :return:                string, generation or None
+        """
+        if not self.namespace_versioning:
+            return
+
+        now = time.monotonic()
+        checked_at = self.namespace_checked_at
+        refresh = self.namespace_refresh
+        if not force and checked_at and now - checked_at < refresh:
+            return self.namespace_generation
+
+        key = self.namespace_generation_key
+        generation = self.get_redis().get(key) or '0'
+        self.namespace_checked_at = now
+        if generation != self.namespace_generation:
+            self.update_prefixes(generation)
+
+        return self.namespace_generation
+
     def get_full_item_key(self, key):
         """
         Get full item keys
@@ -116,10 +865,11 @@ class Redis:
         :param key:             string key
         :return:                string normalized key
         """
+        self.check_namespace_generation()
         if self.is_full_item_key(key):
             return key
 
-        key = self.item_prefix + key
+        key = self.item_prefix + self.compact(key)
         return key
 
     def is_full_item_key(self, key):
@@ -141,10 +891,75 @@ class Redis:
         :param key:             string, tag
         :return:                string, tag set key
         """
+        self.check_namespace_generation()
         if tag.startswith(self.tag_prefix):
             return tag
 
-        return self.tag_prefix + tag
+        return self.tag_prefix + self.compact(tag)
+
+    def get_tag_version_key(self, tag):
+        """
+        Get tag version key
+        Returns key of a counter used to store current tag generation
+
+        :param tag:             string, tag
+        :return:                string, tag version key
+        """
+        self.check_namespace_generation()
+        if tag.startswith(self.tag_version_prefix):
+            return tag
+
+        # not compacted, versioned get script builds these from tag names
+        return self.tag_version_prefix + tag
+
+    def is_legacy_key(self, key):
+        """
+        Is legacy key?
+        Checks if item may also be stored under full key from before
+        switching to compact keys, which is the case in compat mode for
+        all keys that are not full item keys already.
+
+        :param key:             string, key to check
+        :return:                bool
+        """
+        return self.legacy is not None and not self.is_full_item_key(key)
+
+    def get_tag_member(self, item_key):
+        """
+        Get tag member
+        Returns value to store in tag sets for full item key. With compact
+        keys namespace prefix is dropped.
+
+        :param item_key:        string, full item key
+        :return:                string
+        """
+        if self.compact_config and item_key.startswith(self.item_prefix):
+            return item_key[len(self.item_prefix):]
+        return item_key
+
+    def get_member_item_key(self, member):
+        """
+        Get member item key
+        Returns full item key for a tag set member.
+
+        :param member:          string, tag set member
+        :return:                string
+        """
+        if self.compact_config:
+            return self.item_prefix + member
+        return member
+
+    def is_service_key(self, key):
+        """
+        Is service key?
+        Checks if provided key is used internally by adapter for bookkeeping,
+        like garbage collection timestamp or tag generations, rather than
+        holding cached data.
+
+        :param key:             string, full key to check
+        :return:                bool
+        """
+        return key.startswith(self.service_prefix)
 
     # -------------------------------------------------------------------------
     # Caching
@@ -166,6 +981,7 @@ class Redis:
 
         return True
 
+    @guarded(False)
     def exists(self, key):
         """
         Item exists?
@@ -174,10 +990,28 @@ class Redis:
         :param key:             string, item key
         :return:                bool
         """
+        original = key
+        if self.tag_versioning or self.packed_config:
+            return self.get(key) is not None
+
         key = self.get_full_item_key(key)
-        result = self.get_redis().exists(key)
+        if self.write_buffer and self.write_buffer.get(key) is not None:
+            return True
+
+        if self.is_known_missing(key):
+            return False
+
+        if self.exists_batcher:
+            result = self.exists_batcher.load(key)
+        else:
+            result = self.get_redis().exists(key)
+        if not result and self.is_legacy_key(original):
+            result = self.legacy.exists(original)
+        if not result:
+            self.remember_missing(key)
         return result
 
+    @guarded(False)
     def set(self, key, value, *, tags=None, ttl=None, expires_at=None):
         """
         Set item
@@ -194,30 +1028,42 @@ class Redis:
         :param expires_at:      optional expiration date (utc)
         :return:                bool
         """
-        redis = self.get_redis()
-
-        # data
-        key = self.get_full_item_key(key)
-        redis.hset(key, 'data', value)
+        # capture tag generations before writing data
+        versions = None
+        if tags and self.tag_versioning:
+            tags = list(tags)
+            versions = self.get_tag_versions(tags)
 
         # expire
         if expires_at:
             ttl = times.ttl_from_expiration(expires_at)
         if not ttl:
             ttl = self.ttl
-        redis.expire(key, ttl)
-
-        # tag
-        if tags:
-            self.set_tags(key, list(tags))
 
+        # data
+        key = self.get_full_item_key(key)
+        self.before_write(key)
+        if self.write_buffer and not self.is_service_key(key):
+            item = (key, value, list(tags or []), ttl, versions)
+            return self.write_buffer.put(key, item)
+
+        if self.is_packable(key, value, tags):
+            return self.set_packed(key, value, ttl)
+        if self.packed_config:
+            self.unpack(key)
+
+        # replace item with its tags and expiration in one script call
+        self.write_batch([(key, value, list(tags or []), ttl, versions)])
         return True
 
+    @guarded(False)
     def add(self, key, value, *, tags=None, ttl=None, expires_at=None):
         """
         Add
         Similar to set item but only saves an item if it does not exist yet.
-        Will return false in case in does.
+        Will return false in case in does. Check and write (including tags
+        and expiration) are done atomically by a script in a single round
+        trip, so of several concurrent adds exactly one succeeds.
 
         :param key:             string, cache key
         :param value:           string, data to put
@@ -226,10 +1072,220 @@ class Redis:
         :param expires_at:      optional expiration date (utc)
         :return:                bool
         """
-        if self.exists(key):
-            return False
-        return self.set(key, value, tags=tags, ttl=ttl, expires_at=expires_at)
+        added = self.add_many(
+            {key: value},
+            tags=tags,
+            ttl=ttl,
+            expires_at=expires_at
+        )
+        return key in added
+
+    @guarded(lambda *args, **kwargs: [])
+    def add_many(self, items, *, tags=None, ttl=None, expires_at=None):
+        """
+        Add many
+        Adds several items that do not exist yet in one round trip. Each
+        item is added atomically as with add(). Tags and expiration apply
+        to all items. Returns keys of items that were actually added.
+
+        :param items:           dict, data to put by cache key
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                list
+        """
+        if expires_at:
+            ttl = times.ttl_from_expiration(expires_at)
+        if not ttl:
+            ttl = self.ttl
+
+        if self.write_buffer:
+            self.write_buffer.flush()
+
+        tags = list(tags) if tags else []
+        keys = list(items)
+        now = time.time()
+        pipe = self.get_redis().pipeline(transaction=False)
+        for key in keys:
+            full_key = self.get_full_item_key(key)
+            self.before_write(full_key)
+            self.queue_write(pipe, full_key, items[key], tags, ttl, now, True)
+
+        results = pipe.execute()
+        full_keys = [self.get_full_item_key(key) for key in keys]
+        self.drop_stale_tags(zip(full_keys, results))
+        return [key for key, added in zip(keys, results) if added]
+
+    @guarded(False)
+    def set_many(self, items, *, tags=None, ttl=None, expires_at=None):
+        """
+        Set many
+        Creates or updates several items in one round trip. Tags and
+        expiration apply to all items.
+
+        :param items:           dict, data to put by cache key
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        if expires_at:
+            ttl = times.ttl_from_expiration(expires_at)
+        if not ttl:
+            ttl = self.ttl
+
+        tags = list(tags) if tags else []
+        versions = None
+        if tags and self.tag_versioning:
+            versions = self.get_tag_versions(tags)
+
+        batch = []
+        for key, value in items.items():
+            full_key = self.get_full_item_key(key)
+            self.before_write(full_key)
+            batch.append((full_key, value, tags, ttl, versions))
+
+        if self.write_buffer:
+            for item in batch:
+                self.write_buffer.put(item[0], item)
+            return True
+
+        self.write_batch(batch)
+        return True
+
+    def before_write(self, key):
+        """
+        Before write
+        Profiles write and updates in-process state (near cache, negative
+        cache, bloom filter) for the item about to be written.
+
+        :param key:             string, full item key
+        :return:                None
+        """
+        self.profile('set', key)
+        if self.near_cache:
+            self.near_cache.delete(key)
+        self.remember_written(key)
+
+    def queue_write(
+        self,
+        pipe,
+        key,
+        value,
+        tags,
+        ttl,
+        now,
+        only_new=False,
+        versions=None
+    ):
+        """
+        Queue write
+        Queues single script call writing an item in layout chosen for it
+        (packed, string or hash) together with tags and expiration. Tag
+        generations are read when item is written unless given.
+
+        :param pipe:            redis pipeline
+        :param key:             string, full item key
+        :param value:           string, data to put
+        :param tags:            list, tags
+        :param ttl:             int, ttl in seconds
+        :param now:             float, current timestamp
+        :param only_new:        bool, skip if fresh item exists
+        :param versions:        list, optional tag generations
+        :return:                None
+        """
+        bucket = field = packed = ''
+        if self.packed_config:
+            bucket, field = self.get_bucket(key)
+
+        mode = 'hash'
+        if self.is_packable(key, value, tags):
+            mode = 'packed'
+            packed = '{:.3f}|{}'.format(now + ttl, value)
+        elif self.layout == 'string' and not tags:
+            mode = 'string'
+
+        self.get_script('write')(
+            keys=[key, bucket] + [self.get_tag_set_key(tag) for tag in tags],
+            args=[
+                value,
+                math.ceil(ttl * 1000),
+                now,
+                field,
+                mode,
+                ','.join(tags),
+                self.tag_version_prefix if self.tag_versioning else '',
+                packed,
+                self.get_tag_member(key),
+                1 if only_new else 0,
+                ','.join(versions or [])
+            ],
+            client=pipe
+        )
+
+    def write_batch(self, batch):
+        """
+        Write batch
+        Writes a batch of items in one round trip.
+
+        :param batch:           list of (key, value, tags, ttl, versions)
+        :return:                None
+        """
+        if not batch:
+            return
+
+        now = time.time()
+        pipe = self.get_redis().pipeline(transaction=False)
+        for key, value, tags, ttl, versions in batch:
+            self.queue_write(pipe, key, value, tags, ttl, now, False, versions)
+        results = pipe.execute()
+        self.drop_stale_tags(zip([item[0] for item in batch], results))
+
+    def drop_stale_tags(self, writes):
+        """
+        Drop stale tags
+        Removes rewritten items from sets of tags they no longer have, as
+        returned by write script. Costs a round trip only if there are any.
+
+        :param writes:          iterable of (full item key, script result)
+        :return:                None
+        """
+        pipe = None
+        for key, result in writes:
+            if not isinstance(result, str):
+                continue
+            if pipe is None:
+                pipe = self.get_redis().pipeline(transaction=False)
+            member = self.get_tag_member(key)
+            for tag in result.split(','):
+                pipe.srem(self.get_tag_set_key(tag), member)
+
+        if pipe is not None:
+            pipe.execute()
+
+    def flush_writes(self):
+        """
+        Flush writes
+        Writes all items pending in write-behind buffer.
+
+        :return:                None
+        """
+        if self.write_buffer:
+            self.write_buffer.flush()
+
+    def write_behind_stats(self):
+        """
+        Write-behind stats
+        Returns write-behind buffer metrics (see WriteBuffer.stats()) or
+        None if write-behind is off.
 
+        :return:                dict or None
+        """
+        if not self.write_buffer:
+            return None
+        return self.write_buffer.stats()
+
+    @guarded(None)
     def get(self, key=None):
         """
         Get
@@ -238,9 +1294,163 @@ class Redis:
         :param key:             item key
         :return:                string or None
         """
+        original = key
         key = self.get_full_item_key(key)
-        return self.get_redis().hget(key, 'data')
+        hot = self.profile('get', key)
+        if self.write_buffer:
+            pending = self.write_buffer.get(key)
+            if pending is not None:
+                return pending[1]
+
+        if hot and self.near_cache:
+            value = self.near_cache.get(key)
+            if value is not None:
+                return value
+
+        if self.is_known_missing(key):
+            return None
+
+        if self.get_batcher:
+            value = self.get_batcher.load(key)
+        else:
+            value = self.fetch(key)
+        if value is None and self.is_legacy_key(original):
+            value = self.legacy.get(original)
+        if value is None:
+            self.remember_missing(key)
+        elif hot and self.near_cache:
+            self.near_cache.set(key, value)
+
+        return value
+
+    def fetch(self, key, client=None):
+        """
+        Fetch
+        Reads item data from redis by full key bypassing near cache. When
+        pipeline is given as client the read is only queued, except for
+        packed items with tag versioning that need two steps.
+
+        :param key:             string, full item key
+        :param client:          optional pipeline to queue the read in
+        :return:                string or None
+        """
+        if self.packed_config:
+            bucket, field = self.get_bucket(key)
+            keys = [bucket] if self.tag_versioning else [bucket, key]
+            script = self.get_script('get_packed')
+            value = script(keys=keys, args=[field, time.time()], client=client)
+            if client or value is not None or not self.tag_versioning:
+                return value
+
+        if self.tag_versioning:
+            script = self.get_script('get_versioned')
+            args = [self.tag_version_prefix]
+            return script(keys=[key], args=args, client=client)
+
+        if client or self.layout == 'string':
+            return self.get_script('get_any')(keys=[key], client=client)
+
+        try:
+            return self.get_redis().hget(key, 'data')
+        except ResponseError:
+            return self.get_script('get_any')(keys=[key])
+
+    @guarded(lambda keys: dict.fromkeys(keys))
+    def get_many(self, keys):
+        """
+        Get many
+        Gets several items in one or two round trips, see fetch_many().
+        Near cache and profiler are bypassed.
+
+        :param keys:            iterable of item keys
+        :return:                dict, values by key (None if missing)
+        """
+        keys = list(keys)
+        full_keys = [self.get_full_item_key(key) for key in keys]
+        values = dict()
+        if self.write_buffer:
+            for key in full_keys:
+                item = self.write_buffer.get(key)
+                if item is not None:
+                    values[key] = item[1]
+
+        pending = [
+            key for key in full_keys
+            if key not in values and not self.is_known_missing(key)
+        ]
+        if pending:
+            values.update(self.fetch_many(pending))
+
+        result = dict()
+        for key, full_key in zip(keys, full_keys):
+            value = values.get(full_key)
+            if value is None and self.is_legacy_key(key):
+                value = self.legacy.get(key)
+            if value is None:
+                self.remember_missing(full_key)
+            result[key] = value
+
+        return result
+
+    def fetch_many(self, keys):
+        """
+        Fetch many
+        Reads items from redis by full keys. With string layout items are
+        read with MGET and only items not found (tagged or missing) are
+        fetched in a pipeline afterwards.
+
+        :param keys:            list of full item keys
+        :return:                dict, values by key (None if missing)
+        """
+        values = dict.fromkeys(keys)
+        pending = list(values)
+        redis = self.get_redis()
+
+        simple = not self.tag_versioning and not self.packed_config
+        if pending and self.layout == 'string' and simple:
+            values.update(zip(pending, redis.mget(pending)))
+            pending = [key for key in pending if values[key] is None]
+
+        if pending and self.packed_config and self.tag_versioning:
+            for key in pending:
+                values[key] = self.fetch(key)
+        elif pending:
+            pipe = redis.pipeline(transaction=False)
+            for key in pending:
+                self.fetch(key, client=pipe)
+            values.update(zip(pending, pipe.execute()))
+
+        return values
+
+    def check_many(self, keys):
+        """
+        Check many
+        Checks existence of items by full keys in one round trip.
+
+        :param keys:            list of full item keys
+        :return:                dict, existence by key
+        """
+        pipe = self.get_redis().pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(key)
+        return dict(zip(keys, pipe.execute()))
+
+    def batch_stats(self):
+        """
+        Batch stats
+        Returns read batching metrics for gets and existence checks (see
+        Batcher.stats()) or None if batching is off.
+
+        :return:                dict or None
+        """
+        if not self.get_batcher:
+            return None
+        return dict(
+            get=self.get_batcher.stats(),
+            exists=self.exists_batcher.stats()
+        )
 
+    @guarded(False)
     def delete(self, key=None, *, tags=None, disjunction=False):
         """
         Delete
@@ -248,15 +1458,29 @@ class Redis:
         If disjunction is False (default) all tags must match
         otherwise any tag can match.
 
+        With tag versioning enabled deleting by any of the tags only
+        increments tag generations, which invalidates all tagged items at once.
+        Conjunction still has to find items carrying all tags.
+
         :param key:             int, item key
         :param tags:            Iterable, tags to fetch by
         :return:                bool
         """
         redis = self.get_redis()
+        if self.legacy:
+            self.legacy.delete(key, tags=tags, disjunction=disjunction)
 
         if key:
-            key = self.get_full_item_key(key)
-            return redis.delete(key)
+            return self.delete_item(key)
+
+        if self.near_cache:
+            self.near_cache.clear()
+        if self.write_buffer:
+            self.write_buffer.flush()
+
+        # invalidate tag generations
+        if self.tag_versioning and (disjunction or len(tags) <= 1):
+            return self.invalidate_tags(tags)
 
         # disjunction or single tag
         if disjunction or len(tags) <= 1:
@@ -267,7 +1491,7 @@ class Redis:
                     continue
 
                 for item_key in tagged:
-                    result += self.delete(item_key)
+                    result += self.delete_item(item_key)
 
             return result
 
@@ -278,38 +1502,198 @@ class Redis:
             return False
 
         multi = redis.pipeline()
-        for item_key in delete_us:
-            multi.delete(item_key)
+        for member in delete_us:
+            multi.delete(self.get_member_item_key(member))
 
         result = multi.execute()
         return result
 
+    def delete_item(self, key):
+        """
+        Delete item
+        Removes a single item by key, without touching items stored with
+        legacy keys.
+
+        :param key:             string, item key or full item key
+        :return:                int, number of removed keys
+        """
+        redis = self.get_redis()
+        key = self.get_full_item_key(key)
+        if self.near_cache:
+            self.near_cache.delete(key)
+        if self.write_buffer:
+            self.write_buffer.discard(key)
+        if self.packed_config:
+            return self.unpack(key) + redis.delete(key)
+        return redis.delete(key)
+
+    @guarded(False)
     def delete_all(self):
         """
         Delete all
-        Removes all cached item stored under current namespace
+        Removes all cached item stored under current namespace. With
+        namespace versioning enabled simply switches to next generation.
 
         :return:                bool
         """
         redis = self.get_redis()
-        ns = self.item_prefix + '*'
-        keys = redis.keys(ns)
+        if self.near_cache:
+            self.near_cache.clear()
+        if self.write_buffer:
+            self.write_buffer.clear()
+        if self.bloom:
+            self.reset_bloom()
+        if self.legacy:
+            self.legacy.delete_all()
+
+        if self.namespace_versioning:
+            generation = redis.incr(self.namespace_generation_key)
+            self.update_prefixes(generation)
+            self.namespace_checked_at = time.monotonic()
+            return True
+
+        deleted = 0
+        for batch in self.scan():
+            deleted += redis.delete(*batch)
+        return deleted or False
+
+    def scan(self, match=None, batch_size=1000):
+        """
+        Scan
+        Walks keys stored under current namespace with cursor-based scan
+        and yields them in batches, so that huge namespaces can be processed
+        without blocking redis or loading all keys into memory.
+
+        :param match:           string, optional pattern within namespace
+        :param batch_size:      int, keys per batch
+        :return:                generator of lists of full keys
+        """
+        redis = self.get_redis()
+        self.check_namespace_generation()
+        pattern = self.item_prefix + (match or '*')
+
+        batch = []
+        for key in redis.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def scan_tagged(self, tags, disjunction=False, batch_size=1000):
+        """
+        Scan tagged
+        Walks keys of items marked with tags with cursor-based scan of tag
+        sets and yields them in batches. If disjunction is False (default)
+        all tags must match, in which case the smallest tag set is scanned
+        and its members are checked against the rest.
+
+        :param tags:            Iterable, tags
+        :param disjunction:     bool, match any tag
+        :param batch_size:      int, keys per batch
+        :return:                generator of lists of full keys
+        """
+        redis = self.get_redis()
+        tag_keys = [self.get_tag_set_key(tag) for tag in tags]
+
+        # scan every tag
+        if disjunction or len(tag_keys) <= 1:
+            for tag_key in tag_keys:
+                batch = []
+                for member in redis.sscan_iter(tag_key, count=batch_size):
+                    batch.append(self.get_member_item_key(member))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+            return
+
+        # scan smallest tag and check membership in others
+        pipe = redis.pipeline()
+        for tag_key in tag_keys:
+            pipe.scard(tag_key)
+        sizes = pipe.execute()
+        tag_keys = [key for _, key in sorted(zip(sizes, tag_keys))]
+        smallest, others = tag_keys[0], tag_keys[1:]
+
+        def matching(candidates):
+            pipe = redis.pipeline()
+            for candidate in candidates:
+                for tag_key in others:
+                    pipe.sismember(tag_key, candidate)
+            flags = pipe.execute()
+            size = len(others)
+            return [
+                self.get_member_item_key(candidate)
+                for index, candidate in enumerate(candidates)
+                if all(flags[index * size:(index + 1) * size])
+            ]
+
+        batch = []
+        for key in redis.sscan_iter(smallest, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield matching(batch)
+                batch = []
+        if batch:
+            yield matching(batch)
+
+    def delete_keys(self, keys):
+        """
+        Delete keys
+        Removes a batch of full keys (items or tag sets) at once.
+
+        :param keys:            list, full keys
+        :return:                int, number of removed keys
+        """
         if not keys:
+            return 0
+        if self.near_cache:
+            for key in keys:
+                self.near_cache.delete(key)
+        return self.get_redis().delete(*keys)
+
+    def drop_tags(self, tags, disjunction=False):
+        """
+        Drop tags
+        Finishes deleting items by tags in batches (see scan_tagged()).
+        Items stored with legacy keys are deleted and, once items marked
+        with any of the tags are gone, tag generations are incremented and
+        tag sets removed. Tag sets still hold other items when all tags
+        had to match, so these are kept.
+
+        :param tags:            Iterable, tags
+        :param disjunction:     bool, match any tag
+        :return:                bool
+        """
+        tags = list(tags)
+        if self.legacy:
+            self.legacy.delete(tags=tags, disjunction=disjunction)
+        if not tags or (not disjunction and len(tags) > 1):
             return False
-        return redis.delete(*keys)
 
-    def set_tags(self, item_key, tags):
+        if self.tag_versioning:
+            self.invalidate_tags(tags)
+        self.delete_keys([self.get_tag_set_key(tag) for tag in tags])
+        return True
+
+    def set_tags(self, item_key, tags, versions=None):
         """
         Set tags
         Sets an iterable of tags to an item and creates or updates tag set
-        for each tag with item key.
+        for each tag with item key. With tag versioning enabled will also
+        remember current tag generations, unless these were already provided.
 
         :param item_key:        string, item cache key
         :param tags:            Iterable, tags to set
+        :param versions:        list, optional tag generations
         :return:                bool
         """
         key = self.get_full_item_key(item_key)
-        if not self.exists(key):
+        if not self.get_redis().exists(key):
             return False
 
         # remove tags?
@@ -319,21 +1703,24 @@ class Redis:
 
         redis = self.get_redis()
 
-        # set tags to item
+        # remember tag generations
+        if self.tag_versioning:
+            if versions is None:
+                versions = self.get_tag_versions(tags)
+            redis.hset(key, 'versions', ','.join(versions))
+
+        # set tags to item (replacing tags of rewritten item)
         tag_string = ','.join(tags)
-        result = redis.hset(key, 'tags', tag_string)
-        if not result:
-            return False
+        redis.hset(key, 'tags', tag_string)
 
-        # add item key to tags
+        # add item key to tags, it may already be there
         for tag in tags:
             tag_key = self.get_tag_set_key(tag)
-            result = redis.sadd(tag_key, key)
-            if not result:
-                return False
+            redis.sadd(tag_key, self.get_tag_member(key))
 
         return True
 
+    @guarded(lambda tag: set())
     def get_tagged_items(self, tag):
         """
         Get tagged items
@@ -344,8 +1731,118 @@ class Redis:
         """
         key = self.get_tag_set_key(tag)
         result = self.get_redis().smembers(key)
+        if self.compact_config:
+            result = set(self.get_member_item_key(item) for item in result)
         return result
 
+    @guarded(lambda *args, **kwargs: dict())
+    def get_by_tags(self, tags, disjunction=False, limit=None):
+        """
+        Get by tags
+        Returns items marked with tags in a single script call that
+        intersects tag sets and reads values server side. If disjunction is
+        False (default) all tags must match otherwise any tag can match,
+        same as with delete(). Items are returned by keys relative to
+        namespace (hashed for long keys with compact keys enabled).
+
+        The whole result is built at once, use iter_by_tags() for tags
+        marking too many items for a single call.
+
+        :param tags:            Iterable, tags
+        :param disjunction:     bool, match any tag
+        :param limit:           int, maximum number of items
+        :return:                dict, values by key
+        """
+        tags = list(tags)
+        if not tags:
+            return dict()
+        if self.write_buffer:
+            self.write_buffer.flush()
+
+        prefix = self.item_prefix if self.compact_config else ''
+        version_prefix = self.tag_version_prefix if self.tag_versioning else ''
+        result = self.get_script('get_by_tags')(
+            keys=[self.get_tag_set_key(tag) for tag in tags],
+            args=[
+                'union' if disjunction else 'inter',
+                limit or 0,
+                prefix,
+                version_prefix
+            ]
+        )
+
+        start = len(self.item_prefix)
+        return {
+            result[i][start:]: result[i + 1]
+            for i in range(0, len(result), 2)
+        }
+
+    def iter_by_tags(self, tags, disjunction=False, batch_size=1000):
+        """
+        Iter by tags
+        Lazily walks items marked with tags and yields (key, value) pairs
+        with keys relative to namespace. Tag sets are scanned with a cursor
+        and every batch of items is read in a single round trip, so huge
+        tags can be processed without blocking redis. Semantics are the
+        same as with get_by_tags(), and every item is yielded once.
+
+        :param tags:            Iterable, tags
+        :param disjunction:     bool, match any tag
+        :param batch_size:      int, keys per batch
+        :return:                generator of tuples
+        """
+        tags = list(tags)
+        if self.write_buffer:
+            self.write_buffer.flush()
+
+        if disjunction and len(tags) > 1:
+            batches = self.scan_distinct(tags, batch_size)
+        else:
+            batches = self.scan_tagged(tags, disjunction, batch_size)
+
+        start = len(self.item_prefix)
+        for batch in batches:
+            if not batch:
+                continue
+            values = self.fetch_many(batch)
+            for key in batch:
+                if values[key] is not None:
+                    yield key[start:], values[key]
+
+    def scan_distinct(self, tags, batch_size=1000):
+        """
+        Scan distinct
+        Walks keys of items marked with any of the tags with cursor-based
+        scan of tag sets and yields them in batches. Items carrying several
+        of the tags are only yielded for the first of them.
+
+        :param tags:            list, tags
+        :param batch_size:      int, keys per batch
+        :return:                generator of lists of full keys
+        """
+        redis = self.get_redis()
+        tag_keys = [self.get_tag_set_key(tag) for tag in tags]
+        for index, tag in enumerate(tags):
+            seen = tag_keys[:index]
+            for batch in self.scan_tagged([tag], batch_size=batch_size):
+                if not seen:
+                    yield batch
+                    continue
+
+                pipe = redis.pipeline(transaction=False)
+                for key in batch:
+                    member = self.get_tag_member(key)
+                    for tag_key in seen:
+                        pipe.sismember(tag_key, member)
+                flags = pipe.execute()
+
+                size = len(seen)
+                yield [
+                    key for i, key in enumerate(batch)
+                    if not any(flags[i * size:(i + 1) * size])
+                ]
+
+    @guarded(None)
     def get_item_tags(self, key):
         """
         Get item tags
@@ -355,12 +1852,780 @@ class Redis:
         :return: list | None
         """
         key = self.get_full_item_key(key)
-        tag_string = self.get_redis().hget(key, 'tags')
+        try:
+            tag_string = self.get_redis().hget(key, 'tags')
+        except ResponseError:
+            return  # untagged item in string layout
         if not tag_string:
             return
 
         return tag_string.split(',')
 
+    def get_item_tag_versions(self, key):
+        """
+        Get item tag versions
+        Returns a list of tag generations item was written with, in the same
+        order as item tags.
+
+        :param key: string, item key
+        :return: list | None
+        """
+        key = self.get_full_item_key(key)
+        try:
+            version_string = self.get_redis().hget(key, 'versions')
+        except ResponseError:
+            return  # untagged item in string layout
+        if not version_string:
+            return
+
+        return version_string.split(',')
+
+    def get_tag_versions(self, tags):
+        """
+        Get tag versions
+        Returns a list of current generations for the given tags. Tags that
+        were never invalidated are at generation zero.
+
+        :param tags: list, tags
+        :return: list
+        """
+        keys = [self.get_tag_version_key(tag) for tag in tags]
+        versions = self.get_redis().mget(keys)
+        return [version or '0' for version in versions]
+
+    def invalidate_tags(self, tags):
+        """
+        Invalidate tags
+        Increments generation counters for the given tags, so that every item
+        tagged with any of them before becomes stale. Requires tag versioning.
+
+        :param tags: Iterable, tags to invalidate
+        :return: bool
+        """
+        if not self.tag_versioning:
+            error = 'Tag invalidation requires tag versioning to be enabled'
+            raise exceptions.AdapterFeatureMissingException(error)
+
+        if self.near_cache:
+            self.near_cache.clear()
+        if self.write_buffer:
+            self.write_buffer.flush()
+
+        pipe = self.get_redis().pipeline()
+        for tag in tags:
+            pipe.incr(self.get_tag_version_key(tag))
+
+        pipe.execute()
+        return True
+
+    # -------------------------------------------------------------------------
+    # Counters
+    # -------------------------------------------------------------------------
+
+    def incr(self, key, amount=1, *, ttl=None, expires_at=None):
+        """
+        Increment
+        Atomically increments integer item and returns its new value. Item
+        is created at zero if missing. Custom ttl or expiration date only
+        apply when counter is created, increments do not extend its life.
+        Returns None while redis is failing with resilience enabled.
+
+        :param key:             string, cache key
+        :param amount:          int, value to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                int
+        """
+        values = self.incr_many({key: amount}, ttl=ttl, expires_at=expires_at)
+        return values[key]
+
+    def decr(self, key, amount=1, *, ttl=None, expires_at=None):
+        """
+        Decrement
+        Atomically decrements integer item and returns its new value. See
+        incr() for details.
+
+        :param key:             string, cache key
+        :param amount:          int, value to subtract
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                int
+        """
+        return self.incr(key, -amount, ttl=ttl, expires_at=expires_at)
+
+    @guarded(lambda amounts, **kwargs: dict.fromkeys(amounts))
+    def incr_many(self, amounts, *, ttl=None, expires_at=None):
+        """
+        Increment many
+        Increments several counters in one round trip and returns their
+        new values. See incr() for details.
+
+        :param amounts:         dict, values to add by cache key
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                dict
+        """
+        if expires_at:
+            ttl = times.ttl_from_expiration(expires_at)
+        if not ttl:
+            ttl = self.ttl
+
+        if self.write_buffer:
+            self.write_buffer.flush()
+
+        script = self.get_script('incr')
+        now = time.time()
+        keys = list(amounts)
+        pipe = self.get_redis().pipeline(transaction=False)
+        for key in keys:
+            full_key = self.get_full_item_key(key)
+            self.profile('set', full_key)
+            if self.near_cache:
+                self.near_cache.delete(full_key)
+            self.remember_written(full_key)
+
+            bucket = field = ''
+            if self.packed_config:
+                bucket, field = self.get_bucket(full_key)
+
+            script(
+                keys=[full_key, bucket],
+                args=[
+                    int(amounts[key]),
+                    math.ceil(ttl * 1000),
+                    self.layout,
+                    field,
+                    now
+                ],
+                client=pipe
+            )
+
+        return dict(zip(keys, pipe.execute()))
+
+    @guarded(lambda key, limit, window: (True, limit, 0.0))
+    def rate_limit(self, key, limit, window):
+        """
+        Rate limit
+        Registers a request under sliding window rate limit. Requests are
+        kept as timestamps in a sorted set and at most limit of them are
+        allowed within any window. Rejected requests are not counted.
+        Returns whether the request is allowed, how many more requests
+        are allowed now and seconds to wait before the next one would be.
+
+        :param key:             string, limit key (user, ip etc.)
+        :param limit:           int, requests allowed per window
+        :param window:          float, window length in seconds
+        :return:                tuple, (allowed, remaining, retry after)
+        """
+        script = self.get_script('rate_limit')
+        self.check_namespace_generation()
+        allowed, remaining, retry = script(
+            keys=[self.rate_limit_prefix + self.compact(key)],
+            args=[limit, window, time.time(), uuid.uuid4().hex]
+        )
+        return bool(allowed), remaining, max(0.0, float(retry))
+
+    # -------------------------------------------------------------------------
+    # Packing
+    # -------------------------------------------------------------------------
+
+    def is_packable(self, key, value, tags=None):
+        """
+        Is packable?
+        Checks if item should be packed into bucket: packing is enabled,
+        item is not a service key, has no tags and its value is small enough.
+
+        :param key:             string, full item key
+        :param value:           item value
+        :param tags:            item tags
+        :return:                bool
+        """
+        if not self.packed_config or tags or self.is_service_key(key):
+            return False
+        if not isinstance(value, str):
+            value = str(value)
+        return len(value) <= self.packed_config['max_size']
+
+    def get_bucket(self, key):
+        """
+        Get bucket
+        Returns bucket hash key and field of the item.
+
+        :param key:             string, full item key
+        :return:                tuple, (bucket key, field)
+        """
+        field = key[len(self.item_prefix):]
+        index = zlib.crc32(field.encode()) % self.packed_config['buckets']
+        return self.bucket_prefix + str(index), field
+
+    def set_packed(self, key, value, ttl):
+        """
+        Set packed
+        Writes item into its bucket with embedded expiration time. Bucket
+        lives as long as its longest living item.
+
+        :param key:             string, full item key
+        :param value:           item value
+        :param ttl:             int, seconds
+        :return:                bool
+        """
+        bucket, field = self.get_bucket(key)
+        packed = '{:.3f}|{}'.format(time.time() + ttl, value)
+        script = self.get_script('set_packed')
+        script(keys=[bucket, key], args=[field, packed, math.ceil(ttl)])
+        return True
+
+    def unpack(self, key):
+        """
+        Unpack
+        Removes item from its bucket.
+
+        :param key:             string, full item key
+        :return:                int, number of removed fields
+        """
+        bucket, field = self.get_bucket(key)
+        return self.get_redis().hdel(bucket, field)
+
+    def optimize_bucket(self, bucket, batch_size=1000):
+        """
+        Optimize bucket
+        Removes expired items from bucket.
+
+        :param bucket:          string, bucket key
+        :param batch_size:      int, fields per scan
+        :return:                int, number of removed items
+        """
+        redis = self.get_redis()
+        now = time.time()
+        expired = []
+        for field, packed in redis.hscan_iter(bucket, count=batch_size):
+            expires = packed.split('|', 1)[0]
+            if float(expires) <= now:
+                expired.append(field)
+
+        if not expired:
+            return 0
+        return redis.hdel(bucket, *expired)
+
+    # -------------------------------------------------------------------------
+    # Misses
+    # -------------------------------------------------------------------------
+
+    def is_known_missing(self, key):
+        """
+        Is known missing?
+        Checks if item is known to be missing, either because it was
+        recently remembered as a miss or because bloom filter says it was
+        never written. False means item has to be looked up in redis.
+
+        :param key:             string, full item key
+        :return:                bool
+        """
+        if self.is_service_key(key):
+            return False
+
+        if self.negative_cache and self.negative_cache.get(key):
+            return True
+
+        # bloom filter does not know items stored with legacy keys
+        if not self.bloom or self.legacy:
+            return False
+
+        self.check_bloom()
+        if not self.bloom_ready:
+            return False
+
+        return key[len(self.item_prefix):] not in self.bloom
+
+    def remember_missing(self, key):
+        """
+        Remember missing
+        Puts a miss marker for the item into negative cache.
+
+        :param key:             string, full item key
+        :return:                None
+        """
+        if self.negative_cache and not self.is_service_key(key):
+            self.negative_cache.set(key, True)
+
+    def remember_written(self, key):
+        """
+        Remember written
+        Drops miss marker of the item and adds it to bloom filter. Bits are
+        pushed to redis on next sync.
+
+        :param key:             string, full item key
+        :return:                None
+        """
+        if self.negative_cache:
+            self.negative_cache.delete(key)
+
+        if not self.bloom or self.is_service_key(key):
+            return
+
+        with self.bloom_lock:
+            positions = self.bloom.add(key[len(self.item_prefix):])
+            self.bloom_pending.extend(positions)
+
+        self.check_bloom()
+
+    def get_bloom_key(self):
+        """
+        Get bloom key
+        Returns key of a shared bloom filter bitmap. First bit of the bitmap
+        marks filter as complete, filter bits follow.
+
+        :return:                string
+        """
+        self.check_namespace_generation()
+        return self.service_prefix + 'bloom'
+
+    def check_bloom(self):
+        """
+        Check bloom
+        Syncs bloom filter with redis in background if it's time. Until
+        the first sync completes the filter is not used.
+
+        :return:                None
+        """
+        synced_at = self.bloom_synced_at
+        interval = self.bloom_config['sync_interval']
+        if synced_at is None or time.monotonic() - synced_at >= interval:
+            self.run_in_background('sync_bloom')
+
+    def sync_bloom(self):
+        """
+        Sync bloom
+        Pushes bits of keys written since last sync to shared bitmap and
+        loads it back, so that keys written by other processes are picked
+        up. If shared bitmap is missing or incomplete, rebuilds it from
+        namespace keys. Until filter is complete it is not used.
+
+        :return:                bool, whether filter is ready
+        """
+        with self.bloom_lock:
+            pending, self.bloom_pending = self.bloom_pending, []
+            self.bloom_synced_at = time.monotonic()
+
+        key = self.get_bloom_key()
+        raw = self.get_raw_redis()
+        try:
+            pipe = raw.pipeline(transaction=False)
+            for position in pending:
+                pipe.setbit(key, position + 8, 1)
+            pipe.get(key)
+            bitmap = pipe.execute()[-1]
+        except Exception:
+            # push these bits with next sync
+            with self.bloom_lock:
+                self.bloom_pending[:0] = pending
+            raise
+
+        if not bitmap or not bitmap[0] & 0x80:
+            self.bloom_ready = False
+            if not self.rebuild_bloom():
+                return False
+            bitmap = raw.get(key) or b''
+
+        with self.bloom_lock:
+            self.bloom.load(bitmap[1:])
+            self.bloom.set_bits(self.bloom_pending)
+            self.bloom_ready = True
+
+        return True
+
+    def rebuild_bloom(self, replace=False, batch_size=1000):
+        """
+        Rebuild bloom
+        Scans namespace and builds bloom filter of existing items. By
+        default merges it into shared bitmap keeping bits pushed by other
+        processes meanwhile. Replacing drops bits of gone items, but items
+        written during rebuild may read as misses until written again.
+        Only one process rebuilds at a time.
+
+        :param replace:         bool, replace shared bitmap
+        :param batch_size:      int, keys per scan
+        :return:                bool, whether filter was rebuilt
+        """
+        raw = self.get_raw_redis()
+        key = self.get_bloom_key()
+        lock = self.service_prefix + 'bloomlock'
+        if not raw.set(lock, 1, nx=True, ex=60):
+            return False
+
+        try:
+            bloom = BloomFilter(self.bloom.size, self.bloom.hashes)
+            offset = len(self.item_prefix)
+            for batch in self.scan(batch_size=batch_size):
+                for item_key in batch:
+                    if self.is_service_key(item_key):
+                        continue
+                    if item_key.startswith(self.tag_prefix):
+                        continue
+                    if item_key.startswith(self.bucket_prefix):
+                        redis = self.get_redis()
+                        for field in redis.hkeys(item_key):
+                            bloom.add(field)
+                        continue
+                    bloom.add(item_key[offset:])
+
+            bitmap = b'\x80' + bytes(bloom.bits)
+            if replace:
+                raw.set(key, bitmap)
+            else:
+                temp = self.service_prefix + 'bloomrebuild'
+                pipe = raw.pipeline()
+                pipe.set(temp, bitmap)
+                pipe.bitop('OR', key, key, temp)
+                pipe.delete(temp)
+                pipe.execute()
+        finally:
+            raw.delete(lock)
+
+        return True
+
+    def reset_bloom(self):
+        """
+        Reset bloom
+        Forgets local bloom filter, it will be reloaded on next use.
+
+        :return:                None
+        """
+        with self.bloom_lock:
+            self.bloom.clear()
+            self.bloom_pending = []
+            self.bloom_ready = False
+            self.bloom_synced_at = None
+
+    # -------------------------------------------------------------------------
+    # Profiling
+    # -------------------------------------------------------------------------
+
+    def profile(self, operation, key):
+        """
+        Profile
+        Records sampled access to the item and flushes hot keys to redis
+        in background when it's time. Returns true if the key is hot.
+
+        :param operation:       string, operation name
+        :param key:             string, full item key
+        :return:                bool
+        """
+        if not self.profiler or self.is_service_key(key):
+            return False
+
+        if key.startswith(self.item_prefix):
+            key = key[len(self.item_prefix):]
+
+        if not self.profiler.record(operation, key):
+            return self.profiler.is_hot(operation, key)
+
+        interval = self.profile_config['flush_interval']
+        if time.monotonic() - self.profile_flushed_at >= interval:
+            self.run_in_background('flush_profile')
+
+        return True
+
+    def flush_profile(self):
+        """
+        Flush profile
+        Adds accesses of hot keys counted since last flush to shared sorted
+        sets in redis (one per operation), so that hot keys from all
+        processes can be inspected together. Sets are trimmed and expire
+        unless kept being updated.
+
+        :return:                None
+        """
+        self.profile_flushed_at = time.monotonic()
+        if not self.profiler:
+            return
+
+        keep = self.profile_config['keep']
+        retention = self.profile_config['retention']
+        pipe = self.get_redis().pipeline(transaction=False)
+        for operation in list(self.profiler.trackers):
+            flushed = self.profile_flushed.get(operation, dict())
+            hot_keys = dict(self.profiler.hot_keys(operation))
+            zset = self.hot_keys_prefix + operation
+            for key, count in hot_keys.items():
+                delta = count - flushed.get(key, 0)
+                if delta > 0:
+                    pipe.zincrby(zset, delta, key)
+
+            pipe.zremrangebyrank(zset, 0, -keep - 1)
+            pipe.expire(zset, retention)
+            self.profile_flushed[operation] = hot_keys
+
+        pipe.execute()
+
+    def get_hot_keys(self, operation='get', limit=20):
+        """
+        Get hot keys
+        Returns hot keys of the operation flushed to redis by all processes
+        with estimated number of accesses, most accessed first.
+
+        :param operation:       string, operation name
+        :param limit:           int, number of keys to return
+        :return:                list of tuples
+        """
+        zset = self.hot_keys_prefix + operation
+        items = self.get_redis().zrevrange(zset, 0, limit - 1, withscores=True)
+        return [(key, count) for key, count in items]
+
+    # -------------------------------------------------------------------------
+    # Background
+    # -------------------------------------------------------------------------
+
+    def run_in_background(self, task):
+        """
+        Run in background
+        Runs adapter method (such as profile flush) on a daemon thread,
+        so that the request that happened to cross the interval does not
+        pay for the round trip. Method is not started again while it runs.
+        Errors are swallowed, it will be retried on next interval.
+
+        :param task:            string, method name
+        :return:                bool, whether task was started
+        """
+        with self.background_lock:
+            if task in self.background:
+                return False
+
+            def run():
+                try:
+                    getattr(self, task)()
+                except Exception:
+                    # telemetry sync must never fail requests
+                    pass
+                finally:
+                    with self.background_lock:
+                        self.background.pop(task, None)
+
+            thread = threading.Thread(
+                target=run,
+                name='shiftmemory-' + task.replace('_', '-'),
+                daemon=True
+            )
+            self.background[task] = thread
+            thread.start()
+        return True
+
+    def join_background(self, timeout=None):
+        """
+        Join background
+        Waits for background tasks to complete.
+
+        :param timeout:         float, maximum seconds to wait for each
+        :return:                None
+        """
+        with self.background_lock:
+            threads = list(self.background.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    # -------------------------------------------------------------------------
+    # Slow log
+    # -------------------------------------------------------------------------
+
+    def push_slow_log(self, entry, size=128):
+        """
+        Push slow log
+        Adds slow operation entry to a list shared by all processes. List
+        is trimmed to size and expires unless kept being updated.
+
+        :param entry:           dict, slow log entry
+        :param size:            int, maximum number of entries
+        :return:                None
+        """
+        pipe = self.get_redis().pipeline(transaction=False)
+        pipe.lpush(self.slow_log_key, json.dumps(entry))
+        pipe.ltrim(self.slow_log_key, 0, size - 1)
+        pipe.expire(self.slow_log_key, self.slow_log_retention)
+        pipe.execute()
+
+    def get_slow_log(self, limit=None):
+        """
+        Get slow log
+        Returns slow operations recorded by all processes, newest first.
+
+        :param limit:           int, number of entries to return
+        :return:                list of dicts
+        """
+        end = -1 if limit is None else limit - 1
+        entries = self.get_redis().lrange(self.slow_log_key, 0, end)
+        return [json.loads(entry) for entry in entries]
+
+    # -------------------------------------------------------------------------
+    # Snapshots
+    # -------------------------------------------------------------------------
+
+    def iter_items(self, match=None, *, tag=None, batch_size=1000):
+        """
+        Iter items
+        Lazily walks items stored under current namespace, optionally only
+        the ones with keys matching pattern or marked with a tag, and yields
+        (key, value, ttl, tags) records, where key is relative to namespace
+        and ttl is in milliseconds. Keys are scanned with a cursor and every
+        batch is read in a single round trip, so memory use is bounded by
+        batch size. See export_items().
+
+        :param match:           string, optional pattern within namespace
+        :param tag:             string, optional tag
+        :param batch_size:      int, keys per batch
+        :return:                generator of tuples
+        """
+        for batch in self.export_items(match, None, batch_size, tag=tag):
+            yield from batch
+
+    def export_items(self, match=None, keys=None, batch_size=1000, tag=None):
+        """
+        Export items
+        Walks items stored under current namespace, only the given ones or
+        the ones marked with a tag, and yields them in batches of (key,
+        value, ttl, tags) records, where key is relative to namespace and
+        ttl is in milliseconds. Each batch is read in a single round trip,
+        packed items are read from their buckets. Expired and invalidated
+        items are skipped.
+
+        :param match:           string, optional pattern within namespace
+        :param keys:            list, optional item keys to export
+        :param batch_size:      int, keys per batch
+        :param tag:             string, optional tag
+        :return:                generator of lists of tuples
+        """
+        if keys is not None:
+            keys = [self.get_full_item_key(key) for key in keys]
+            batches = (
+                keys[i:i + batch_size]
+                for i in range(0, len(keys), batch_size)
+            )
+        elif tag is not None:
+            batches = self.scan_tagged([tag], batch_size=batch_size)
+        else:
+            batches = self.scan(match, batch_size)
+
+        prefix = len(self.item_prefix)
+        for batch in batches:
+            if match and (keys is not None or tag is not None):
+                batch = [
+                    key for key in batch
+                    if fnmatch.fnmatchcase(key[prefix:], match)
+                ]
+
+            records = []
+            items = []
+            for key in batch:
+                if key.startswith(self.bucket_prefix):
+                    records += self.export_bucket(key, match, batch_size)
+                elif not key.startswith(self.tag_prefix) and \
+                        not self.is_service_key(key):
+                    items.append(key)
+
+            records += self.export_keys(items, packed=keys is not None)
+            if records:
+                yield records
+
+    def export_keys(self, keys, packed=False):
+        """
+        Export keys
+        Reads snapshot records of items by full keys in one round trip.
+        Optionally also looks up items missing in their buckets.
+
+        :param keys:            list, full item keys
+        :param packed:          bool, look up missing items in buckets
+        :return:                list of tuples
+        """
+        if not keys:
+            return []
+
+        version_prefix = self.tag_version_prefix if self.tag_versioning else ''
+        result = self.get_script('export')(keys=keys, args=[version_prefix])
+
+        records = []
+        missing = []
+        for index, key in enumerate(keys):
+            value, tags, ttl = result[index * 3:index * 3 + 3]
+            if value is None:
+                missing.append(key)
+                continue
+            tags = tags.split(',') if tags else None
+            ttl = ttl if ttl > 0 else None
+            records.append((key[len(self.item_prefix):], value, ttl, tags))
+
+        if packed and missing and self.packed_config:
+            pipe = self.get_redis().pipeline(transaction=False)
+            fields = [self.get_bucket(key) for key in missing]
+            for bucket, field in fields:
+                pipe.hget(bucket, field)
+
+            now = time.time()
+            for (_, field), packed in zip(fields, pipe.execute()):
+                record = self.unpack_record(field, packed, now)
+                if record:
+                    records.append(record)
+
+        return records
+
+    def export_bucket(self, bucket, match=None, batch_size=1000):
+        """
+        Export bucket
+        Reads snapshot records of items packed into bucket.
+
+        :param bucket:          string, bucket key
+        :param match:           string, optional pattern within namespace
+        :param batch_size:      int, fields per scan
+        :return:                list of tuples
+        """
+        now = time.time()
+        records = []
+        redis = self.get_redis()
+        for field, packed in redis.hscan_iter(bucket, count=batch_size):
+            if match and not fnmatch.fnmatchcase(field, match):
+                continue
+            record = self.unpack_record(field, packed, now)
+            if record:
+                records.append(record)
+        return records
+
+    def unpack_record(self, field, packed, now):
+        """
+        Unpack record
+        Returns snapshot record of packed item or None if it expired.
+
+        :param field:           string, bucket field
+        :param packed:          string, packed value or None
+        :param now:             float, current timestamp
+        :return:                tuple or None
+        """
+        if packed is None:
+            return None
+        expires, value = packed.split('|', 1)
+        ttl = math.floor((float(expires) - now) * 1000)
+        if ttl <= 0:
+            return None
+        return field, value, ttl, None
+
+    def import_items(self, records):
+        """
+        Import items
+        Writes a batch of snapshot records (see export_items()) in one
+        round trip. Tag generations are read at write time, and records
+        without ttl get cache ttl.
+
+        :param records:         list of (key, value, ttl, tags) tuples
+        :return:                int, number of written items
+        """
+        self.check_namespace_generation()
+        batch = []
+        for key, value, ttl, tags in records:
+            full_key = self.item_prefix + key
+            self.before_write(full_key)
+            ttl = ttl / 1000 if ttl else self.ttl
+            batch.append((full_key, value, list(tags or []), ttl, None))
+
+        self.write_batch(batch)
+        return len(batch)
+
     # -------------------------------------------------------------------------
     # Optimizing
     # -------------------------------------------------------------------------
@@ -374,9 +2639,19 @@ class Redis:
         :return: bool
         """
         redis = self.get_redis()
-        keys = redis.keys(self.item_prefix + '*')
+        if self.namespace_versioning:
+            self.check_namespace_generation(force=True)
+            self.sweep()
 
+        keys = (key for batch in self.scan() for key in batch)
         for key in keys:
+            if self.is_service_key(key):
+                continue
+
+            if key.startswith(self.bucket_prefix):
+                self.optimize_bucket(key)
+                continue
+
             is_tag = key.startswith(self.tag_prefix)
 
             # optimize tag
@@ -385,7 +2660,7 @@ class Redis:
                 for item in items:
                     # clear missing items from sets
                     if not redis.exists(item):
-                        redis.srem(key, item)
+                        redis.srem(key, self.get_tag_member(item))
 
                     # clear empty sets
                     if redis.scard(key) == 0:
@@ -398,17 +2673,224 @@ class Redis:
                 if not tags:
                     continue
 
+                # drop items with stale tag generations
+                if self.tag_versioning and self.fetch(key) is None:
+                    continue
+
+                versions = self.get_item_tag_versions(key)
                 updated_tags = []
-                for tag in tags:
+                updated_versions = []
+                for index, tag in enumerate(tags):
                     # remove missing tags from items
                     tagged_items = self.get_tagged_items(tag)
                     if tagged_items:
                         updated_tags.append(tag)
+                        if versions:
+                            updated_versions.append(versions[index])
 
                 redis.hset(key, 'tags', ','.join(updated_tags))
+                if versions:
+                    redis.hset(key, 'versions', ','.join(updated_versions))
+
+        # drop bits of expired and deleted items
+        if self.bloom:
+            self.rebuild_bloom(replace=True)
+            self.bloom_synced_at = None
 
         return True
 
+    def sweep(self, batch_size=1000):
+        """
+        Sweep
+        Incrementally scans namespace and removes keys left from previous
+        namespace generations. Only applies to versioned namespaces.
+
+        :param batch_size:      int, keys to scan and delete at once
+        :return:                int, number of removed keys
+        """
+        if not self.namespace_versioning:
+            return 0
+
+        redis = self.get_redis()
+        sep = self.namespace_separator
+        current = self.check_namespace_generation()
+        offset = len(self.namespace_prefix)
+
+        removed = 0
+        stale = []
+        match = self.namespace_prefix + '*'
+        for key in redis.scan_iter(match=match, count=batch_size):
+            generation = key[offset:].split(sep, 1)[0]
+            if generation.isdigit() and generation != current:
+                stale.append(key)
+            if len(stale) >= batch_size:
+                removed += redis.delete(*stale)
+                stale = []
+
+        if stale:
+            removed += redis.delete(*stale)
+
+        return removed
+
+    # -------------------------------------------------------------------------
+    # Stats
+    # -------------------------------------------------------------------------
+
+    def stats(
+        self,
+        sample_size=1000,
+        scan_limit=100000,
+        top_tags=10,
+        batch_size=1000,
+        probes=1000
+    ):
+        """
+        Stats
+        Profiles namespace by walking it incrementally with scan. Item keys
+        are reservoir sampled and only the sample is inspected for memory
+        usage, value sizes and ttls, returning estimates with confidence
+        bounds. Tag sets met during the scan are measured to report the
+        largest ones. Buckets of packed items are only counted.
+
+        Scan stops after scan_limit keys (None to walk everything). In that
+        case item count is estimated by probing random keys, so that huge
+        namespaces can be profiled in seconds.
+
+        :param sample_size:     int, number of items to inspect
+        :param scan_limit:      int, maximum keys to scan or None
+        :param top_tags:        int, number of largest tags to report
+        :param batch_size:      int, keys per scan round trip
+        :param probes:          int, random keys to probe when estimating
+        :return:                dict
+        """
+        redis = self.get_redis()
+        reservoir = stats.Reservoir(sample_size)
+        largest_tags = []
+        counts = dict(items=0, tags=0, buckets=0, service=0)
+
+        scanned = 0
+        complete = True
+        for batch in self.scan(batch_size=batch_size):
+            tag_keys = []
+            for key in batch:
+                if self.is_service_key(key):
+                    counts['service'] += 1
+                elif key.startswith(self.tag_prefix):
+                    counts['tags'] += 1
+                    tag_keys.append(key)
+                elif key.startswith(self.bucket_prefix):
+                    counts['buckets'] += 1
+                else:
+                    counts['items'] += 1
+                    reservoir.add(key)
+
+            # measure tags
+            if tag_keys and top_tags:
+                pipe = redis.pipeline()
+                for key in tag_keys:
+                    pipe.scard(key)
+                for key, size in zip(tag_keys, pipe.execute()):
+                    tag = key[len(self.tag_prefix):]
+                    entry = (size, tag)
+                    if len(largest_tags) < top_tags:
+                        heapq.heappush(largest_tags, entry)
+                    elif entry > largest_tags[0]:
+                        heapq.heapreplace(largest_tags, entry)
+
+            scanned += len(batch)
+            if scan_limit and scanned >= scan_limit:
+                complete = False
+                break
+
+        # estimate item count
+        count = counts['items']
+        items = dict(count=count, low=count, high=count)
+        if not complete:
+            items = self.estimate_item_count(probes, counts['items'])
+
+        # inspect sample
+        sample = reservoir.items
+        pipe = redis.pipeline(transaction=False)
+        for key in sample:
+            pipe.type(key)
+            pipe.ttl(key)
+            pipe.execute_command('MEMORY USAGE', key)
+        inspected = pipe.execute(raise_on_error=False)
+
+        types = dict()
+        ttls = []
+        memory = []
+        pipe = redis.pipeline(transaction=False)
+        for index, key in enumerate(sample):
+            key_type, ttl, usage = inspected[index * 3:index * 3 + 3]
+            types[key_type] = types.get(key_type, 0) + 1
+            ttls.append(ttl if isinstance(ttl, int) else None)
+            memory.append(usage if isinstance(usage, int) else None)
+            if key_type == 'hash':
+                pipe.hstrlen(key, 'data')
+            else:
+                pipe.strlen(key)
+        sizes = [
+            size if isinstance(size, int) else None
+            for size in pipe.execute(raise_on_error=False)
+        ]
+
+        return dict(
+            namespace=self.namespace,
+            complete=complete,
+            scanned=scanned,
+            items=items,
+            tags=counts['tags'],
+            buckets=counts['buckets'],
+            service=counts['service'],
+            types=types,
+            memory=stats.estimate(memory, items['count']),
+            memory_histogram=stats.size_histogram(memory),
+            value_size=stats.estimate(sizes, items['count']),
+            value_size_histogram=stats.size_histogram(sizes),
+            ttl_histogram=stats.ttl_histogram(ttls),
+            top_tags=[
+                dict(tag=tag, items=size)
+                for size, tag in sorted(largest_tags, reverse=True)
+            ],
+        )
+
+    def estimate_item_count(self, probes=1000, seen=0):
+        """
+        Estimate item count
+        Estimates number of items in namespace by probing random keys of
+        the database and scaling proportion of namespace items by database
+        size. Lower bound is never less than number of items already seen.
+
+        :param probes:          int, random keys to probe
+        :param seen:            int, items known to exist
+        :return:                dict with count, low and high estimates
+        """
+        redis = self.get_redis()
+        pipe = redis.pipeline()
+        pipe.dbsize()
+        for _ in range(probes):
+            pipe.randomkey()
+        result = pipe.execute()
+
+        size, keys = result[0], result[1:]
+        hits = 0
+        for key in keys:
+            if not key or not key.startswith(self.item_prefix):
+                continue
+            if self.is_service_key(key) or key.startswith(self.tag_prefix):
+                continue
+            if key.startswith(self.bucket_prefix):
+                continue
+            hits += 1
+
+        share, low, high = stats.proportion(hits, len(keys))
+        return dict(
+            count=max(seen, int(share * size)),
+            low=max(seen, int(low * size)),
+            high=max(seen, int(high * size))
+        )
+
     def collect_garbage(self):
         """
         Collect garbage
@@ -441,19 +2923,50 @@ class Redis:
         return True
 
 
+def to_base36(number):
+    """
+    To base 36
+    Formats non-negative integer in base 36 (digits and lowercase letters)
 
+    :param number:              int
+    :return:                    string
+    """
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    result = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        result = digits[remainder] + result
+        if not number:
+            return result
 
 
+class InstrumentedRedis(StrictRedis):
+    """
+    Instrumented redis
+    Redis client reporting every request to hooks of the operation in
+    progress (see hooks.count_round_trip()).
+    """
 
+    def execute_command(self, *args, **options):
+        hooks.count_round_trip()
+        return super().execute_command(*args, **options)
 
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint
+        )
 
 
+class InstrumentedPipeline(Pipeline):
+    """
+    Instrumented pipeline
+    Pipeline reporting every execution as a single request of as many
+    commands as were queued.
+    """
 
-
-
-
-
-
-
-
-
+    def execute(self, raise_on_error=True):
+        hooks.count_round_trip(len(self.command_stack))
+        return super().execute(raise_on_error)
@@ -0,0 +1,1000 @@
+import fcntl
+import fnmatch
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from shiftmemory import exceptions, times
+
+
+class Shared:
+    """
+    Shared memory adapter
+    Implements cache shared by all processes on a single host. Items are
+    stored in a memory-mapped file (under /dev/shm by default) organized as
+    a fixed-slot hash table, so memory is not multiplied by the number of
+    worker processes and no network round trip is required.
+
+    Every key maps to a shard and a home slot within that shard. Items are
+    placed within a small probe window after their home slot. When the window
+    is full an item is evicted CLOCK-style: slots that were read since last
+    pass get a second chance, others get replaced.
+
+    Reads are lock-free and protected by a per-slot sequence counter
+    (seqlock): writer makes sequence odd while updating a slot and even once
+    done, and reader retries if sequence was odd or changed while reading.
+    Writers take per-shard lock (thread lock and fcntl range lock to exclude
+    other processes).
+
+    Several namespaces can share a file: keys and tags are stored prefixed
+    with namespace, and tag lookups and dropping namespace only see items
+    of the namespace.
+
+    Tags are supported through a tag index stored in the same file after
+    item slots. Each tag slot keeps a bitmap of item slots carrying the tag,
+    which is validated against slot contents on read. If tag index overflows
+    tag lookups fall back to scanning all slots.
+    """
+
+    magic = b'SHMEM001'
+
+    # magic, slots, slot size, shards, probe, tag slots, overflow flag
+    header = struct.Struct('<8sIIIIII')
+    header_size = 64
+
+    # seq, state, ref, flags, reserved, hash, expires, key, tags, value len
+    slot_header = struct.Struct('<IBBBBQdIII')
+
+    # seq, state, reserved, hash, name length
+    tag_header = struct.Struct('<IB3xQH')
+    tag_name_size = 128
+
+    EMPTY = 0
+    USED = 1
+    DELETED = 2
+
+    BYTES = 1
+
+    def __init__(self, namespace, ttl=60, **config):
+        """
+        Create adapter
+        Instantiates adapter with namespace, default ttl and optional
+        storage configuration parameters. Processes using the same file
+        must use the same table geometry.
+
+        :param namespace:           namespace name
+        :param ttl:                 default ttl for all items (default=60)
+        :param config:              storage config (falls back to defaults)
+        :return:                    None
+        """
+        self.ttl = ttl
+        self.namespace = namespace
+        self.prefix = namespace + '::'
+        self.config = None
+
+        self.fd = None
+        self.map = None
+        self.locks = None
+        self.tag_lock = None
+
+        # get storage config
+        storage_config = config
+        if 'config' in storage_config:
+            storage_config = storage_config['config']
+
+        self.configure(storage_config)
+        self.open()
+
+    def configure(self, config=None):
+        """
+        Configure
+        Configures an adapter with optional config. If no config provided
+        or it misses some settings, defaults will be used. Number of slots
+        gets rounded up so that every shard has a multiple of 8 slots.
+
+        :param config:          config dictionary
+        :return:                None
+        """
+        default_config = dict(
+            path=None,
+            slots=4096,
+            slot_size=1024,
+            shards=64,
+            probe=8,
+            tag_slots=1024,
+        )
+
+        if config is None: config = dict()
+        self.config = dict(list(default_config.items()) + list(config.items()))
+
+        if not self.config['path']:
+            directory = '/dev/shm'
+            if not os.path.isdir(directory):
+                directory = tempfile.gettempdir()
+            filename = 'shiftmemory-{}.cache'.format(self.namespace)
+            self.config['path'] = os.path.join(directory, filename)
+
+        shards = self.config['shards']
+        per_shard = -(-self.config['slots'] // shards)
+        per_shard = max(8, -(-per_shard // 8) * 8)
+        self.config['slots'] = per_shard * shards
+
+        self.shard_slots = per_shard
+        self.probe = min(self.config['probe'], per_shard)
+        self.slot_size = self.config['slot_size']
+        self.tag_bitmap_size = self.config['slots'] // 8
+        self.tag_slot_size = self.tag_header.size + self.tag_name_size
+        self.tag_slot_size += self.tag_bitmap_size
+
+        if self.slot_size <= self.slot_header.size:
+            error = 'Slot size must be greater than {} bytes'
+            error = error.format(self.slot_header.size)
+            raise exceptions.ConfigurationException(error)
+
+        self.slots_offset = self.header_size
+        self.tags_offset = self.slots_offset
+        self.tags_offset += self.config['slots'] * self.slot_size
+        self.size = self.tags_offset
+        self.size += self.config['tag_slots'] * self.tag_slot_size
+
+    def open(self):
+        """
+        Open
+        Opens or creates storage file and maps it into memory. File is
+        initialized by whichever process gets there first, others validate
+        its geometry.
+
+        :return:                None
+        """
+        if self.map:
+            return
+
+        config = self.config
+        self.fd = os.open(config['path'], os.O_RDWR | os.O_CREAT, 0o600)
+        self.locks = [threading.Lock() for _ in range(config['shards'])]
+        self.tag_lock = threading.Lock()
+
+        # lock offsets: 0 init, 1..shards for shards, then tag index
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, 0)
+        try:
+            if os.fstat(self.fd).st_size == 0:
+                os.ftruncate(self.fd, self.size)
+                self.map = mmap.mmap(self.fd, self.size)
+                self.map[0:self.header.size] = self.header.pack(
+                    self.magic,
+                    config['slots'],
+                    self.slot_size,
+                    config['shards'],
+                    self.probe,
+                    config['tag_slots'],
+                    0
+                )
+            else:
+                self.map = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+                self.validate_header()
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, 0)
+
+    def validate_header(self):
+        """
+        Validate header
+        Checks that existing storage file was created with the same table
+        geometry and raises configuration exception otherwise.
+
+        :return:                None
+        """
+        header = self.header.unpack_from(self.map, 0)
+        expected = (
+            self.magic,
+            self.config['slots'],
+            self.slot_size,
+            self.config['shards'],
+            self.probe,
+            self.config['tag_slots'],
+        )
+        if header[:6] != expected or len(self.map) != self.size:
+            error = 'Shared cache file [{}] has different layout'
+            error = error.format(self.config['path'])
+            raise exceptions.ConfigurationException(error)
+
+    def close(self):
+        """
+        Close
+        Unmaps storage file and closes its descriptor. Data stays in the file
+        for other processes.
+
+        :return:                None
+        """
+        if self.map:
+            self.map.close()
+            self.map = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # -------------------------------------------------------------------------
+    # Locking
+    # -------------------------------------------------------------------------
+
+    def lock_shard(self, shard):
+        """
+        Lock shard
+        Acquires shard lock for this thread and process.
+
+        :param shard:           int, shard number
+        :return:                None
+        """
+        self.locks[shard].acquire()
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, 1 + shard)
+
+    def unlock_shard(self, shard):
+        """
+        Unlock shard
+        Releases previously acquired shard lock.
+
+        :param shard:           int, shard number
+        :return:                None
+        """
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, 1 + shard)
+        self.locks[shard].release()
+
+    def lock_tags(self):
+        """
+        Lock tags
+        Acquires tag index lock. Must be acquired after shard locks.
+
+        :return:                None
+        """
+        self.tag_lock.acquire()
+        offset = 1 + self.config['shards']
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, offset)
+
+    def unlock_tags(self):
+        """
+        Unlock tags
+        Releases tag index lock.
+
+        :return:                None
+        """
+        offset = 1 + self.config['shards']
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, offset)
+        self.tag_lock.release()
+
+    # -------------------------------------------------------------------------
+    # Slots
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def hash(value):
+        """
+        Hash
+        Returns 64 bit hash of the given string or bytes.
+
+        :param value:           str or bytes
+        :return:                int
+        """
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        digest = hashlib.blake2b(value, digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def get_slots(self, key_hash):
+        """
+        Get slots
+        Returns shard and a list of probe window slot numbers for the key.
+
+        :param key_hash:        int, key hash
+        :return:                tuple, shard and list of slots
+        """
+        shards = self.config['shards']
+        shard = key_hash % shards
+        base = shard * self.shard_slots
+        home = (key_hash // shards) % self.shard_slots
+        slots = [
+            base + (home + i) % self.shard_slots for i in range(self.probe)
+        ]
+        return shard, slots
+
+    def slot_offset(self, slot):
+        """
+        Slot offset
+        Returns offset of the slot in storage file.
+
+        :param slot:            int, slot number
+        :return:                int
+        """
+        return self.slots_offset + slot * self.slot_size
+
+    def read_slot(self, slot, key_hash=None, retries=100):
+        """
+        Read slot
+        Reads consistent slot snapshot without locking. Returns a tuple of
+        slot header and offset of its data. If key hash is provided slots
+        holding other keys are skipped early.
+
+        :param slot:            int, slot number
+        :param key_hash:        int, optional key hash to match
+        :param retries:         int, attempts to get consistent snapshot
+        :return:                tuple (header, data bytes) or None
+        """
+        offset = self.slot_offset(slot)
+        unpack = self.slot_header.unpack_from
+        for _ in range(retries):
+            header = unpack(self.map, offset)
+            seq, state = header[0], header[1]
+            if seq & 1:
+                continue
+            if state != self.USED:
+                return
+            if key_hash is not None and header[5] != key_hash:
+                return
+
+            length = header[7] + header[8] + header[9]
+            start = offset + self.slot_header.size
+            data = self.map[start:start + length]
+
+            if unpack(self.map, offset)[0] == seq:
+                return header, data
+
+        return
+
+    def find(self, key):
+        """
+        Find
+        Looks up live (not expired) item by key. Returns slot number, slot
+        header and data or None if item is missing.
+
+        :param key:             string, item key
+        :return:                tuple (slot, header, data) or None
+        """
+        encoded = (self.prefix + key).encode('utf-8')
+        key_hash = self.hash(encoded)
+        now = time.time()
+        for slot in self.get_slots(key_hash)[1]:
+            snapshot = self.read_slot(slot, key_hash)
+            if not snapshot:
+                continue
+
+            header, data = snapshot
+            if data[:header[7]] != encoded or header[6] <= now:
+                continue
+
+            return slot, header, data
+
+    def write_slot(self, slot, key_hash, expires, key, tags, value, flags):
+        """
+        Write slot
+        Writes item into the slot. Must be called with shard lock held.
+
+        :param slot:            int, slot number
+        :param key_hash:        int, key hash
+        :param expires:         float, expiration timestamp
+        :param key:             bytes, item key
+        :param tags:            bytes, comma separated tags
+        :param value:           bytes, item data
+        :param flags:           int, value flags
+        :return:                None
+        """
+        offset = self.slot_offset(slot)
+        seq = struct.unpack_from('<I', self.map, offset)[0]
+        struct.pack_into('<I', self.map, offset, (seq + 1) | 1)
+
+        start = offset + self.slot_header.size
+        data = key + tags + value
+        self.map[start:start + len(data)] = data
+        self.slot_header.pack_into(
+            self.map,
+            offset,
+            (seq | 1) + 1,
+            self.USED,
+            1,
+            flags,
+            0,
+            key_hash,
+            expires,
+            len(key),
+            len(tags),
+            len(value)
+        )
+
+    def clear_slot(self, slot):
+        """
+        Clear slot
+        Marks slot as empty. Must be called with shard lock held.
+
+        :param slot:            int, slot number
+        :return:                None
+        """
+        offset = self.slot_offset(slot)
+        seq = struct.unpack_from('<I', self.map, offset)[0]
+        struct.pack_into('<I', self.map, offset, (seq + 1) | 1)
+        struct.pack_into('<B', self.map, offset + 4, self.EMPTY)
+        struct.pack_into('<I', self.map, offset, (seq | 1) + 1)
+
+    def choose_slot(self, slots, key_hash, encoded):
+        """
+        Choose slot
+        Picks slot to write item to from probe window: slot already holding
+        the key, then empty or expired slot, otherwise evicts CLOCK-style
+        giving recently read slots a second chance. Must be called with
+        shard lock held.
+
+        :param slots:           list, probe window slots
+        :param key_hash:        int, key hash
+        :param encoded:         bytes, item key
+        :return:                int, slot number
+        """
+        now = time.time()
+        free = None
+        for slot in slots:
+            offset = self.slot_offset(slot)
+            header = self.slot_header.unpack_from(self.map, offset)
+            if header[1] != self.USED or header[6] <= now:
+                if free is None:
+                    free = slot
+                continue
+
+            if header[5] == key_hash:
+                start = offset + self.slot_header.size
+                if self.map[start:start + header[7]] == encoded:
+                    return slot
+
+        if free is not None:
+            return free
+
+        # second chance
+        for _ in range(2):
+            for slot in slots:
+                ref_offset = self.slot_offset(slot) + 5
+                if self.map[ref_offset]:
+                    self.map[ref_offset] = 0
+                    continue
+                return slot
+
+        return slots[0]
+
+    # -------------------------------------------------------------------------
+    # Caching
+    # -------------------------------------------------------------------------
+
+    def exists(self, key):
+        """
+        Item exists?
+        Checks item existence by the given key to return a boolean result
+
+        :param key:             string, item key
+        :return:                bool
+        """
+        return self.find(key) is not None
+
+    def set(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        """
+        Set item
+        Creates or updates an item. Can optionally accept an iterable
+        of tags to add to item and either ttl or expiration date for custom
+        item expiration, otherwise falls back to default adapter ttl.
+        Returns false if item does not fit into a slot.
+
+        :param key:             string, cache key
+        :param value:           string or bytes, data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        return self.write(key, value, tags, ttl, expires_at)
+
+    def add(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        """
+        Add
+        Similar to set item but only saves an item if it does not exist yet.
+        Will return false in case in does. Check and write are atomic.
+
+        :param key:             string, cache key
+        :param value:           string or bytes, data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        return self.write(key, value, tags, ttl, expires_at, only_new=True)
+
+    def write(self, key, value, tags, ttl, expires_at, only_new=False):
+        """
+        Write
+        Stores an item under shard lock and updates tag index.
+
+        :param key:             string, cache key
+        :param value:           string or bytes, data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :param only_new:        bool, skip existing items
+        :return:                bool
+        """
+        if expires_at:
+            ttl = times.ttl_from_expiration(expires_at)
+        if not ttl:
+            ttl = self.ttl
+
+        flags = 0
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        else:
+            flags |= self.BYTES
+            value = bytes(value)
+
+        tags = [self.prefix + tag for tag in tags] if tags else []
+        encoded = (self.prefix + key).encode('utf-8')
+        tag_string = ','.join(tags).encode('utf-8')
+        size = self.slot_header.size + len(encoded) + len(tag_string)
+        if size + len(value) > self.slot_size:
+            return False
+
+        key_hash = self.hash(encoded)
+        shard, slots = self.get_slots(key_hash)
+        self.lock_shard(shard)
+        try:
+            if only_new and self.find(key):
+                return False
+
+            slot = self.choose_slot(slots, key_hash, encoded)
+            previous = self.read_slot(slot)
+            expires = time.time() + ttl
+            self.write_slot(
+                slot, key_hash, expires, encoded, tag_string, value, flags
+            )
+
+            # update tag index
+            old_tags = self.slot_tags(previous) if previous else []
+            if old_tags or tags:
+                self.lock_tags()
+                try:
+                    for tag in old_tags:
+                        if tag not in tags:
+                            self.index_tag(tag, slot, False)
+                    for tag in tags:
+                        self.index_tag(tag, slot, True)
+                finally:
+                    self.unlock_tags()
+        finally:
+            self.unlock_shard(shard)
+
+        return True
+
+    def get(self, key=None):
+        """
+        Get
+        Get single item by key.
+
+        :param key:             item key
+        :return:                string, bytes or None
+        """
+        found = self.find(key)
+        if not found:
+            return
+
+        slot, header, data = found
+        self.map[self.slot_offset(slot) + 5] = 1
+        value = data[header[7] + header[8]:]
+        if header[3] & self.BYTES:
+            return value
+        return value.decode('utf-8')
+
+    def get_view(self, key):
+        """
+        Get view
+        Returns zero-copy memoryview of item data in shared memory. The view
+        is only guaranteed to be consistent until next write to the same
+        slot, so consume it immediately or use get() instead.
+
+        :param key:             item key
+        :return:                memoryview or None
+        """
+        found = self.find(key)
+        if not found:
+            return
+
+        slot, header, data = found
+        start = self.slot_offset(slot) + self.slot_header.size
+        start += header[7] + header[8]
+        self.map[self.slot_offset(slot) + 5] = 1
+        return memoryview(self.map)[start:start + header[9]]
+
+    def delete(self, key=None, *, tags=None, disjunction=False):
+        """
+        Delete
+        Removes an item by key or several items marked with tags.
+        If disjunction is False (default) all tags must match
+        otherwise any tag can match.
+
+        :param key:             int, item key
+        :param tags:            Iterable, tags to fetch by
+        :return:                bool
+        """
+        if key:
+            return self.delete_item(key)
+
+        keys = None
+        for tag in tags:
+            tagged = self.get_tagged_items(tag)
+            if keys is None:
+                keys = tagged
+            elif disjunction:
+                keys |= tagged
+            else:
+                keys &= tagged
+
+        if not keys:
+            return False
+
+        for item_key in keys:
+            self.delete_item(item_key)
+
+        return True
+
+    def delete_item(self, key):
+        """
+        Delete item
+        Removes single item by key and drops it from tag index.
+
+        :param key:             string, item key
+        :return:                bool
+        """
+        encoded = (self.prefix + key).encode('utf-8')
+        key_hash = self.hash(encoded)
+        shard, slots = self.get_slots(key_hash)
+        deleted = False
+        self.lock_shard(shard)
+        try:
+            for slot in slots:
+                snapshot = self.read_slot(slot, key_hash)
+                if not snapshot or snapshot[1][:snapshot[0][7]] != encoded:
+                    continue
+
+                self.clear_slot(slot)
+                deleted = True
+                tags = self.slot_tags(snapshot)
+                if tags:
+                    self.lock_tags()
+                    try:
+                        for tag in tags:
+                            self.index_tag(tag, slot, False)
+                    finally:
+                        self.unlock_tags()
+        finally:
+            self.unlock_shard(shard)
+
+        return deleted
+
+    def delete_all(self):
+        """
+        Delete all
+        Removes all items of the namespace and drops them from tag index.
+        Items of other namespaces sharing the file are kept.
+
+        :return:                bool
+        """
+        prefix = self.prefix.encode('utf-8')
+        shards = range(self.config['shards'])
+        for shard in shards:
+            self.lock_shard(shard)
+        self.lock_tags()
+        try:
+            for slot in range(self.config['slots']):
+                snapshot = self.read_slot(slot)
+                if not snapshot:
+                    continue
+                header, data = snapshot
+                if not data[:header[7]].startswith(prefix):
+                    continue
+
+                self.clear_slot(slot)
+                for tag in self.slot_tags(snapshot):
+                    self.index_tag(tag, slot, False)
+        finally:
+            self.unlock_tags()
+            for shard in shards:
+                self.unlock_shard(shard)
+
+        return True
+
+    def iter_items(self, match=None, *, tag=None, batch_size=1000):
+        """
+        Iter items
+        Lazily walks all slots without locking and yields live items,
+        optionally only the ones with keys matching pattern or marked with
+        a tag, as (key, value, ttl, tags) records with ttl in milliseconds.
+        Items written during the walk may or may not be seen.
+
+        :param match:           string, optional key pattern
+        :param tag:             string, optional tag
+        :param batch_size:      int, slots per batch
+        :return:                generator of tuples
+        """
+        slots = self.config['slots']
+        for start in range(0, slots, batch_size):
+            records = []
+            now = time.time()
+            for slot in range(start, min(start + batch_size, slots)):
+                snapshot = self.read_slot(slot)
+                if not snapshot or snapshot[0][6] <= now:
+                    continue
+
+                header, data = snapshot
+                key = data[:header[7]].decode('utf-8')
+                if not key.startswith(self.prefix):
+                    continue
+
+                key = key[len(self.prefix):]
+                tags = self.get_slot_tags(snapshot)
+                if tag is not None and tag not in tags:
+                    continue
+                if match and not fnmatch.fnmatchcase(key, match):
+                    continue
+
+                value = data[header[7] + header[8]:]
+                if not header[3] & self.BYTES:
+                    value = value.decode('utf-8')
+                ttl = max(1, int((header[6] - now) * 1000))
+                records.append((key, value, ttl, tags or None))
+
+            yield from records
+
+    # -------------------------------------------------------------------------
+    # Tags
+    # -------------------------------------------------------------------------
+
+    def slot_tags(self, snapshot):
+        """
+        Slot tags
+        Returns list of tags from slot snapshot as stored (prefixed with
+        namespace), which is how they are named in tag index.
+
+        :param snapshot:        tuple, slot header and data
+        :return:                list
+        """
+        header, data = snapshot
+        tags = data[header[7]:header[7] + header[8]]
+        if not tags:
+            return []
+        return tags.decode('utf-8').split(',')
+
+    def get_slot_tags(self, snapshot):
+        """
+        Get slot tags
+        Returns list of tags from slot snapshot of namespace item without
+        namespace prefix.
+
+        :param snapshot:        tuple, slot header and data
+        :return:                list
+        """
+        offset = len(self.prefix)
+        return [tag[offset:] for tag in self.slot_tags(snapshot)]
+
+    def tag_offset(self, tag_slot):
+        """
+        Tag offset
+        Returns offset of tag slot in storage file.
+
+        :param tag_slot:        int, tag slot number
+        :return:                int
+        """
+        return self.tags_offset + tag_slot * self.tag_slot_size
+
+    def find_tag(self, tag, create=False):
+        """
+        Find tag
+        Returns tag slot number of the tag in tag index. Optionally allocates
+        a tag slot if missing, in which case tag lock must be held.
+
+        :param tag:             string, tag
+        :param create:          bool, allocate tag slot if missing
+        :return:                int or None
+        """
+        encoded = tag.encode('utf-8')
+        if len(encoded) > self.tag_name_size:
+            if create:
+                self.set_overflow(True)
+            return
+
+        tag_hash = self.hash(encoded)
+        tag_slots = self.config['tag_slots']
+        home = tag_hash % tag_slots
+        free = None
+        for i in range(tag_slots):
+            tag_slot = (home + i) % tag_slots
+            offset = self.tag_offset(tag_slot)
+            _, state, found_hash, length = self.tag_header.unpack_from(
+                self.map, offset
+            )
+            if state == self.EMPTY:
+                if free is None:
+                    free = tag_slot
+                break
+            if state == self.DELETED:
+                if free is None:
+                    free = tag_slot
+                continue
+
+            start = offset + self.tag_header.size
+            if found_hash == tag_hash:
+                if self.map[start:start + length] == encoded:
+                    return tag_slot
+
+        if not create:
+            return
+        if free is None:
+            self.set_overflow(True)
+            return
+
+        offset = self.tag_offset(free)
+        start = offset + self.tag_header.size
+        self.map[start:start + len(encoded)] = encoded
+        self.tag_header.pack_into(
+            self.map, offset, 0, self.USED, tag_hash, len(encoded)
+        )
+        return free
+
+    def index_tag(self, tag, slot, present):
+        """
+        Index tag
+        Sets or clears item slot bit in tag bitmap. Must be called with both
+        shard and tag locks held.
+
+        :param tag:             string, tag
+        :param slot:            int, item slot number
+        :param present:         bool, whether slot carries the tag
+        :return:                None
+        """
+        tag_slot = self.find_tag(tag, create=present)
+        if tag_slot is None:
+            return
+
+        bitmap = self.tag_offset(tag_slot) + self.tag_header.size
+        bitmap += self.tag_name_size
+        position = bitmap + slot // 8
+        mask = 1 << (slot % 8)
+        if present:
+            self.map[position] |= mask
+        else:
+            self.map[position] &= ~mask & 0xFF
+
+    def set_overflow(self, overflow):
+        """
+        Set overflow
+        Marks tag index as overflown, so that lookups fall back to scanning.
+
+        :param overflow:        bool
+        :return:                None
+        """
+        struct.pack_into('<I', self.map, self.header.size - 4, int(overflow))
+
+    def is_overflown(self):
+        """
+        Is overflown?
+        Checks whether some tags did not fit into tag index.
+
+        :return:                bool
+        """
+        offset = self.header.size - 4
+        return bool(struct.unpack_from('<I', self.map, offset)[0])
+
+    def get_tagged_items(self, tag):
+        """
+        Get tagged items
+        Returns a set of item keys marked with the given tag.
+
+        :param tag: string, tag
+        :return: set
+        """
+        name = self.prefix + tag
+        tag_slot = self.find_tag(name)
+        if tag_slot is None:
+            if not self.is_overflown():
+                return set()
+            slots = range(self.config['slots'])
+        else:
+            slots = self.tag_bitmap_slots(tag_slot)
+
+        now = time.time()
+        keys = set()
+        for slot in slots:
+            snapshot = self.read_slot(slot)
+            if not snapshot or snapshot[0][6] <= now:
+                continue
+            if name not in self.slot_tags(snapshot):
+                continue
+
+            header, data = snapshot
+            key = data[:header[7]].decode('utf-8')
+            if key.startswith(self.prefix):
+                keys.add(key[len(self.prefix):])
+
+        return keys
+
+    def tag_bitmap_slots(self, tag_slot):
+        """
+        Tag bitmap slots
+        Returns item slot numbers marked in tag bitmap.
+
+        :param tag_slot:        int, tag slot number
+        :return:                list
+        """
+        start = self.tag_offset(tag_slot) + self.tag_header.size
+        start += self.tag_name_size
+        bitmap = self.map[start:start + self.tag_bitmap_size]
+        slots = []
+        for index, byte in enumerate(bitmap):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    slots.append(index * 8 + bit)
+        return slots
+
+    def get_item_tags(self, key):
+        """
+        Get item tags
+        Returns a list of items tags by item key
+
+        :param key: string, item key
+        :return: list | None
+        """
+        found = self.find(key)
+        if not found:
+            return
+
+        tags = self.get_slot_tags(found[1:])
+        return tags or None
+
+    # -------------------------------------------------------------------------
+    # Optimizing
+    # -------------------------------------------------------------------------
+
+    def optimize(self):
+        """
+        Optimize
+        Clears expired slots, removes stale bits from tag bitmaps and frees
+        tags that mark no items.
+
+        :return: bool
+        """
+        now = time.time()
+        for shard in range(self.config['shards']):
+            self.lock_shard(shard)
+            try:
+                base = shard * self.shard_slots
+                for slot in range(base, base + self.shard_slots):
+                    snapshot = self.read_slot(slot)
+                    if snapshot and snapshot[0][6] <= now:
+                        self.clear_slot(slot)
+            finally:
+                self.unlock_shard(shard)
+
+        self.lock_tags()
+        try:
+            for tag_slot in range(self.config['tag_slots']):
+                offset = self.tag_offset(tag_slot)
+                _, state, _, length = self.tag_header.unpack_from(
+                    self.map, offset
+                )
+                if state != self.USED:
+                    continue
+
+                start = offset + self.tag_header.size
+                tag = self.map[start:start + length].decode('utf-8')
+                for slot in self.tag_bitmap_slots(tag_slot):
+                    snapshot = self.read_slot(slot)
+                    if not snapshot or tag not in self.slot_tags(snapshot):
+                        self.index_tag(tag, slot, False)
+
+                if not self.tag_bitmap_slots(tag_slot):
+                    struct.pack_into('<B', self.map, offset + 4, self.DELETED)
+        finally:
+            self.unlock_tags()
+
+        return True
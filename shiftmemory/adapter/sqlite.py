@@ -0,0 +1,607 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from shiftmemory import times
+
+
+class Sqlite:
+    """
+    SQLite adapter
+    Implements persistent cache on local disk for large items that don't
+    belong in memory but are still expensive to recompute. Several
+    namespaces can share single database file.
+
+    Database runs in WAL mode so that readers do not block writers. Items
+    are indexed by expiration date, which makes optimization a single range
+    delete. When maximum namespace size is configured least recently used
+    items are evicted after writes. Large items can be read in chunks with
+    stream() without loading the whole value into memory.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS items (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value BLOB,
+            is_bytes INTEGER NOT NULL DEFAULT 0,
+            tags TEXT,
+            expires REAL NOT NULL,
+            size INTEGER NOT NULL,
+            accessed REAL NOT NULL,
+            UNIQUE (namespace, key)
+        );
+        CREATE INDEX IF NOT EXISTS items_expires
+            ON items (namespace, expires);
+        CREATE INDEX IF NOT EXISTS items_accessed
+            ON items (namespace, accessed);
+
+        CREATE TABLE IF NOT EXISTS tags (
+            namespace TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (namespace, tag, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS tags_key ON tags (namespace, key);
+
+        CREATE TABLE IF NOT EXISTS usage (
+            namespace TEXT PRIMARY KEY,
+            size INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TRIGGER IF NOT EXISTS items_insert AFTER INSERT ON items
+        BEGIN
+            INSERT OR IGNORE INTO usage (namespace, size)
+                VALUES (new.namespace, 0);
+            UPDATE usage SET size = size + new.size
+                WHERE namespace = new.namespace;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS items_update AFTER UPDATE OF size ON items
+        BEGIN
+            UPDATE usage SET size = size - old.size + new.size
+                WHERE namespace = new.namespace;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS items_delete AFTER DELETE ON items
+        BEGIN
+            UPDATE usage SET size = size - old.size
+                WHERE namespace = old.namespace;
+            DELETE FROM tags
+                WHERE namespace = old.namespace AND key = old.key;
+        END;
+    """
+
+    def __init__(self, namespace, ttl=60, **config):
+        """
+        Create adapter
+        Instantiates adapter with namespace, default ttl and optional
+        storage configuration parameters
+
+        :param namespace:           namespace name
+        :param ttl:                 default ttl for all items (default=60)
+        :param config:              storage config (falls back to defaults)
+        :return:                    None
+        """
+        self.ttl = ttl
+        self.namespace = namespace
+        self.config = None
+        self.local = threading.local()
+
+        # get storage config
+        storage_config = config
+        if 'config' in storage_config:
+            storage_config = storage_config['config']
+
+        self.configure(storage_config)
+        self.get_connection().executescript(self.schema)
+
+    def configure(self, config=None):
+        """
+        Configure
+        Configures an adapter with optional config. If no config provided
+        or it misses some settings, defaults will be used.
+
+        :param config:          config dictionary
+        :return:                None
+        """
+        default_config = dict(
+            path=os.path.join(tempfile.gettempdir(), 'shiftmemory.sqlite'),
+            max_size=None,
+            chunk_size=65536,
+            touch_after=1,
+            timeout=10,
+        )
+
+        if config is None: config = dict()
+        self.config = dict(list(default_config.items()) + list(config.items()))
+
+    def get_connection(self):
+        """
+        Get connection
+        Returns database connection for current thread. Creates one if
+        necessary and switches database to WAL mode.
+
+        :return:                sqlite3.Connection
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.config['path'],
+                timeout=self.config['timeout'],
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.depth = 0
+
+        return connection
+
+    @contextmanager
+    def batch(self):
+        """
+        Batch
+        Context manager that runs all writes inside it in a single
+        transaction. Batches can be nested, outermost one commits.
+
+        :return:                sqlite3.Connection
+        """
+        connection = self.get_connection()
+        if self.local.depth == 0:
+            connection.execute('BEGIN IMMEDIATE')
+
+        self.local.depth += 1
+        try:
+            yield connection
+        except BaseException:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                connection.execute('ROLLBACK')
+            raise
+
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            self.evict()
+            connection.execute('COMMIT')
+
+    # -------------------------------------------------------------------------
+    # Caching
+    # -------------------------------------------------------------------------
+
+    def exists(self, key):
+        """
+        Item exists?
+        Checks item existence by the given key to return a boolean result
+
+        :param key:             string, item key
+        :return:                bool
+        """
+        row = self.get_connection().execute(
+            'SELECT 1 FROM items WHERE namespace=? AND key=? AND expires>?',
+            (self.namespace, key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def set(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        """
+        Set item
+        Creates or updates an item. Can optionally accept an iterable
+        of tags to add to item and either ttl or expiration date for custom
+        item expiration, otherwise falls back to default adapter ttl.
+
+        :param key:             string, cache key
+        :param value:           string or bytes, data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        with self.batch():
+            self.write(key, value, tags, ttl, expires_at)
+        return True
+
+    def set_many(self, items, *, tags=None, ttl=None, expires_at=None):
+        """
+        Set many
+        Creates or updates several items in a single transaction. Tags and
+        expiration apply to all items.
+
+        :param items:           dict, data to put by cache key
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        with self.batch():
+            for key, value in items.items():
+                self.write(key, value, tags, ttl, expires_at)
+        return True
+
+    def add(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        """
+        Add
+        Similar to set item but only saves an item if it does not exist yet.
+        Will return false in case in does.
+
+        :param key:             string, cache key
+        :param value:           string or bytes, data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                bool
+        """
+        with self.batch():
+            if self.exists(key):
+                return False
+            self.write(key, value, tags, ttl, expires_at)
+        return True
+
+    def write(self, key, value, tags, ttl, expires_at):
+        """
+        Write
+        Inserts or replaces an item and its tags. Must be called within
+        a batch.
+
+        :param key:             string, cache key
+        :param value:           string or bytes, data to put
+        :param tags:            iterable or None, any tags to add
+        :param ttl:             int, optional custom ttl in seconds
+        :param expires_at:      optional expiration date (utc)
+        :return:                None
+        """
+        if expires_at:
+            ttl = times.ttl_from_expiration(expires_at)
+        if not ttl:
+            ttl = self.ttl
+
+        is_bytes = not isinstance(value, str)
+        value = bytes(value) if is_bytes else value.encode('utf-8')
+        tags = list(tags) if tags else []
+
+        now = time.time()
+        connection = self.get_connection()
+        connection.execute(
+            'DELETE FROM tags WHERE namespace=? AND key=?',
+            (self.namespace, key)
+        )
+        connection.execute(
+            '''
+            INSERT INTO items (
+                namespace, key, value, is_bytes, tags, expires, size, accessed
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (namespace, key) DO UPDATE SET
+                value=excluded.value,
+                is_bytes=excluded.is_bytes,
+                tags=excluded.tags,
+                expires=excluded.expires,
+                size=excluded.size,
+                accessed=excluded.accessed
+            ''',
+            (
+                self.namespace,
+                key,
+                sqlite3.Binary(value),
+                int(is_bytes),
+                ','.join(tags) or None,
+                now + ttl,
+                len(value),
+                now
+            )
+        )
+        connection.executemany(
+            'INSERT OR IGNORE INTO tags (namespace, tag, key) VALUES (?,?,?)',
+            [(self.namespace, tag, key) for tag in tags]
+        )
+
+    def get(self, key=None):
+        """
+        Get
+        Get single item by key.
+
+        :param key:             item key
+        :return:                string, bytes or None
+        """
+        connection = self.get_connection()
+        row = connection.execute(
+            '''
+            SELECT value, is_bytes, expires, accessed FROM items
+            WHERE namespace=? AND key=?
+            ''',
+            (self.namespace, key)
+        ).fetchone()
+
+        now = time.time()
+        if not row or row[2] <= now:
+            return
+
+        self.touch(key, row[3], now)
+        value = bytes(row[0])
+        return value if row[1] else value.decode('utf-8')
+
+    def stream(self, key, chunk_size=None):
+        """
+        Stream
+        Returns a generator reading item data in chunks, so that large items
+        never have to be fully loaded into memory. Yields nothing if item
+        is missing.
+
+        :param key:             item key
+        :param chunk_size:      int, bytes per chunk
+        :return:                generator of bytes
+        """
+        chunk_size = chunk_size or self.config['chunk_size']
+        connection = self.get_connection()
+        row = connection.execute(
+            '''
+            SELECT rowid, size, expires, accessed FROM items
+            WHERE namespace=? AND key=?
+            ''',
+            (self.namespace, key)
+        ).fetchone()
+
+        now = time.time()
+        if not row or row[2] <= now:
+            return
+
+        rowid, size = row[0], row[1]
+        self.touch(key, row[3], now)
+
+        # incremental blob i/o (python >= 3.11)
+        if hasattr(connection, 'blobopen'):
+            blob = connection.blobopen('items', 'value', rowid, readonly=True)
+            try:
+                chunk = blob.read(chunk_size)
+                while chunk:
+                    yield chunk
+                    chunk = blob.read(chunk_size)
+            finally:
+                blob.close()
+            return
+
+        for offset in range(0, size, chunk_size):
+            chunk = connection.execute(
+                'SELECT substr(value, ?, ?) FROM items WHERE rowid=?',
+                (offset + 1, chunk_size, rowid)
+            ).fetchone()
+            if not chunk:
+                return
+            yield bytes(chunk[0])
+
+    def touch(self, key, accessed, now):
+        """
+        Touch
+        Updates item access time used for LRU eviction. To keep reads
+        cheap access time is only updated once per touch_after seconds.
+
+        :param key:             string, item key
+        :param accessed:        float, previous access time
+        :param now:             float, current time
+        :return:                None
+        """
+        if not self.config['max_size']:
+            return
+        if now - accessed < self.config['touch_after']:
+            return
+
+        self.get_connection().execute(
+            'UPDATE items SET accessed=? WHERE namespace=? AND key=?',
+            (now, self.namespace, key)
+        )
+
+    def delete(self, key=None, *, tags=None, disjunction=False):
+        """
+        Delete
+        Removes an item by key or several items marked with tags.
+        If disjunction is False (default) all tags must match
+        otherwise any tag can match.
+
+        :param key:             int, item key
+        :param tags:            Iterable, tags to fetch by
+        :return:                bool
+        """
+        connection = self.get_connection()
+        if key:
+            cursor = connection.execute(
+                'DELETE FROM items WHERE namespace=? AND key=?',
+                (self.namespace, key)
+            )
+            return cursor.rowcount > 0
+        if not tags:
+            return False
+
+        query, params = self.tagged_query(tags, disjunction)
+        query = 'DELETE FROM items WHERE namespace=? AND key IN ({})'.format(
+            query
+        )
+        cursor = connection.execute(query, [self.namespace] + params)
+        return cursor.rowcount > 0
+
+    def tagged_query(self, tags, disjunction=False):
+        """
+        Tagged query
+        Returns subquery selecting keys of items marked with tags and its
+        parameters. If disjunction is False (default) all tags must match
+        otherwise any tag can match.
+
+        :param tags:            Iterable, tags
+        :param disjunction:     bool, match any tag
+        :return:                tuple, sql and list of parameters
+        """
+        tags = list(set(tags))
+        placeholders = ','.join('?' * len(tags))
+        query = 'SELECT key FROM tags WHERE namespace=? AND tag IN ({})'
+        query = query.format(placeholders)
+        params = [self.namespace] + tags
+        if not disjunction:
+            query += ' GROUP BY key HAVING COUNT(*)=?'
+            params.append(len(tags))
+
+        return query, params
+
+    def delete_all(self):
+        """
+        Delete all
+        Removes all cached item stored under current namespace
+
+        :return:                bool
+        """
+        self.get_connection().execute(
+            'DELETE FROM items WHERE namespace=?',
+            (self.namespace,)
+        )
+        return True
+
+    def get_tagged_items(self, tag):
+        """
+        Get tagged items
+        Returns a set of item keys marked with the given tag.
+
+        :param tag: string, tag
+        :return: set
+        """
+        rows = self.get_connection().execute(
+            'SELECT key FROM tags WHERE namespace=? AND tag=?',
+            (self.namespace, tag)
+        )
+        return set(row[0] for row in rows)
+
+    def get_item_tags(self, key):
+        """
+        Get item tags
+        Returns a list of items tags by item key
+
+        :param key: string, item key
+        :return: list | None
+        """
+        row = self.get_connection().execute(
+            'SELECT tags FROM items WHERE namespace=? AND key=?',
+            (self.namespace, key)
+        ).fetchone()
+        if not row or not row[0]:
+            return
+
+        return row[0].split(',')
+
+    def iter_items(self, match=None, *, tag=None, batch_size=1000):
+        """
+        Iter items
+        Lazily walks items stored under current namespace, optionally only
+        the ones with keys matching glob pattern or marked with a tag, and
+        yields (key, value, ttl, tags) records with ttl in milliseconds.
+        Items are paged by key, so every batch is a short index range read
+        and memory use is bounded by batch size.
+
+        :param match:           string, optional key pattern
+        :param tag:             string, optional tag
+        :param batch_size:      int, items per batch
+        :return:                generator of tuples
+        """
+        query = 'SELECT items.key, value, is_bytes, expires, tags FROM items'
+        params = []
+        if tag is not None:
+            query += ' JOIN tags ON tags.namespace=items.namespace'
+            query += ' AND tags.key=items.key AND tags.tag=?'
+            params.append(tag)
+
+        query += ' WHERE items.namespace=? AND items.key>? AND expires>?'
+        if match:
+            query += ' AND items.key GLOB ?'
+        query += ' ORDER BY items.key LIMIT ?'
+
+        last = ''
+        connection = self.get_connection()
+        while True:
+            now = time.time()
+            args = params + [self.namespace, last, now]
+            if match:
+                args.append(match)
+            rows = connection.execute(query, args + [batch_size]).fetchall()
+
+            for key, value, is_bytes, expires, tags in rows:
+                value = bytes(value)
+                if not is_bytes:
+                    value = value.decode('utf-8')
+                ttl = max(1, int((expires - now) * 1000))
+                yield key, value, ttl, tags.split(',') if tags else None
+
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    # -------------------------------------------------------------------------
+    # Optimizing
+    # -------------------------------------------------------------------------
+
+    def get_size(self):
+        """
+        Get size
+        Returns total size of item values stored under current namespace
+
+        :return:                int, bytes
+        """
+        row = self.get_connection().execute(
+            'SELECT size FROM usage WHERE namespace=?',
+            (self.namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def evict(self, batch_size=100):
+        """
+        Evict
+        Removes least recently used items until namespace fits into
+        configured maximum size.
+
+        :param batch_size:      int, items to consider at once
+        :return:                int, number of evicted items
+        """
+        max_size = self.config['max_size']
+        if not max_size:
+            return 0
+
+        evicted = 0
+        connection = self.get_connection()
+        excess = self.get_size() - max_size
+        while excess > 0:
+            rows = connection.execute(
+                '''
+                SELECT rowid, size FROM items WHERE namespace=?
+                ORDER BY accessed LIMIT ?
+                ''',
+                (self.namespace, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+
+            victims = []
+            for rowid, size in rows:
+                victims.append((rowid,))
+                excess -= size
+                if excess <= 0:
+                    break
+
+            connection.executemany('DELETE FROM items WHERE rowid=?', victims)
+            evicted += len(victims)
+
+        return evicted
+
+    def optimize(self):
+        """
+        Optimize
+        Removes expired items with a range delete over expiration index
+        (their tags are removed by trigger), then evicts items over maximum
+        size and checkpoints write-ahead log.
+
+        :return: bool
+        """
+        connection = self.get_connection()
+        with self.batch():
+            connection.execute(
+                'DELETE FROM items WHERE namespace=? AND expires<=?',
+                (self.namespace, time.time())
+            )
+        connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        return True
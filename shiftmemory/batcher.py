@@ -0,0 +1,100 @@
+"""
+Batcher
+Automatic batching of concurrent single key reads. Threads asking for
+different keys at about the same moment are served by one bulk request
+instead of a round trip each.
+"""
+import threading
+
+
+class Batch:
+    """
+    Batch
+    Keys collected within one window and their results.
+    """
+
+    def __init__(self):
+        self.keys = dict()
+        self.results = None
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class Batcher:
+    """
+    Batcher
+    Collects keys requested by concurrent callers into batches. The first
+    caller of a batch waits for the window to pass or the batch to fill up,
+    then loads all keys at once with the loader and hands results over to
+    other callers waiting for the same batch. Duplicate keys are loaded
+    once. Single callers pay the window in added latency.
+    """
+
+    def __init__(self, loader, window=0.0002, max_keys=100):
+        """
+        Create batcher
+        :param loader:          callable, returns dict of results by key
+                                for a list of keys
+        :param window:          float, seconds to collect keys
+        :param max_keys:        int, maximum keys per batch
+        """
+        self.loader = loader
+        self.window = window
+        self.max_keys = max_keys
+        self.batch = None
+        self.lock = threading.Lock()
+        self.counts = dict(requests=0, keys=0, batches=0)
+
+    def load(self, key):
+        """
+        Load
+        Returns result for a single key, loaded together with keys asked
+        for by other callers. Loader errors are raised to every caller of
+        the batch.
+
+        :param key:             string, key
+        :return:                result or None
+        """
+        with self.lock:
+            self.counts['requests'] += 1
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = Batch()
+
+            batch.keys[key] = True
+            if len(batch.keys) >= self.max_keys:
+                self.batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.batch is batch:
+                    self.batch = None
+                self.counts['keys'] += len(batch.keys)
+                self.counts['batches'] += 1
+
+            try:
+                batch.results = self.loader(list(batch.keys))
+            except Exception as error:
+                batch.error = error
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results.get(key)
+
+    def stats(self):
+        """
+        Stats
+        Returns number of requests, distinct keys loaded and batches.
+
+        :return:                dict
+        """
+        with self.lock:
+            return dict(self.counts)
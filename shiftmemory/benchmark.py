@@ -0,0 +1,233 @@
+"""
+Benchmark
+Trace-driven simulation of cache policies. Replays sequences of
+operations against policies of given capacity to compare hit ratios
+without running any cache. Also measures memory taken by redis items
+with and without compact keys and packing.
+
+Traces are iterables of (operation, key) tuples, where operation is one
+of get, set or delete. Gets that miss are followed by a set, as is usual
+for read-through caching.
+"""
+import random
+
+from shiftmemory import policy
+from shiftmemory.adapter import Redis
+
+
+def read_trace(path):
+    """
+    Read trace
+    Reads text trace with one operation per line: either a key (get) or
+    operation and key separated by whitespace. Empty lines and lines
+    starting with # are skipped.
+
+    :param path:                string, trace file path
+    :return:                    generator of tuples
+    """
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            parts = line.split(None, 1)
+            if len(parts) == 1:
+                yield 'get', parts[0]
+            else:
+                yield parts[0].lower(), parts[1]
+
+
+def zipf_trace(
+    requests,
+    keys,
+    skew=1.0,
+    scan_every=None,
+    scan_size=None,
+    seed=None
+):
+    """
+    Zipf trace
+    Generates synthetic get trace with key popularity following Zipf
+    distribution. Optionally injects scans of unique one-off keys that
+    are typical for batch jobs and crawlers.
+
+    :param requests:            int, number of requests
+    :param keys:                int, number of distinct popular keys
+    :param skew:                float, Zipf exponent
+    :param scan_every:          int, requests between scans (None=off)
+    :param scan_size:           int, keys per scan (defaults to keys)
+    :param seed:                optional random seed
+    :return:                    list of tuples
+    """
+    generator = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, keys + 1)]
+    population = ['key{}'.format(rank) for rank in range(keys)]
+    picks = generator.choices(population, weights, k=requests)
+
+    trace = []
+    scans = 0
+    for index, key in enumerate(picks):
+        if scan_every and index and index % scan_every == 0:
+            for scanned in range(scan_size or keys):
+                trace.append(('get', 'scan{}:{}'.format(scans, scanned)))
+            scans += 1
+        trace.append(('get', key))
+
+    return trace
+
+
+def replay(trace, cache_policy):
+    """
+    Replay
+    Runs trace against policy and counts hits and misses of gets.
+
+    :param trace:               iterable of (operation, key) tuples
+    :param cache_policy:        policy instance
+    :return:                    dict
+    """
+    hits = misses = 0
+    for operation, key in trace:
+        if operation == 'delete':
+            cache_policy.remove(key)
+            continue
+
+        if key in cache_policy:
+            cache_policy.access(key)
+            if operation == 'get':
+                hits += 1
+            continue
+
+        if operation == 'get':
+            misses += 1
+        cache_policy.admit(key)
+
+    requests = hits + misses
+    return dict(
+        requests=requests,
+        hits=hits,
+        misses=misses,
+        hit_ratio=hits / requests if requests else 0,
+    )
+
+
+def compare(trace, capacity, policies=('lru', 'lfu', 'tinylfu')):
+    """
+    Compare
+    Replays the same trace against several policies of equal capacity.
+
+    :param trace:               iterable of (operation, key) tuples
+    :param capacity:            int, cache capacity in items
+    :param policies:            iterable of policy names
+    :return:                    dict of results by policy name
+    """
+    trace = list(trace)
+    results = dict()
+    for name in policies:
+        results[name] = replay(trace, policy.create(name, capacity))
+    return results
+
+
+def key_memory(cache, count=1000, key_length=100, tags=3, tag_count=10):
+    """
+    Key memory
+    Writes items with long url-like keys and tags through redis adapter
+    and measures bytes per item taken by key names (item keys, tag set
+    keys and members, bucket fields) and total memory per item if server
+    supports MEMORY USAGE. Removes items afterwards.
+
+    :param cache:               Redis adapter instance
+    :param count:               int, number of items
+    :param key_length:          int, item key length
+    :param tags:                int, tags per item
+    :param tag_count:           int, distinct tags
+    :return:                    dict
+    """
+    base = 'https://example.com/' + 'path/' * key_length
+    for index in range(count):
+        suffix = str(index)
+        key = base[:key_length - len(suffix)] + suffix
+        item_tags = [
+            'tag{}'.format((index + offset) % tag_count)
+            for offset in range(tags)
+        ]
+        cache.set(key, '1', tags=item_tags or None)
+
+    redis = cache.get_redis()
+    keys = []
+    for batch in cache.scan():
+        keys += [key for key in batch if not cache.is_service_key(key)]
+
+    key_bytes = sum(len(key.encode()) for key in keys)
+    for key in keys:
+        if key.startswith(cache.tag_prefix):
+            key_bytes += sum(len(m.encode()) for m in redis.smembers(key))
+        if key.startswith(cache.bucket_prefix):
+            key_bytes += sum(len(f.encode()) for f in redis.hkeys(key))
+
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.memory_usage(key)
+    usage = pipe.execute(raise_on_error=False)
+    memory = None
+    if usage and all(isinstance(value, int) for value in usage):
+        memory = sum(usage) / count
+
+    cache.delete_all()
+    return dict(
+        items=count,
+        keys=len(keys),
+        key_bytes=key_bytes / count,
+        memory=memory,
+    )
+
+
+def compare_key_memory(config=None, namespace='benchmark', **options):
+    """
+    Compare key memory
+    Measures memory per item with full and compact keys in two scratch
+    namespaces. See key_memory() for options.
+
+    :param config:              dict, redis connection config
+    :param namespace:           string, scratch namespace prefix
+    :return:                    dict
+    """
+    config = config or dict()
+    plain = Redis(namespace + '-plain', optimize_after=None, config=config)
+    compact = Redis(
+        namespace + '-compact',
+        optimize_after=None,
+        compact_keys=True,
+        config=config
+    )
+    return dict(
+        plain=key_memory(plain, **options),
+        compact=key_memory(compact, **options),
+    )
+
+
+def compare_packed_memory(config=None, namespace='benchmark', **options):
+    """
+    Compare packed memory
+    Measures memory per tiny untagged item stored as separate hashes and
+    packed into buckets in two scratch namespaces. See key_memory() for
+    options, tags are always off.
+
+    :param config:              dict, redis connection config
+    :param namespace:           string, scratch namespace prefix
+    :return:                    dict
+    """
+    config = config or dict()
+    options = dict(dict(count=10000, key_length=16), **options, tags=0)
+    buckets = max(1, options['count'] // 100)
+    plain = Redis(namespace + '-plain', optimize_after=None, config=config)
+    packed = Redis(
+        namespace + '-packed',
+        optimize_after=None,
+        packed=dict(buckets=buckets),
+        config=config
+    )
+    return dict(
+        plain=key_memory(plain, **options),
+        packed=key_memory(packed, **options),
+    )
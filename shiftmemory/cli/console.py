@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 import click
+import json
+import sys
+import time
+from datetime import datetime
 from click import echo, style
+from shiftmemory import Memory, exceptions, loadtest, trace
 
 
 # -----------------------------------------------------------------------------
@@ -15,6 +20,37 @@ class Config():
     """
     def __init__(self):
         self.verbose = False
+        self.config = None
+        self.memory = None
+
+    def get_memory(self):
+        """
+        Get memory
+        Parses caches configuration file (JSON with adapters and caches
+        sections, same as Memory arguments) and returns configured memory
+        """
+        if self.memory:
+            return self.memory
+
+        try:
+            with open(self.config) as file:
+                config = json.load(file)
+        except (OSError, ValueError) as error:
+            msg = 'Unable to load config [{}]: {}'.format(self.config, error)
+            raise click.ClickException(msg)
+
+        self.memory = Memory(
+            adapters=config.get('adapters'),
+            caches=config.get('caches')
+        )
+        return self.memory
+
+    def get_cache(self, name):
+        """ Get cache by name or fail with a friendly message """
+        try:
+            return self.get_memory().get_cache(name)
+        except exceptions.ShiftMemoryException as error:
+            raise click.ClickException(str(error))
 
 
 configurator = click.make_pass_decorator(Config, ensure=True)
@@ -29,99 +65,573 @@ configurator = click.make_pass_decorator(Config, ensure=True)
 ))
 @click.option(
     '--config',
-    type=click.File('r'),
+    type=click.Path(dir_okay=False),
     default='shiftmemory.cfg',
     required=False,
-    help='Your caches configuration'
+    help='Your caches configuration (JSON with adapters and caches)'
 )
 @configurator
 def cli(settings, config):
     """ Main command group """
     settings.config = config
 
+
+def batch_options(command):
+    """ Options shared by commands that process items in batches """
+    options = [
+        click.option(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Keys to process per round trip'
+        ),
+        click.option(
+            '--rate-limit',
+            type=float,
+            default=None,
+            help='Maximum keys to process per second'
+        ),
+        click.option(
+            '--dry-run',
+            is_flag=True,
+            default=False,
+            help='Only count keys, do not change anything'
+        ),
+        click.option(
+            '--json',
+            'as_json',
+            is_flag=True,
+            default=False,
+            help='Output results as JSON'
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
 # -----------------------------------------------------------------------------
 # Commands
 # -----------------------------------------------------------------------------
 
-# @cli.command(name='list-caches')
-def caches():
+@cli.command(name='list-caches')
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def caches(settings, as_json):
     """ List configured caches """
+    memory = settings.get_memory()
+    result = []
+    for name, cache_config in sorted(memory.caches.items()):
+        adapter_name = cache_config.get('adapter')
+        adapter_config = memory.adapters.get(adapter_name) or dict()
+        result.append(dict(
+            name=name,
+            adapter=adapter_name,
+            type=adapter_config.get('type'),
+            ttl=cache_config.get('ttl'),
+        ))
+
+    if as_json:
+        return output(result)
 
+    header('Listing caches'.upper())
+    for cache in result:
+        green(cache['name'])
+        echo('  adapter: {adapter} ({type}), ttl: {ttl}'.format(**cache))
     br()
-    cyan('Listing caches'.upper())
-    cyan('-'*80)
-    br(3)
 
 
-# @cli.command(name='stats')
-def stats():
+@cli.command(name='stats')
+@click.argument('name', type=str, required=True)
+@click.option('--sample-size', type=int, default=1000, help='Items to inspect')
+@click.option(
+    '--scan-limit',
+    type=int,
+    default=100000,
+    help='Keys to scan before estimating (0 to scan everything)'
+)
+@click.option('--top-tags', type=int, default=10, help='Largest tags to show')
+@click.option('--batch-size', type=int, default=1000, help='Keys per scan')
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def stats(
+    settings,
+    name,
+    sample_size,
+    scan_limit,
+    top_tags,
+    batch_size,
+    as_json
+):
     """ Display cache stats """
+    try:
+        result = settings.get_memory().stats(
+            name,
+            sample_size=sample_size,
+            scan_limit=scan_limit or None,
+            top_tags=top_tags,
+            batch_size=batch_size
+        )
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
+
+    if as_json:
+        return output(result)
+
+    header('Displaying cache stats for "{}"'.upper().format(name))
+    items = result['items']
+    scanned = 'complete' if result['complete'] else 'sampled'
+    echo('Keys scanned: {} ({})'.format(result['scanned'], scanned))
+    echo('Items: {count} ({low} - {high})'.format(**items))
+    echo('Tags: {}, buckets: {}, service keys: {}'.format(
+        result['tags'],
+        result['buckets'],
+        result['service']
+    ))
+    echo('Types: {}'.format(result['types']))
 
     br()
-    cyan('Displaying cache stats'.upper())
-    cyan('-'*80)
-    br(3)
+    yellow('Memory usage (bytes)')
+    print_estimate(result['memory'])
+    print_histogram(result['memory_histogram'])
 
+    br()
+    yellow('Value size (bytes)')
+    print_estimate(result['value_size'])
+    print_histogram(result['value_size_histogram'])
 
-# @cli.command(name='delete')
-# @click.option('--key', type= str, default=None, help='Item key to delete')
-# @click.option('--tags', type= str, default=None, help='Tags to delete by')
-def delete(key=None, tags=None):
-    """ Delete cached items by key or tags  """
+    br()
+    yellow('TTL')
+    for bucket, count in result['ttl_histogram'].items():
+        echo('  {:>6}: {}'.format(bucket, count))
+
+    br()
+    yellow('Largest tags')
+    for tag in result['top_tags']:
+        echo('  {tag}: {items}'.format(**tag))
+    br()
+
+
+@cli.command(name='hot-keys')
+@click.argument('name', type=str, required=True)
+@click.option('--operation', type=str, default='get', help='get or set')
+@click.option('--limit', type=int, default=20, help='Keys to show')
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def hot_keys(settings, name, operation, limit, as_json):
+    """ Display most accessed keys """
+    try:
+        keys = settings.get_memory().hot_keys(name, operation, limit)
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
 
-    if key: msg = 'Deleting item by key "{}"'.format(key)
-    if tags: msg = 'Deleting item by tags [{}]'.format(tags)
+    result = [dict(key=key, count=count) for key, count in keys]
+    if as_json:
+        return output(result)
 
+    header('Hot keys for "{}" ({})'.upper().format(name, operation))
+    if not result:
+        echo('No accesses recorded, enable profiling for this cache')
+    for item in result:
+        echo('  {count:>12.0f}  {key}'.format(**item))
     br()
-    cyan(msg.upper())
-    cyan('-'*80)
-    br(3)
 
 
-# @cli.command(name='delete-cache')
-# @click.argument('name', type=str, required=True)
-def delete_cache(name):
-    """ Delete all items in cache by name """
+@cli.command(name='slow-log')
+@click.argument('name', type=str, required=True)
+@click.option('--limit', type=int, default=20, help='Entries to show')
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def slow_log(settings, name, limit, as_json):
+    """ Display slowest recent operations """
+    try:
+        entries = settings.get_memory().slow_log(name, limit)
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
 
+    if as_json:
+        return output(entries)
+
+    header('Slow log for "{}"'.upper().format(name))
+    if not entries:
+        echo('No slow operations recorded, enable slow log for this cache')
+    for entry in entries:
+        entry = dict(entry)
+        entry['time'] = datetime.fromtimestamp(entry['time'])
+        entry['duration'] *= 1000
+        line = '  {time:%Y-%m-%d %H:%M:%S}  {duration:>10.1f}ms  '
+        line += '{operation:<16} keys={keys} tags={tags} '
+        line += 'round_trips={round_trips} commands={commands}'
+        echo(line.format(**entry))
+        if entry['key']:
+            echo('    key: {}'.format(entry['key']))
+        if entry['error']:
+            echo('    error: {}'.format(entry['error']))
     br()
-    cyan('Dropping cache "{}"'.upper().format(name))
-    cyan('-'*80)
-    br(3)
 
 
-# @cli.command(name='delete-all-caches')
-def delete_all_caches():
+@cli.command(name='delete')
+@click.argument('name', type=str, required=True)
+@click.option('--key', type=str, default=None, help='Item key to delete')
+@click.option('--tags', type=str, default=None, help='Tags to delete by')
+@click.option('--disjunction', is_flag=True, help='Match any of the tags')
+@batch_options
+@configurator
+def delete(
+    settings,
+    name,
+    key=None,
+    tags=None,
+    disjunction=False,
+    batch_size=1000,
+    rate_limit=None,
+    dry_run=False,
+    as_json=False
+):
+    """ Delete cached items by key or tags  """
+    if not key and not tags:
+        raise click.UsageError('Provide either --key or --tags')
+
+    cache = settings.get_cache(name)
+    if key:
+        msg = 'Deleting item by key "{}"'.upper().format(key)
+        result = dict(name=name, key=key, keys=int(bool(cache.exists(key))))
+        if not dry_run:
+            result['deleted'] = bool(cache.delete(key))
+    else:
+        msg = 'Deleting items by tags [{}]'.upper().format(tags)
+        tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+        if hasattr(cache, 'scan_tagged'):
+            batches = cache.scan_tagged(tags, disjunction, batch_size)
+            result = process(batches, cache.delete_keys, rate_limit, dry_run)
+            if not dry_run:
+                cache.drop_tags(tags, disjunction)
+        elif dry_run:
+            raise click.ClickException('Adapter can not count tagged items')
+        else:
+            cache.delete(tags=tags, disjunction=disjunction)
+            result = dict(keys=None)
+        result['name'] = name
+
+    result['dry_run'] = dry_run
+    report(msg, result, as_json)
+
+
+@cli.command(name='delete-cache')
+@click.argument('name', type=str, required=True)
+@batch_options
+@configurator
+def delete_cache(settings, name, batch_size, rate_limit, dry_run, as_json):
+    """ Delete all items in cache by name """
+    result = drop(settings, name, batch_size, rate_limit, dry_run)
+    report('Dropping cache "{}"'.upper().format(name), result, as_json)
+
+
+@cli.command(name='delete-all-caches')
+@batch_options
+@configurator
+def delete_all_caches(settings, batch_size, rate_limit, dry_run, as_json):
     """ Delete all caches """
-    br()
-    cyan('Clearing out all caches'.upper())
-    cyan('-'*80)
-    br(3)
+    memory = settings.get_memory()
+    result = dict()
+    for name in sorted(memory.caches.keys()):
+        try:
+            options = (batch_size, rate_limit, dry_run)
+            result[name] = drop(settings, name, *options)
+        except click.ClickException as error:
+            result[name] = dict(error=error.message)
+
+    report('Clearing out all caches'.upper(), result, as_json)
 
 
-# @cli.command(name='optimize')
-# @click.argument('name', type=str, required=True)
-def optimize(name):
+@cli.command(name='optimize')
+@click.argument('name', type=str, required=True)
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def optimize(settings, name, as_json):
     """ Optimize cache """
-    br()
-    cyan('Optimizing cache "{}"'.upper().format(name))
-    cyan('-'*80)
-    br(3)
+    memory = settings.get_memory()
+    started = time.perf_counter()
+    try:
+        result = dict(name=name, result=memory.optimize_cache(name))
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
+
+    result['time'] = time.perf_counter() - started
+    report('Optimizing cache "{}"'.upper().format(name), result, as_json)
 
 
-# @cli.command(name='optimize-all')
-def optimize_all():
+@cli.command(name='optimize-all')
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def optimize_all(settings, as_json):
     """ Optimize all caches """
+    results = settings.get_memory().optimize_all_caches()
+    for result in results.values():
+        if result['error'] is not None:
+            result['error'] = str(result['error'])
+
+    report('Optimizing all caches'.upper(), results, as_json)
+
+
+@cli.command(name='snapshot')
+@click.argument('name', type=str, required=True)
+@click.argument('path', type=click.Path(dir_okay=False), required=True)
+@click.option('--hot', type=int, default=None, help='Export hottest keys only')
+@click.option('--match', type=str, default=None, help='Key pattern to export')
+@click.option('--batch-size', type=int, default=1000, help='Keys per batch')
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def snapshot(settings, name, path, hot, match, batch_size, as_json):
+    """ Export cache items to snapshot file """
+    try:
+        result = settings.get_memory().snapshot_cache(
+            name,
+            path,
+            hot=hot,
+            match=match,
+            batch_size=batch_size
+        )
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
+
+    result.update(name=name, path=path)
+    report('Exporting cache "{}"'.upper().format(name), result, as_json)
+
 
+@cli.command(name='warmup')
+@click.argument('name', type=str, required=True)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=1000, help='Keys per batch')
+@click.option('--workers', type=int, default=4, help='Concurrent batches')
+@click.option(
+    '--rate-limit',
+    type=float,
+    default=None,
+    help='Maximum keys to load per second'
+)
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def warmup(settings, name, path, batch_size, workers, rate_limit, as_json):
+    """ Load cache items from snapshot file """
+    try:
+        result = settings.get_memory().warmup_cache(
+            name,
+            path,
+            batch_size=batch_size,
+            workers=workers,
+            rate_limit=rate_limit
+        )
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
+
+    result.update(name=name, path=path)
+    report('Warming up cache "{}"'.upper().format(name), result, as_json)
+
+
+@cli.command(name='load-test')
+@click.argument('name', type=str, required=True)
+@click.option('--processes', type=int, default=4, help='Concurrent processes')
+@click.option('--keys', type=int, default=200, help='Keys per phase')
+@click.option(
+    '--operations',
+    type=int,
+    default=2000,
+    help='Get/set operations per process'
+)
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def load_test(settings, name, processes, keys, operations, as_json):
+    """ Check cache under load from several processes """
+    memory = settings.get_memory()
+    try:
+        memory.get_cache(name)
+        result = loadtest.run(
+            loadtest.memory_factory(memory, name),
+            processes=processes,
+            keys=keys,
+            operations=operations
+        )
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
+
+    report('Load testing cache "{}"'.upper().format(name), result, as_json)
+    if not result['ok']:
+        raise click.ClickException('Cache failed load test')
+
+
+@cli.command(name='replay')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--cache',
+    type=str,
+    default=None,
+    help='Replay against configured cache (writes to it!)'
+)
+@click.option(
+    '--capacity',
+    type=int,
+    multiple=True,
+    help='Simulated capacity in items, can be repeated'
+)
+@click.option(
+    '--policy',
+    'policies',
+    type=click.Choice(['lru', 'lfu', 'tinylfu']),
+    multiple=True,
+    help='Simulated policy, can be repeated (default all)'
+)
+@click.option('--json', 'as_json', is_flag=True, help='Output as JSON')
+@configurator
+def replay(settings, path, cache, capacity, policies, as_json):
+    """ Replay recorded trace against cache or simulated policies """
+    if not cache and not capacity:
+        raise click.UsageError('Provide either --cache or --capacity')
+
+    try:
+        if cache:
+            sample_rate, records = trace.read(path)
+            target = settings.get_cache(cache)
+            result = trace.replay(records, target, sample_rate)
+            result.update(cache=cache)
+            results = [result]
+        else:
+            policies = policies or ('lru', 'lfu', 'tinylfu')
+            results = trace.simulate(path, capacity, policies)
+    except exceptions.ShiftMemoryException as error:
+        raise click.ClickException(str(error))
+
+    if as_json:
+        return output(results)
+
+    header('Replaying trace "{}"'.upper().format(path))
+    for result in results:
+        if 'cache' in result:
+            green('cache {}'.format(result['cache']))
+        else:
+            green('{policy} x {capacity}'.format(**result))
+
+        echo('  hit ratio: {hit_ratio:.4f} ({hits}/{requests})'.format(
+            **result
+        ))
+        if result['memory'] is not None:
+            echo('  memory: {:.0f} bytes'.format(result['memory']))
+        for operation, latency in sorted(result['latency'].items()):
+            line = '  {} latency (us): p50 {p50:.1f}, p99 {p99:.1f}'
+            line += ', max {max:.1f}'
+            echo(line.format(operation, **latency))
     br()
-    cyan('Optimizing all caches'.upper())
-    cyan('-'*80)
-    br(3)
+
+
+# -----------------------------------------------------------------------------
+# Operations
+# -----------------------------------------------------------------------------
+
+def drop(settings, name, batch_size, rate_limit, dry_run):
+    """
+    Drop cache
+    Deletes cache items in batches if adapter supports scanning, otherwise
+    (or for versioned namespaces) drops cache at once.
+    """
+    cache = settings.get_cache(name)
+    versioned = getattr(cache, 'namespace_versioning', False)
+    if hasattr(cache, 'scan') and (dry_run or not versioned):
+        batches = cache.scan(batch_size=batch_size)
+        result = process(batches, cache.delete_keys, rate_limit, dry_run)
+    elif dry_run:
+        raise click.ClickException('Adapter can not count items')
+    else:
+        try:
+            settings.get_memory().drop_cache(name)
+        except exceptions.ShiftMemoryException as error:
+            raise click.ClickException(str(error))
+        result = dict(keys=None)
+
+    result['name'] = name
+    result['dry_run'] = dry_run
+    return result
+
+
+def process(batches, action, rate_limit=None, dry_run=False):
+    """
+    Process
+    Consumes batches of keys applying action to each unless this is a dry
+    run. Sleeps between batches to keep under rate limit (keys per second)
+    and reports progress to stderr.
+    """
+    started = time.perf_counter()
+    result = dict(keys=0)
+    with progress(batches, 'Processing', result) as bar:
+        for batch in bar:
+            if not dry_run and batch:
+                action(batch)
+            result['keys'] += len(batch)
+
+            if rate_limit:
+                elapsed = time.perf_counter() - started
+                ahead = result['keys'] / rate_limit - elapsed
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    result['time'] = time.perf_counter() - started
+    return result
 
 
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
 
+def progress(batches, label, counter):
+    """ Progress bar over batches of unknown length rendered to stderr """
+    return click.progressbar(
+        batches,
+        label=label,
+        file=sys.stderr,
+        item_show_func=lambda _: '{} keys'.format(counter['keys'])
+    )
+
+
+def print_estimate(estimate):
+    """ Print sampled estimate with confidence bounds """
+    if not estimate['samples']:
+        return echo('  no samples')
+
+    echo('  mean: {mean:.0f} ({low:.0f} - {high:.0f})'.format(**estimate))
+    if 'total' in estimate:
+        total = '  total: {total:.0f} ({total_low:.0f} - {total_high:.0f})'
+        echo(total.format(**estimate))
+
+
+def print_histogram(histogram, width=40):
+    """ Print histogram of (bound, count) tuples as bars """
+    peak = max([count for _, count in histogram] or [1])
+    for bound, count in histogram:
+        bar = '#' * max(1, int(width * count / peak))
+        echo('  <={:>10}: {} {}'.format(bound, bar, count))
+
+
+def report(title, result, as_json=False):
+    """ Print operation result as text or JSON """
+    if as_json:
+        return output(result)
+
+    header(title)
+    for key, value in result.items():
+        echo('{}: {}'.format(key, value))
+    br()
+
+
+def output(data):
+    """ Print data as JSON """
+    echo(json.dumps(data, indent=2, sort_keys=True, default=str))
+
+
+def header(text):
+    br()
+    cyan(text)
+    cyan('-'*80)
+    br()
+
 
 def br(how_much=1): echo('\n' * how_much)
 def green(text): echo(style(text, fg='green'))
@@ -0,0 +1,210 @@
+"""
+Conformance
+Reusable test suite checking that an adapter behaves like the redis
+adapter: expiration, tags, add, deleting by tags with conjunction and
+disjunction, dropping namespace and optimization.
+
+Mix Conformance into a TestCase and implement create_adapter() returning
+a fresh adapter for the namespace. Adapters of all namespaces should use
+the same storage (server, database or file), as they would when several
+caches are configured with one adapter, and must not share items. Clean
+up storage in tearDown() as usual:
+
+    class MyAdapterConformanceTest(Conformance, TestCase):
+        def create_adapter(self, namespace='test'):
+            return MyAdapter(namespace, ttl=60)
+"""
+import time
+
+
+class Conformance:
+    """
+    Conformance
+    Test case mixin with adapter semantics every adapter has to follow.
+    Return values are only checked where callers rely on them.
+    """
+
+    # seconds items of short ttl live and seconds to wait for them to expire
+    short_ttl = 0.05
+    expiry_wait = 0.15
+
+    def create_adapter(self, namespace='test'):
+        """
+        Create adapter
+        Returns adapter instance to test.
+
+        :param namespace:       string, namespace
+        :return:                adapter
+        """
+        raise NotImplementedError
+
+    # -------------------------------------------------------------------------
+    # Caching
+    # -------------------------------------------------------------------------
+
+    def test_conformance_set_get_and_delete(self):
+        """ Conformance: items can be set, read and deleted """
+        cache = self.create_adapter()
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.exists('key'))
+
+        cache.set('key', 'value')
+        self.assertEqual('value', cache.get('key'))
+        self.assertTrue(cache.exists('key'))
+
+        cache.set('key', 'updated')
+        self.assertEqual('updated', cache.get('key'))
+
+        self.assertTrue(cache.delete('key'))
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.delete('key'))
+
+    def test_conformance_expire_items(self):
+        """ Conformance: items expire after ttl """
+        cache = self.create_adapter()
+        cache.set('short', 'value', ttl=self.short_ttl, tags=['tag'])
+        cache.set('long', 'value', ttl=30)
+        time.sleep(self.expiry_wait)
+
+        self.assertIsNone(cache.get('short'))
+        self.assertFalse(cache.exists('short'))
+        self.assertEqual('value', cache.get('long'))
+
+    def test_conformance_add(self):
+        """ Conformance: add only writes missing or expired items """
+        cache = self.create_adapter()
+        self.assertTrue(cache.add('key', 'first'))
+        self.assertFalse(cache.add('key', 'second'))
+        self.assertEqual('first', cache.get('key'))
+
+        self.assertTrue(cache.add('short', 'old', ttl=self.short_ttl))
+        time.sleep(self.expiry_wait)
+        self.assertTrue(cache.add('short', 'new'))
+        self.assertEqual('new', cache.get('short'))
+
+    # -------------------------------------------------------------------------
+    # Tags
+    # -------------------------------------------------------------------------
+
+    def test_conformance_item_tags(self):
+        """ Conformance: items remember their tags """
+        cache = self.create_adapter()
+        cache.set('tagged', 'value', tags=['a', 'b'])
+        cache.set('plain', 'value')
+
+        self.assertEqual(['a', 'b'], sorted(cache.get_item_tags('tagged')))
+        self.assertIsNone(cache.get_item_tags('plain'))
+        self.assertIsNone(cache.get_item_tags('missing'))
+        self.assertEqual(1, len(cache.get_tagged_items('a')))
+        self.assertEqual(0, len(cache.get_tagged_items('missing')))
+
+    def test_conformance_delete_by_tags_conjunction(self):
+        """ Conformance: deleting items carrying all of the tags """
+        cache = self.create_adapter()
+        cache.set('ab', 'value', tags=['a', 'b'])
+        cache.set('a', 'value', tags=['a'])
+        cache.set('bc', 'value', tags=['b', 'c'])
+
+        cache.delete(tags=['a', 'b'])
+        self.assertIsNone(cache.get('ab'))
+        self.assertEqual('value', cache.get('a'))
+        self.assertEqual('value', cache.get('bc'))
+
+        cache.delete(tags=['c'])
+        self.assertIsNone(cache.get('bc'))
+        self.assertEqual('value', cache.get('a'))
+
+    def test_conformance_delete_by_tags_disjunction(self):
+        """ Conformance: deleting items carrying any of the tags """
+        cache = self.create_adapter()
+        cache.set('a', 'value', tags=['a'])
+        cache.set('b', 'value', tags=['b', 'x'])
+        cache.set('c', 'value', tags=['c'])
+        cache.set('plain', 'value')
+
+        cache.delete(tags=['a', 'b'], disjunction=True)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('value', cache.get('c'))
+        self.assertEqual('value', cache.get('plain'))
+
+    def test_conformance_retag_items(self):
+        """ Conformance: rewritten items carry their new tags """
+        cache = self.create_adapter()
+        cache.set('key', 'value', tags=['old'])
+        cache.set('key', 'value', tags=['new'])
+        self.assertEqual(['new'], cache.get_item_tags('key'))
+        self.assertEqual(0, len(cache.get_tagged_items('old')))
+
+        cache.delete(tags=['old'])
+        self.assertEqual('value', cache.get('key'))
+        cache.delete(tags=['new'])
+        self.assertIsNone(cache.get('key'))
+
+    # -------------------------------------------------------------------------
+    # Namespace
+    # -------------------------------------------------------------------------
+
+    def test_conformance_delete_all(self):
+        """ Conformance: dropping namespace keeps other namespaces """
+        cache = self.create_adapter()
+        other = self.create_adapter('other')
+        for i in range(10):
+            cache.set('key{}'.format(i), 'value', tags=['tag'])
+        other.set('key1', 'other', tags=['tag'])
+
+        cache.delete_all()
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(0, len(cache.get_tagged_items('tag')))
+        self.assertEqual('other', other.get('key1'))
+
+        cache.set('key1', 'again')
+        self.assertEqual('again', cache.get('key1'))
+
+    def test_conformance_namespace_isolation(self):
+        """ Conformance: namespaces sharing storage do not share items """
+        cache = self.create_adapter()
+        other = self.create_adapter('other')
+        cache.set('key', 'value', tags=['tag'])
+        other.set('key', 'other', tags=['tag', 'more'])
+
+        self.assertEqual('value', cache.get('key'))
+        self.assertEqual(['tag'], cache.get_item_tags('key'))
+        self.assertEqual(1, len(cache.get_tagged_items('tag')))
+        self.assertEqual(0, len(cache.get_tagged_items('more')))
+        self.assertEqual(['key'], [r[0] for r in cache.iter_items()])
+
+        cache.delete(tags=['tag'])
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual('other', other.get('key'))
+        other.delete('key')
+        self.assertIsNone(other.get('key'))
+
+    def test_conformance_optimize(self):
+        """ Conformance: optimization drops expired items and their tags """
+        cache = self.create_adapter()
+        cache.set('short', 'value', ttl=self.short_ttl, tags=['tag'])
+        cache.set('long', 'value', ttl=30, tags=['tag'])
+        time.sleep(self.expiry_wait)
+
+        self.assertTrue(cache.optimize())
+        self.assertIsNone(cache.get('short'))
+        self.assertEqual('value', cache.get('long'))
+        self.assertEqual(1, len(cache.get_tagged_items('tag')))
+
+    def test_conformance_iter_items(self):
+        """ Conformance: iterating live items """
+        cache = self.create_adapter()
+        cache.set('one', '1', tags=['odd'], ttl=30)
+        cache.set('two', '2')
+        cache.set('short', '3', ttl=self.short_ttl)
+        time.sleep(self.expiry_wait)
+
+        items = {r[0]: r for r in cache.iter_items(batch_size=1)}
+        self.assertEqual({'one', 'two'}, set(items))
+        key, value, ttl, tags = items['one']
+        self.assertEqual(('1', ['odd']), (value, tags))
+        self.assertTrue(0 < ttl <= 30000)
+
+        odd = [r[0] for r in cache.iter_items(tag='odd')]
+        self.assertEqual(['one'], odd)
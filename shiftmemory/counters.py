@@ -0,0 +1,137 @@
+"""
+Counters
+In-process accumulator for hot counters. Increments are summed locally
+and pushed to the cache in one round trip every flush interval, so a
+thousand views of a page cost a single server side increment.
+
+Buffered increments are lost if the process dies before a flush and the
+shared value lags behind by up to one interval.
+"""
+import atexit
+import threading
+
+
+class CounterBuffer:
+    """
+    Counter buffer
+    Aggregates increments by key and ttl and flushes them with adapter's
+    incr_many() from a background thread. Flushes are also triggered when
+    number of pending keys reaches the limit and on exit.
+    """
+
+    def __init__(self, cache, interval=0.1, max_keys=10000):
+        """
+        Create buffer
+        :param cache:           adapter instance supporting incr_many()
+        :param interval:        float, seconds between flushes
+        :param max_keys:        int, flush when that many keys are pending
+        """
+        self.cache = cache
+        self.interval = interval
+        self.max_keys = max_keys
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.flusher = None
+        self.flushed = 0
+
+    def incr(self, key, amount=1, *, ttl=None):
+        """
+        Increment
+        Adds amount to pending increment of the key.
+
+        :param key:             string, cache key
+        :param amount:          int, value to add
+        :param ttl:             int, ttl of counter if it is created
+        :return:                None
+        """
+        if self.flusher is None:
+            self.start()
+
+        with self.lock:
+            amounts = self.pending.setdefault(ttl, dict())
+            amounts[key] = amounts.get(key, 0) + amount
+            pending = sum(len(amounts) for amounts in self.pending.values())
+
+        if pending >= self.max_keys:
+            self.flush()
+
+    def decr(self, key, amount=1, *, ttl=None):
+        """
+        Decrement
+        Subtracts amount from pending increment of the key.
+
+        :param key:             string, cache key
+        :param amount:          int, value to subtract
+        :param ttl:             int, ttl of counter if it is created
+        :return:                None
+        """
+        self.incr(key, -amount, ttl=ttl)
+
+    def flush(self):
+        """
+        Flush
+        Pushes pending increments to the cache, one round trip per distinct
+        ttl. Returns number of flushed keys.
+
+        :return:                int
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, dict()
+
+            flushed = 0
+            for ttl, amounts in pending.items():
+                amounts = {k: v for k, v in amounts.items() if v}
+                if amounts:
+                    self.cache.incr_many(amounts, ttl=ttl)
+                    flushed += len(amounts)
+
+            self.flushed += flushed
+            return flushed
+
+    def start(self):
+        """
+        Start
+        Starts background flusher.
+
+        :return:                None
+        """
+        with self.lock:
+            if self.flusher is not None:
+                return
+
+            self.flusher = threading.Thread(
+                target=self.run,
+                name='shiftmemory-counters',
+                daemon=True
+            )
+            self.flusher.start()
+            atexit.register(self.close)
+
+    def run(self):
+        """
+        Run
+        Flusher thread loop.
+
+        :return:                None
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                # keep flushing, increments of the failed batch are lost
+                pass
+
+    def close(self):
+        """
+        Close
+        Stops flusher and pushes remaining increments.
+
+        :return:                None
+        """
+        self.stopped.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
@@ -0,0 +1,346 @@
+"""
+Hooks
+Instrumentation of cache operations. Any adapter can be wrapped to call
+hooks before and after each operation with an event describing it:
+operation name, cache name, adapter, key, number of keys and tags, bytes
+of values, duration and error. Adapters talking to a server additionally report
+round trips, commands sent and the largest pipeline of the operation,
+which shows how many requests a single call really costs.
+
+Hooks are plain objects with before(event) and after(event) methods. The
+base Hook does nothing, and caches without hooks are not wrapped at all.
+Errors raised by hooks or while measuring an operation are ignored, so
+that instrumentation never changes result of the operation.
+OpenTelemetryHook emits a span per operation if opentelemetry-api is
+installed.
+"""
+import threading
+import time
+
+from shiftmemory import exceptions
+from shiftmemory.trace import get_size
+
+_local = threading.local()
+
+
+class Event:
+    """
+    Event
+    Describes single cache operation. Hooks may keep their own data in
+    context dictionary between before and after calls.
+    """
+
+    __slots__ = (
+        'operation',
+        'cache',
+        'adapter',
+        'key',
+        'keys',
+        'tags',
+        'bytes',
+        'round_trips',
+        'commands',
+        'pipeline',
+        'duration',
+        'error',
+        'context',
+    )
+
+    def __init__(self, operation, cache, adapter):
+        """
+        Create event
+        :param operation:       string, adapter method name
+        :param cache:           string, cache name
+        :param adapter:         string, adapter class name
+        """
+        self.operation = operation
+        self.cache = cache
+        self.adapter = adapter
+        self.key = None
+        self.keys = 0
+        self.tags = 0
+        self.bytes = 0
+        self.round_trips = 0
+        self.commands = 0
+        self.pipeline = 0
+        self.duration = None
+        self.error = None
+        self.context = dict()
+
+
+class Hook:
+    """
+    Hook
+    Base hook that does nothing. Override any of the methods.
+    """
+
+    def before(self, event):
+        """
+        Before
+        Called before operation starts. Only operation, cache and adapter
+        are known at this point.
+
+        :param event:           Event
+        :return:                None
+        """
+        pass
+
+    def after(self, event):
+        """
+        After
+        Called after operation finished or failed.
+
+        :param event:           Event
+        :return:                None
+        """
+        pass
+
+
+class OpenTelemetryHook(Hook):
+    """
+    OpenTelemetry hook
+    Emits a span named cache.<operation> for every operation with event
+    data as span attributes.
+    """
+
+    def __init__(self, tracer=None, name='shiftmemory'):
+        """
+        Create hook
+        :param tracer:          optional tracer (global tracer by default)
+        :param name:            string, tracer name
+        """
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                error = 'OpenTelemetry hook requires opentelemetry-api'
+                raise exceptions.ConfigurationException(error)
+            tracer = trace.get_tracer(name)
+
+        self.tracer = tracer
+
+    def before(self, event):
+        event.context['span'] = self.tracer.start_span(
+            'cache.' + event.operation,
+            attributes={
+                'cache.name': event.cache,
+                'cache.adapter': event.adapter,
+            }
+        )
+
+    def after(self, event):
+        span = event.context.pop('span', None)
+        if span is None:
+            return
+
+        span.set_attribute('cache.keys', event.keys)
+        span.set_attribute('cache.bytes', event.bytes)
+        span.set_attribute('cache.round_trips', event.round_trips)
+        span.set_attribute('cache.commands', event.commands)
+        span.set_attribute('cache.pipeline', event.pipeline)
+        if event.error is not None:
+            span.record_exception(event.error)
+            span.set_attribute('error', True)
+        span.end()
+
+
+hook_types = dict(
+    opentelemetry=OpenTelemetryHook,
+)
+
+
+def create(hooks):
+    """
+    Create
+    Returns a list of hook instances from a list of hooks or hook names.
+
+    :param hooks:               list of Hook instances or names
+    :return:                    list
+    """
+    result = []
+    for hook in hooks or []:
+        if isinstance(hook, str):
+            if hook not in hook_types:
+                msg = 'Unknown hook [{}], use one of: {}'
+                msg = msg.format(hook, ', '.join(sorted(hook_types)))
+                raise exceptions.ConfigurationException(msg)
+            hook = hook_types[hook]()
+        result.append(hook)
+    return result
+
+
+def count_round_trip(commands=1):
+    """
+    Count round trip
+    Called by adapters for each request sent to server. Adds it to event
+    of operation in progress in current thread, if any.
+
+    :param commands:            int, number of commands sent
+    :return:                    None
+    """
+    event = getattr(_local, 'event', None)
+    if event is not None:
+        event.round_trips += 1
+        event.commands += commands
+        if commands > event.pipeline:
+            event.pipeline = commands
+
+
+def measure_subject(args, kwargs):
+    """
+    Measure subject
+    Returns key the operation was called with, if it is a single key
+    operation, and number of tags it was given.
+
+    :param args:                tuple, positional arguments
+    :param kwargs:              dict, keyword arguments
+    :return:                    tuple
+    """
+    key = kwargs.get('key', args[0] if args else None)
+    if not isinstance(key, str):
+        key = None
+    tags = kwargs.get('tags')
+    return key, len(tags) if isinstance(tags, (list, tuple, set)) else 0
+
+
+def measure_single(args, kwargs, result):
+    value = kwargs.get('value', args[1] if len(args) > 1 else None)
+    return 1, get_size(value)
+
+
+def measure_many(args, kwargs, result):
+    items = args[0] if args else kwargs.get('items', {})
+    if isinstance(items, dict):
+        return len(items), sum(get_size(value) for value in items.values())
+    if isinstance(items, (list, tuple)):
+        values = [item[1] for item in items if isinstance(item, tuple)]
+        return len(items), sum(get_size(value) for value in values)
+    return 0, 0
+
+
+def measure_get(args, kwargs, result):
+    return 1, get_size(result)
+
+
+def measure_get_many(args, kwargs, result):
+    result = result or {}
+    return len(result), sum(get_size(value) for value in result.values())
+
+
+def measure_keys(args, kwargs, result):
+    return (1 if args and args[0] else 0), 0
+
+
+def measure_counters(args, kwargs, result):
+    amounts = args[0] if args else kwargs.get('amounts', {})
+    return len(amounts), 0
+
+
+def measure_nothing(args, kwargs, result):
+    return 0, 0
+
+
+# operations instrumented and how to count their keys and bytes
+OPERATIONS = dict(
+    get=measure_get,
+    get_many=measure_get_many,
+    exists=measure_keys,
+    set=measure_single,
+    add=measure_single,
+    set_many=measure_many,
+    add_many=measure_many,
+    delete=measure_keys,
+    delete_all=measure_nothing,
+    incr=measure_keys,
+    decr=measure_keys,
+    incr_many=measure_counters,
+    get_tagged_items=measure_keys,
+    get_by_tags=measure_get_many,
+    get_item_tags=measure_keys,
+    optimize=measure_nothing,
+)
+
+
+class Instrumented:
+    """
+    Instrumented cache
+    Wraps any adapter and calls hooks around its operations. All other
+    attributes are delegated to the adapter. Operations called from
+    within an instrumented operation count towards the outer one.
+    """
+
+    def __init__(self, cache, hooks, name=None):
+        """
+        Wrap adapter
+        :param cache:           adapter instance
+        :param hooks:           list of Hook instances
+        :param name:            string, cache name (namespace by default)
+        """
+        self.cache = cache
+        self.hooks = hooks
+        self.name = name or getattr(cache, 'namespace', None)
+        self.adapter = type(cache).__name__
+
+    def __getattr__(self, name):
+        attribute = getattr(self.cache, name)
+        if name not in OPERATIONS or not callable(attribute):
+            return attribute
+
+        def operation(*args, **kwargs):
+            return self.run(name, attribute, args, kwargs)
+        return operation
+
+    def run(self, operation, method, args, kwargs):
+        """
+        Run
+        Runs adapter method and calls hooks around it.
+
+        :param operation:       string, operation name
+        :param method:          bound adapter method
+        :param args:            tuple, positional arguments
+        :param kwargs:          dict, keyword arguments
+        :return:                method result
+        """
+        outer = getattr(_local, 'event', None)
+        if outer is not None:
+            return method(*args, **kwargs)
+
+        event = Event(operation, self.name, self.adapter)
+        self.call_hooks('before', event)
+
+        _local.event = event
+        started = time.perf_counter()
+        result = None
+        try:
+            result = method(*args, **kwargs)
+            return result
+        except Exception as error:
+            event.error = error
+            raise
+        finally:
+            event.duration = time.perf_counter() - started
+            _local.event = None
+            try:
+                measure = OPERATIONS[operation]
+                event.keys, event.bytes = measure(args, kwargs, result)
+                event.key, event.tags = measure_subject(args, kwargs)
+            except Exception:
+                # keep measuring from replacing the result or error
+                pass
+            self.call_hooks('after', event)
+
+    def call_hooks(self, method, event):
+        """
+        Call hooks
+        Calls before or after method of every hook, ignoring their errors.
+
+        :param method:          string, hook method name
+        :param event:           Event
+        :return:                None
+        """
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(event)
+            except Exception:
+                # a failing hook must not fail the operation
+                pass
@@ -0,0 +1,283 @@
+"""
+Load test
+Multi-process harness that runs the same workload against any adapter
+shared between processes (redis, sqlite, shared memory) and checks that
+it stays correct under contention:
+
+    * add is atomic: every contended key is added by exactly one process
+    * no tags are lost: items written by all processes at once keep the
+      full tag set of the process whose value won and are removed when
+      deleting by the tag they share
+    * invalidation is visible: items deleted by tags are gone for the
+      process that deleted them and for every other process
+
+It also reports throughput of a mixed get/set workload per backend.
+Adapters are created in every process by a factory, which has to be
+picklable (a class or functools.partial). spawn_redis() starts a
+throwaway redis server, so that redis can be tested without one running.
+"""
+import functools
+import multiprocessing
+import random
+import shutil
+import socket
+import subprocess
+import time
+from contextlib import contextmanager
+
+from shiftmemory import exceptions
+
+
+def create_cache(adapters, caches, name):
+    """
+    Create cache
+    Returns cache by name from memory configuration. Use with
+    functools.partial() to get picklable factory of a configured cache.
+
+    :param adapters:            dict, adapters configuration
+    :param caches:              dict, caches configuration
+    :param name:                string, cache name
+    :return:                    adapter
+    """
+    from shiftmemory import Memory
+    return Memory(adapters=adapters, caches=caches).get_cache(name)
+
+
+def memory_factory(memory, name):
+    """
+    Memory factory
+    Returns picklable factory creating cache by name with configuration
+    of the given memory.
+
+    :param memory:              Memory instance
+    :param name:                string, cache name
+    :return:                    callable
+    """
+    adapters, caches = memory.adapters, memory.caches
+    return functools.partial(create_cache, adapters, caches, name)
+
+
+def work(factory, worker, keys, operations, barrier, results):
+    """
+    Work
+    Runs workload of a single process. Phases are synchronized between
+    processes with a barrier, so that they contend for the same keys at
+    the same time. Puts report dictionary to results queue.
+
+    :param factory:             callable, creates adapter
+    :param worker:              int, worker number
+    :param keys:                int, keys per phase
+    :param operations:          int, operations in throughput phase
+    :param barrier:             multiprocessing.Barrier
+    :param results:             multiprocessing.Queue
+    :return:                    None
+    """
+    report = dict(worker=worker, wins=0, stale=0, operations=0, time=0)
+    try:
+        cache = factory()
+
+        # race to add the same keys
+        barrier.wait()
+        for i in range(keys):
+            if cache.add('race:{}'.format(i), str(worker)):
+                report['wins'] += 1
+
+        # write the same tagged items concurrently with other processes
+        barrier.wait()
+        tags = ['all', 'worker:{}'.format(worker)]
+        for i in range(keys):
+            cache.set('tagged:{}'.format(i), str(worker), tags=tags)
+
+        # invalidate and read back
+        barrier.wait()
+        tag = 'invalidate:{}'.format(worker)
+        for i in range(keys):
+            cache.set('invalidate:{}:{}'.format(worker, i), str(i), tags=[tag])
+        cache.delete(tags=[tag])
+        for i in range(keys):
+            if cache.get('invalidate:{}:{}'.format(worker, i)) is not None:
+                report['stale'] += 1
+
+        # mixed workload, read-through with 80% reads
+        barrier.wait()
+        generator = random.Random(worker)
+        started = time.perf_counter()
+        for _ in range(operations):
+            key = 'load:{}'.format(generator.randrange(keys))
+            if generator.random() < 0.8 and cache.get(key) is not None:
+                continue
+            cache.set(key, 'value')
+        report['time'] = time.perf_counter() - started
+        report['operations'] = operations
+    except Exception as error:
+        report['error'] = repr(error)
+        barrier.abort()
+
+    results.put(report)
+
+
+def run(factory, processes=4, keys=200, operations=2000, timeout=120):
+    """
+    Run
+    Runs workload in several processes against adapter created by
+    factory, then checks results from this process. Cache is dropped
+    before and after the run. Returns report with throughput (operations
+    per second of all processes), counts of violations of every checked
+    guarantee and errors. Report is ok if there were no violations.
+
+    :param factory:             callable, creates adapter (picklable)
+    :param processes:           int, number of processes
+    :param keys:                int, keys per phase
+    :param operations:          int, operations per process
+    :param timeout:             float, seconds to wait for processes
+    :return:                    dict
+    """
+    cache = factory()
+    cache.delete_all()
+
+    barrier = multiprocessing.Barrier(processes, timeout=timeout)
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=work,
+            args=(factory, worker, keys, operations, barrier, results)
+        )
+        for worker in range(processes)
+    ]
+
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    reports = [results.get(timeout=timeout) for _ in workers]
+    for worker in workers:
+        worker.join(timeout)
+    elapsed = time.perf_counter() - started
+
+    errors = [r['error'] for r in reports if 'error' in r]
+    report = dict(
+        adapter=type(cache).__name__,
+        processes=processes,
+        keys=keys,
+        operations=sum(r['operations'] for r in reports),
+        time=elapsed,
+        throughput=0,
+        add_violations=0,
+        lost_tags=0,
+        stale_reads=sum(r['stale'] for r in reports),
+        errors=errors,
+    )
+
+    busy = max(r['time'] for r in reports)
+    if busy:
+        report['throughput'] = report['operations'] / busy
+
+    if not errors:
+        report.update(check(cache, processes, keys, reports))
+
+    cache.delete_all()
+    report['ok'] = not errors and not any(
+        report[name]
+        for name in ('add_violations', 'lost_tags', 'stale_reads')
+    )
+    return report
+
+
+def check(cache, processes, keys, reports):
+    """
+    Check
+    Verifies state left by workers from another process.
+
+    :param cache:               adapter
+    :param processes:           int, number of processes
+    :param keys:                int, keys per phase
+    :param reports:             list, worker reports
+    :return:                    dict, violation counts
+    """
+    # every contended key added once, winner value is kept
+    wins = sum(r['wins'] for r in reports)
+    missing = sum(
+        cache.get('race:{}'.format(i)) is None for i in range(keys)
+    )
+    add_violations = abs(wins - keys) + missing
+
+    # every item keeps full tag set of the process whose value won
+    lost_tags = 0
+    for i in range(keys):
+        key = 'tagged:{}'.format(i)
+        worker = cache.get(key)
+        tags = cache.get_item_tags(key) or ()
+        expected = {'all', 'worker:{}'.format(worker)}
+        if worker is None or not expected.issubset(tags):
+            lost_tags += 1
+
+    # and goes away with the shared tag
+    cache.delete(tags=['all'])
+    for i in range(keys):
+        if cache.get('tagged:{}'.format(i)) is not None:
+            lost_tags += 1
+
+    # invalidations are visible to other processes
+    stale = 0
+    for worker in range(processes):
+        for i in range(keys):
+            if cache.get('invalidate:{}:{}'.format(worker, i)) is not None:
+                stale += 1
+
+    return dict(
+        add_violations=add_violations,
+        lost_tags=lost_tags,
+        stale_reads=sum(r['stale'] for r in reports) + stale,
+    )
+
+
+def free_port():
+    """
+    Free port
+    Returns a local TCP port nobody listens on.
+
+    :return:                    int
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def spawn_redis(port=None, timeout=10):
+    """
+    Spawn redis
+    Starts a throwaway redis server without persistence and yields its
+    connection config. Server is stopped on exit.
+
+    :param port:                int, port (a free one by default)
+    :param timeout:             float, seconds to wait for server
+    :return:                    dict, connection config
+    """
+    binary = shutil.which('redis-server')
+    if binary is None:
+        error = 'Spawning redis requires redis-server binary'
+        raise exceptions.ConfigurationException(error)
+
+    from redis import StrictRedis
+    port = port or free_port()
+    process = subprocess.Popen(
+        [binary, '--port', str(port), '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    config = dict(host='127.0.0.1', port=port)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                StrictRedis(**config).ping()
+                break
+            except Exception:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    error = 'Redis server did not start on port {}'
+                    raise exceptions.ConfigurationException(error.format(port))
+                time.sleep(0.05)
+        yield config
+    finally:
+        process.terminate()
+        process.wait(timeout)
@@ -1,4 +1,7 @@
-from shiftmemory import exceptions, adapter
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shiftmemory import exceptions, adapter, trace, hooks, slowlog, snapshot
 
 
 class Memory():
@@ -15,32 +18,42 @@ class Memory():
         """
         self.adapters = dict()
         self.caches = dict()
+        self.hooks = []
         self._cache_instances = dict()
+        self._slow_logs = dict()
         self.config = dict(adapters=dict(), caches=dict())
 
         if args or kwargs:
             self.init(*args, **kwargs)
 
-    def init(self, adapters=None, caches=None):
+    def init(self, adapters=None, caches=None, hooks=None):
         """
         Delayed initializer
         This can be called by __init__ or later.
 
         :param adapters: dict, adapters configuration
         :param caches: dict, caches configuration
+        :param hooks: list, hooks or hook names for all caches
         :return:
         """
         if adapters:
             self.adapters = adapters
         if caches:
             self.caches = caches
+        if hooks:
+            self.hooks = hooks
 
     def get_cache(self, cache_name):
         """
         Get cache
         Checks if a cache was already created and returns that. Otherwise
         attempts to create a cache from configuration and preserve
-        for future use
+        for future use. Any cache options other than adapter and ttl
+        are passed to adapter as is (e.g. tag_versioning=True), except for
+        trace option that enables operations recording (see trace module),
+        hooks to call around operations in addition to memory-wide
+        hooks (see hooks module) and slow_log option that records slow
+        operations (see slowlog module)
         """
         if cache_name in self._cache_instances:
             return self._cache_instances[cache_name]
@@ -72,7 +85,28 @@ class Memory():
         if 'config' in adapter_config:
             adapter_params['config'] = adapter_config['config']
 
+        for option, value in cache_config.items():
+            if option not in ('adapter', 'ttl', 'trace', 'hooks', 'slow_log'):
+                adapter_params[option] = value
+
         cache = cls(**adapter_params)
+
+        # call hooks around operations
+        cache_hooks = hooks.create(self.hooks)
+        cache_hooks += hooks.create(cache_config.get('hooks'))
+        slow_log = cache_config.get('slow_log')
+        if slow_log is not None and slow_log is not False:
+            log = slowlog.create(slow_log, cache)
+            self._slow_logs[cache_name] = log
+            cache_hooks.append(log)
+        if cache_hooks:
+            cache = hooks.Instrumented(cache, cache_hooks, cache_name)
+
+        # record operations trace
+        if cache_config.get('trace'):
+            recorder = trace.create_recorder(cache_name, cache_config['trace'])
+            cache = trace.Traced(cache, recorder)
+
         self._cache_instances[cache_name] = cache
         return self._cache_instances[cache_name]
 
@@ -89,17 +123,14 @@ class Memory():
 
         return cache.delete_all()
 
-    def drop_all_caches(self):
+    def drop_all_caches(self, max_workers=8, per_server=2):
         """
         Drop all caches
         Goes through every configured cache and drops all items. Will
-        skip certain caches if they do not support drop all feature
+        skip certain caches if they do not support drop all feature.
+        See run_on_all_caches() for results format.
         """
-        for name in self.caches.keys():
-            cache = self.get_cache(name)
-            if hasattr(cache, 'delete_all'):
-                cache.delete_all(name)
-        return True
+        return self.run_on_all_caches('delete_all', max_workers, per_server)
 
     def optimize_cache(self, name):
         """
@@ -114,20 +145,208 @@ class Memory():
 
         return cache.optimize()
 
-    def optimize_all_caches(self):
+    def optimize_all_caches(self, max_workers=8, per_server=2):
         """
         Optimize all caches
         Goes through every configured cache and optimizes. Will
-        skip certain caches if they do not support optimization feature
+        skip certain caches if they do not support optimization feature.
+        See run_on_all_caches() for results format.
+        """
+        return self.run_on_all_caches('optimize', max_workers, per_server)
+
+    def stats(self, name, **options):
+        """
+        Stats
+        Gets cache by name and profiles it if supported. See adapter stats()
+        for options and results format.
+        """
+        cache = self.get_cache(name)
+        if not hasattr(cache, 'stats'):
+            cls = type(cache)
+            error = 'Adapter [{}] can not collect stats'.format(cls)
+            raise exceptions.AdapterFeatureMissingException(error)
+
+        return cache.stats(**options)
+
+    def hot_keys(self, name, operation='get', limit=20, local=False):
         """
-        for name in self.caches.keys():
-            cache = self.get_cache(name)
-            if hasattr(cache, 'optimize'):
-                cache.optimize(name)
-        return True
+        Hot keys
+        Returns most accessed keys of cache by name as (key, count) tuples.
+        By default reads hot keys shared by all processes, local flag
+        returns hot keys seen by this process profiler only.
+        """
+        cache = self.get_cache(name)
+        profiler = getattr(cache, 'profiler', None)
+        if local and profiler:
+            return profiler.hot_keys(operation, limit)
 
+        if local or not hasattr(cache, 'get_hot_keys'):
+            cls = type(cache)
+            error = 'Adapter [{}] can not profile access'.format(cls)
+            raise exceptions.AdapterFeatureMissingException(error)
 
+        if profiler:
+            cache.flush_profile()
+        return cache.get_hot_keys(operation, limit)
 
+    def slow_log(self, name, limit=20, local=False):
+        """
+        Slow log
+        Returns operations of cache by name that exceeded its slow log
+        threshold, newest first. By default reads entries shared by all
+        processes, local flag returns entries of this process only.
+        """
+        cache = self.get_cache(name)
+        if local:
+            if name not in self._slow_logs:
+                error = 'Slow log is not enabled for cache [{}]'.format(name)
+                raise exceptions.ConfigurationException(error)
+            return self._slow_logs[name].get_entries(limit)
 
+        if not hasattr(cache, 'get_slow_log'):
+            cls = type(cache)
+            error = 'Adapter [{}] can not share slow log'.format(cls)
+            raise exceptions.AdapterFeatureMissingException(error)
+
+        return cache.get_slow_log(limit)
+
+    def iter_items(self, name, match=None, *, tag=None, batch_size=1000):
+        """
+        Iter items
+        Lazily walks items of cache by name, optionally only the ones with
+        keys matching pattern or marked with a tag, and yields (key, value,
+        ttl, tags) records with ttl in milliseconds. Memory use is bounded
+        by batch size. See adapter iter_items().
+        """
+        cache = self.get_cache(name)
+        if not hasattr(cache, 'iter_items'):
+            cls = type(cache)
+            error = 'Adapter [{}] can not iterate items'.format(cls)
+            raise exceptions.AdapterFeatureMissingException(error)
+
+        return cache.iter_items(match, tag=tag, batch_size=batch_size)
+
+    def snapshot_cache(
+        self,
+        name,
+        path,
+        hot=None,
+        match=None,
+        batch_size=1000
+    ):
+        """
+        Snapshot cache
+        Exports items of cache by name to a snapshot file (see snapshot
+        module). Given a number of hot keys exports only that many most
+        read keys (requires profiling), otherwise walks the whole cache,
+        optionally matching keys by pattern. Returns number of exported
+        items and time taken.
+        """
+        if hot:
+            keys = [key for key, _ in self.hot_keys(name, 'get', hot)]
+            batches = self.get_cache(name).export_items(
+                match,
+                keys,
+                batch_size
+            )
+            records = (record for batch in batches for record in batch)
+        else:
+            records = self.iter_items(name, match, batch_size=batch_size)
+
+        return snapshot.write(path, records, name)
+
+    def warmup_cache(
+        self,
+        name,
+        path,
+        batch_size=1000,
+        workers=4,
+        rate_limit=None
+    ):
+        """
+        Warmup cache
+        Loads items from snapshot file into cache by name in parallel
+        batches, optionally limited to a number of keys per second. Returns
+        number of loaded items and time taken.
+        """
+        cache = self.get_cache(name)
+        _, records = snapshot.read(path)
+        return snapshot.load(cache, records, batch_size, workers, rate_limit)
+
+    def run_on_all_caches(self, operation, max_workers=8, per_server=2):
+        """
+        Run on all caches
+        Runs adapter operation (method name) on every configured cache
+        concurrently on a bounded thread pool. Caches sharing a server are
+        grouped, and no more than per_server operations run against single
+        server at once. Failures are collected per cache and do not abort
+        other operations.
+
+        Returns a dictionary of per cache results, each having result,
+        error (exception or None), skipped flag (adapter does not support
+        operation) and time taken in seconds.
+
+        :param operation: str, adapter method to call
+        :param max_workers: int, maximum concurrent operations
+        :param per_server: int, maximum concurrent operations per server
+        :return: dict
+        """
+        names = list(self.caches.keys())
+        if not names:
+            return dict()
+
+        servers = dict()
+        for name in names:
+            server = self.get_server_key(name)
+            if server not in servers:
+                servers[server] = threading.BoundedSemaphore(per_server)
+
+        def run(name):
+            report = dict(result=None, error=None, skipped=False, time=0)
+            semaphore = servers[self.get_server_key(name)]
+            with semaphore:
+                started = time.perf_counter()
+                try:
+                    cache = self.get_cache(name)
+                    if not hasattr(cache, operation):
+                        report['skipped'] = True
+                    else:
+                        report['result'] = getattr(cache, operation)()
+                except Exception as error:
+                    report['error'] = error
+                report['time'] = time.perf_counter() - started
+            return name, report
+
+        # create cache instances upfront, errors will be reported by run()
+        for name in names:
+            try:
+                self.get_cache(name)
+            except Exception:
+                pass
+
+        workers = max(1, min(max_workers, len(names)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(executor.map(run, names))
+
+    def get_server_key(self, cache_name):
+        """
+        Get server key
+        Returns an identifier of server cache is stored at. Redis caches
+        are identified by their connection config, caches of other adapters
+        by storage path if they have one, or by adapter name.
+
+        :param cache_name: str, cache name
+        :return: tuple
+        """
+        adapter_name = self.caches[cache_name].get('adapter')
+        adapter_config = self.adapters.get(adapter_name) or dict()
+        config = adapter_config.get('config') or dict()
+        if str(adapter_config.get('type', '')).lower() != 'redis':
+            if config.get('path'):
+                return config['path'],
+            return adapter_name,
 
+        if 'unix_socket_path' in config:
+            return config['unix_socket_path'],
 
+        return config.get('host', 'localhost'), config.get('port', 6379)
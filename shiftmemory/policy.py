@@ -0,0 +1,301 @@
+"""
+Policies
+Eviction and admission policies for bounded in-process caches. Policies
+only track keys, storage is up to the cache. Every policy is told about
+hits with access(), about new keys with admit(), which returns keys to
+evict (possibly including the new key itself, if it was not admitted),
+and about removed keys with remove().
+"""
+from collections import OrderedDict
+
+from shiftmemory import exceptions
+from shiftmemory.sketch import CountMinSketch
+
+
+class LruPolicy:
+    """
+    LRU policy
+    Evicts least recently used key.
+    """
+
+    def __init__(self, capacity):
+        """
+        Create policy
+        :param capacity:        int, maximum number of keys
+        """
+        self.capacity = capacity
+        self.keys = OrderedDict()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def access(self, key):
+        """
+        Access
+        Records a hit of tracked key.
+
+        :param key:             string, key
+        :return:                None
+        """
+        self.keys.move_to_end(key)
+
+    def admit(self, key):
+        """
+        Admit
+        Starts tracking new key and returns keys to evict.
+
+        :param key:             string, key
+        :return:                list of evicted keys
+        """
+        self.keys[key] = True
+        evicted = []
+        while len(self.keys) > self.capacity:
+            evicted.append(self.keys.popitem(last=False)[0])
+        return evicted
+
+    def remove(self, key):
+        """
+        Remove
+        Stops tracking key.
+
+        :param key:             string, key
+        :return:                None
+        """
+        self.keys.pop(key, None)
+
+
+class LfuPolicy:
+    """
+    LFU policy
+    Evicts least frequently used key, least recently used among equally
+    frequent ones. Runs in constant time with frequency buckets.
+    """
+
+    def __init__(self, capacity):
+        """
+        Create policy
+        :param capacity:        int, maximum number of keys
+        """
+        self.capacity = capacity
+        self.counts = dict()
+        self.buckets = dict()
+        self.min_count = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def access(self, key):
+        """
+        Access
+        Records a hit of tracked key.
+
+        :param key:             string, key
+        :return:                None
+        """
+        count = self.counts[key]
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_count == count:
+                self.min_count = count + 1
+
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, OrderedDict())[key] = True
+
+    def admit(self, key):
+        """
+        Admit
+        Starts tracking new key and returns keys to evict.
+
+        :param key:             string, key
+        :return:                list of evicted keys
+        """
+        evicted = []
+        while self.counts and len(self.counts) >= self.capacity:
+            bucket = self.buckets[self.min_count]
+            victim = bucket.popitem(last=False)[0]
+            if not bucket:
+                del self.buckets[self.min_count]
+            del self.counts[victim]
+            evicted.append(victim)
+            if self.counts and self.min_count not in self.buckets:
+                self.min_count = min(self.buckets)
+
+        self.counts[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = True
+        self.min_count = 1
+        return evicted
+
+    def remove(self, key):
+        """
+        Remove
+        Stops tracking key.
+
+        :param key:             string, key
+        :return:                None
+        """
+        count = self.counts.pop(key, None)
+        if count is None:
+            return
+
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_count == count and self.buckets:
+                self.min_count = min(self.buckets)
+
+
+class TinyLfuPolicy:
+    """
+    W-TinyLFU policy
+    New keys enter a small LRU window. Keys leaving the window compete for
+    a place in the main segmented LRU (probation and protected segments)
+    with its victim, and the one accessed more often according to aging
+    frequency sketch wins. This way scans and one-off keys pass through
+    the window without evicting popular keys.
+    """
+
+    def __init__(self, capacity, window=0.01, protected=0.8):
+        """
+        Create policy
+        :param capacity:        int, maximum number of keys
+        :param window:          float, window share of capacity
+        :param protected:       float, protected share of main segment
+        """
+        self.capacity = capacity
+        self.window_size = max(1, int(capacity * window))
+        self.main_size = max(0, capacity - self.window_size)
+        self.protected_size = int(self.main_size * protected)
+
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+
+        width = 64
+        while width < capacity:
+            width *= 2
+        self.sketch = CountMinSketch(width, 4)
+        self.sample_size = 10 * max(capacity, 1)
+        self.samples = 0
+
+    def __len__(self):
+        return len(self.window) + len(self.probation) + len(self.protected)
+
+    def __contains__(self, key):
+        return (
+            key in self.window or
+            key in self.probation or
+            key in self.protected
+        )
+
+    def record(self, key):
+        """
+        Record
+        Counts key in frequency sketch, halving all counts periodically.
+
+        :param key:             string, key
+        :return:                None
+        """
+        self.sketch.add(key)
+        self.samples += 1
+        if self.samples >= self.sample_size:
+            self.sketch.decay()
+            self.samples //= 2
+
+    def access(self, key):
+        """
+        Access
+        Records a hit of tracked key. Hits in probation promote the key
+        to protected segment.
+
+        :param key:             string, key
+        :return:                None
+        """
+        self.record(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = True
+            if len(self.protected) > self.protected_size:
+                demoted = self.protected.popitem(last=False)[0]
+                self.probation[demoted] = True
+
+    def admit(self, key):
+        """
+        Admit
+        Puts new key into window. Key pushed out of the window either
+        takes free space in main segment or competes with main victim.
+
+        :param key:             string, key
+        :return:                list of evicted keys
+        """
+        self.record(key)
+        self.window[key] = True
+        if len(self.window) <= self.window_size:
+            return []
+
+        candidate = self.window.popitem(last=False)[0]
+        if len(self.probation) + len(self.protected) < self.main_size:
+            self.probation[candidate] = True
+            return []
+
+        segment = self.probation if self.probation else self.protected
+        if not segment:
+            return [candidate]
+
+        victim = next(iter(segment))
+        estimate = self.sketch.estimate
+        if estimate(candidate) > estimate(victim):
+            del segment[victim]
+            self.probation[candidate] = True
+            return [victim]
+
+        return [candidate]
+
+    def remove(self, key):
+        """
+        Remove
+        Stops tracking key.
+
+        :param key:             string, key
+        :return:                None
+        """
+        self.window.pop(key, None)
+        self.probation.pop(key, None)
+        self.protected.pop(key, None)
+
+
+policies = dict(
+    lru=LruPolicy,
+    lfu=LfuPolicy,
+    tinylfu=TinyLfuPolicy,
+)
+
+
+def create(name, capacity, **options):
+    """
+    Create
+    Instantiates policy by name.
+
+    :param name:                string, policy name (lru, lfu or tinylfu)
+    :param capacity:            int, maximum number of keys
+    :param options:             policy options
+    :return:                    policy
+    """
+    if name not in policies:
+        msg = 'Unknown cache policy [{}], use one of: {}'
+        msg = msg.format(name, ', '.join(sorted(policies)))
+        raise exceptions.ConfigurationException(msg)
+
+    return policies[name](capacity, **options)
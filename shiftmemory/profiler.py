@@ -0,0 +1,206 @@
+"""
+Profiler
+Sampling access profiler that finds hot keys in bounded memory and a small
+near cache to keep values of hot keys in process. May be used across all
+cache adapters.
+"""
+import random
+import threading
+import time
+
+from shiftmemory.sketch import TopK
+
+
+class Profiler:
+    """
+    Profiler
+    Samples key accesses per operation (get, set etc.) into count-min
+    sketches with top-k trackers. Only sampled accesses touch the sketch,
+    so with a low sample rate overhead is a single random number per call.
+    Counts are periodically halved to let popularity fade.
+    """
+
+    def __init__(
+        self,
+        sample_rate=0.01,
+        top=20,
+        width=2048,
+        depth=4,
+        decay_after=100000,
+        seed=None
+    ):
+        """
+        Create profiler
+        :param sample_rate:     float, share of accesses to record (0-1)
+        :param top:             int, number of hot keys to track
+        :param width:           int, sketch width
+        :param depth:           int, sketch depth
+        :param decay_after:     int, halve counts after that many samples
+        :param seed:            optional random seed
+        """
+        self.sample_rate = sample_rate
+        self.top = top
+        self.width = width
+        self.depth = depth
+        self.decay_after = decay_after
+        self.random = random.Random(seed)
+        self.trackers = dict()
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def record(self, operation, key):
+        """
+        Record
+        Samples key access. Returns true if the key was sampled and is
+        currently among hot keys of the operation.
+
+        :param operation:       string, operation name
+        :param key:             string, item key
+        :return:                bool
+        """
+        if self.random.random() >= self.sample_rate:
+            return False
+
+        with self.lock:
+            tracker = self.trackers.get(operation)
+            if tracker is None:
+                tracker = TopK(self.top, self.width, self.depth)
+                self.trackers[operation] = tracker
+
+            hot = tracker.add(key)
+            self.samples += 1
+            if self.decay_after and self.samples >= self.decay_after:
+                self.decay()
+
+        return hot
+
+    def decay(self):
+        """
+        Decay
+        Halves all counts. Called under lock.
+
+        :return:                None
+        """
+        for tracker in self.trackers.values():
+            tracker.sketch.decay()
+            for key in tracker.top:
+                tracker.top[key] >>= 1
+            tracker.floor >>= 1
+        self.samples = 0
+
+    def is_hot(self, operation, key):
+        """
+        Is hot?
+        Checks if key is currently among hot keys of the operation.
+
+        :param operation:       string, operation name
+        :param key:             string, item key
+        :return:                bool
+        """
+        tracker = self.trackers.get(operation)
+        return tracker is not None and key in tracker
+
+    def hot_keys(self, operation='get', limit=None):
+        """
+        Hot keys
+        Returns hot keys of the operation with estimated number of accesses
+        (sampled counts scaled by sample rate), most accessed first.
+
+        :param operation:       string, operation name
+        :param limit:           int, number of keys to return
+        :return:                list of tuples
+        """
+        with self.lock:
+            tracker = self.trackers.get(operation)
+            items = tracker.items() if tracker else []
+
+        scale = 1 / self.sample_rate if self.sample_rate else 0
+        items = [(key, count * scale) for key, count in items]
+        return items[:limit] if limit else items
+
+    def reset(self):
+        """
+        Reset
+        Forgets all recorded accesses.
+
+        :return:                None
+        """
+        with self.lock:
+            self.trackers = dict()
+            self.samples = 0
+
+
+class NearCache:
+    """
+    Near cache
+    Tiny in-process cache for values of hot keys. Values live for a short
+    ttl, so reads may be stale for at most that long when other processes
+    change the items.
+    """
+
+    def __init__(self, size=20, ttl=1):
+        """
+        Create near cache
+        :param size:            int, maximum number of items
+        :param ttl:             float, seconds to keep values
+        """
+        self.size = size
+        self.ttl = ttl
+        self.items = dict()
+
+    def get(self, key):
+        """
+        Get
+        Returns fresh value by key or None.
+
+        :param key:             string, item key
+        :return:                value or None
+        """
+        item = self.items.get(key)
+        if item is None:
+            return None
+
+        value, expires = item
+        if expires < time.monotonic():
+            self.items.pop(key, None)
+            return None
+
+        return value
+
+    def set(self, key, value):
+        """
+        Set
+        Puts value into near cache, dropping the oldest item when full.
+
+        :param key:             string, item key
+        :param value:           value to keep
+        :return:                None
+        """
+        items = self.items
+        items.pop(key, None)
+        if len(items) >= self.size:
+            try:
+                del items[next(iter(items))]
+            except (StopIteration, KeyError, RuntimeError):
+                pass
+
+        items[key] = (value, time.monotonic() + self.ttl)
+
+    def delete(self, key):
+        """
+        Delete
+        Drops value by key.
+
+        :param key:             string, item key
+        :return:                None
+        """
+        self.items.pop(key, None)
+
+    def clear(self):
+        """
+        Clear
+        Drops all values.
+
+        :return:                None
+        """
+        self.items.clear()
@@ -0,0 +1,271 @@
+"""
+Resilience
+Keeps a failing cache server from taking the application down with it.
+Calls are retried with jittered exponential backoff and a circuit breaker
+counts consecutive failures. Once it opens, calls skip the server
+altogether and fail open: reads miss, writes are skipped, or an
+in-process fallback cache serves them instead. After a while a single
+probe call is let through (half-open) to check if the server is back.
+
+Adapter methods opt in with the guarded decorator. Calls made from within
+a guarded call are not guarded again, so a single operation is retried
+and counted once.
+"""
+import functools
+import random
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker
+    Opens after a number of consecutive failures and rejects calls until
+    reset timeout passes. Then lets a single probe call through, which
+    either closes the breaker or opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=5, clock=None):
+        """
+        Create breaker
+        :param failure_threshold:   int, consecutive failures to open
+        :param reset_timeout:       float, seconds to stay open
+        :param clock:               optional monotonic clock function
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock or time.monotonic
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+        self.counts = dict(opened=0, rejected=0, failed=0, succeeded=0)
+
+    def allow(self):
+        """
+        Allow
+        Checks if a call may proceed. Switches open breaker to half-open
+        once reset timeout passed and lets a single probe through.
+
+        :return:                bool
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if self.clock() - self.opened_at >= self.reset_timeout:
+                    self.state = HALF_OPEN
+                    self.probing = False
+
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+
+            self.counts['rejected'] += 1
+            return False
+
+    def success(self):
+        """
+        Success
+        Records successful call, closing the breaker. Returns true if
+        breaker was not closed before.
+
+        :return:                bool
+        """
+        with self.lock:
+            recovered = self.state != CLOSED
+            self.counts['succeeded'] += 1
+            self.failures = 0
+            self.state = CLOSED
+            self.probing = False
+            return recovered
+
+    def failure(self):
+        """
+        Failure
+        Records failed call, opening the breaker after too many
+        consecutive failures or a failed probe.
+
+        :return:                None
+        """
+        with self.lock:
+            self.counts['failed'] += 1
+            self.failures += 1
+            threshold = self.failures >= self.failure_threshold
+            if self.state == HALF_OPEN or threshold:
+                if self.state != OPEN:
+                    self.counts['opened'] += 1
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self.probing = False
+
+    def stats(self):
+        """
+        Stats
+        Returns breaker state, current consecutive failures and counters
+        of openings, rejected, failed and succeeded calls.
+
+        :return:                dict
+        """
+        with self.lock:
+            return dict(
+                state=self.state,
+                failures=self.failures,
+                **self.counts
+            )
+
+
+class Guard:
+    """
+    Guard
+    Runs calls with retries behind a circuit breaker and falls back to
+    defaults or fallback cache on failure.
+    """
+
+    def __init__(
+        self,
+        errors,
+        retries=1,
+        backoff=0.005,
+        max_backoff=0.05,
+        failure_threshold=5,
+        reset_timeout=5,
+        fallback=None
+    ):
+        """
+        Create guard
+        :param errors:              tuple, exception types of failures
+        :param retries:             int, retries after failed attempt
+        :param backoff:             float, base delay between retries
+        :param max_backoff:         float, maximum delay between retries
+        :param failure_threshold:   int, consecutive failures to open
+        :param reset_timeout:       float, seconds to stay open
+        :param fallback:            optional adapter to use while failing
+        """
+        self.errors = errors
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.fallback = fallback
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.local = threading.local()
+        self.counts = dict(retries=0, fallbacks=0)
+
+    def call(self, method, args, kwargs, default):
+        """
+        Call
+        Runs method guarded. On failure or while breaker is open calls
+        the same method of fallback adapter if it has one, otherwise
+        returns default (callable defaults get call arguments). Other
+        errors mean the server is responding and are raised. Fallback is
+        emptied when the server recovers, so that it does not serve stale
+        items during the next outage.
+
+        :param method:          bound method to run
+        :param args:            tuple, positional arguments
+        :param kwargs:          dict, keyword arguments
+        :param default:         value or callable returning it
+        :return:                method result, fallback result or default
+        """
+        if getattr(self.local, 'active', False):
+            return method(*args, **kwargs)
+
+        if self.breaker.allow():
+            self.local.active = True
+            try:
+                result = self.attempt(method, args, kwargs)
+                if self.breaker.success() and self.fallback is not None:
+                    self.fallback.delete_all()
+                return result
+            except self.errors:
+                self.breaker.failure()
+            except Exception:
+                self.breaker.success()
+                raise
+            finally:
+                self.local.active = False
+
+        return self.degrade(method, args, kwargs, default)
+
+    def attempt(self, method, args, kwargs):
+        """
+        Attempt
+        Runs method retrying failures with jittered exponential backoff.
+
+        :param method:          bound method to run
+        :param args:            tuple, positional arguments
+        :param kwargs:          dict, keyword arguments
+        :return:                method result
+        """
+        attempt = 0
+        while True:
+            try:
+                return method(*args, **kwargs)
+            except self.errors:
+                if attempt >= self.retries:
+                    raise
+
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            self.counts['retries'] += 1
+            attempt += 1
+
+    def degrade(self, method, args, kwargs, default):
+        """
+        Degrade
+        Serves failed or rejected call from fallback adapter or default.
+
+        :param method:          bound method that failed
+        :param args:            tuple, positional arguments
+        :param kwargs:          dict, keyword arguments
+        :param default:         value or callable returning it
+        :return:                fallback result or default
+        """
+        self.counts['fallbacks'] += 1
+        handler = getattr(self.fallback, method.__name__, None)
+        if handler is not None:
+            return handler(*args, **kwargs)
+        if callable(default):
+            return default(*args, **kwargs)
+        return default
+
+    def stats(self):
+        """
+        Stats
+        Returns breaker metrics with counters of retries and degraded
+        calls.
+
+        :return:                dict
+        """
+        return dict(self.breaker.stats(), **self.counts)
+
+
+def guarded(default=None):
+    """
+    Guarded
+    Decorates adapter method to run through adapter's guard, if it has
+    one. Default is returned when the call fails or is rejected and there
+    is no fallback.
+
+    :param default:             value or callable getting call arguments
+    :return:                    decorator
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.guard is None:
+                return method(self, *args, **kwargs)
+            return self.guard.call(
+                method.__get__(self),
+                args,
+                kwargs,
+                default
+            )
+        return wrapper
+    return decorate
@@ -0,0 +1,255 @@
+"""
+Sketches
+Probabilistic data structures used to track key frequencies and
+membership in bounded memory. May be used across all cache adapters.
+"""
+from array import array
+from hashlib import blake2b
+
+
+class CountMinSketch:
+    """
+    Count-min sketch
+    Estimates key frequencies in fixed memory. Estimates never undercount
+    and overcount by at most total/width with high probability (depending
+    on depth). Counters can be halved periodically to let frequencies age.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        """
+        Create sketch
+        :param width:           int, counters per row
+        :param depth:           int, number of rows (hash functions)
+        """
+        self.width = width
+        self.depth = depth
+        self.rows = [array('Q', [0]) * width for _ in range(depth)]
+        self.total = 0
+
+    def indexes(self, key):
+        """
+        Indexes
+        Returns counter index in every row for the key using double hashing.
+
+        :param key:             hashable key
+        :return:                list of ints
+        """
+        value = hash(key)
+        first = value & 0xFFFFFFFF
+        second = (value >> 32) | 1
+        width = self.width
+        return [(first + i * second) % width for i in range(self.depth)]
+
+    def add(self, key, count=1):
+        """
+        Add
+        Counts key occurrence and returns its updated frequency estimate.
+
+        :param key:             hashable key
+        :param count:           int, occurrences to add
+        :return:                int, estimate
+        """
+        self.total += count
+        estimate = None
+        for row, index in zip(self.rows, self.indexes(key)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, key):
+        """
+        Estimate
+        Returns frequency estimate of the key.
+
+        :param key:             hashable key
+        :return:                int
+        """
+        return min(
+            row[index] for row, index in zip(self.rows, self.indexes(key))
+        )
+
+    def decay(self):
+        """
+        Decay
+        Halves all counters, so that old popularity fades away.
+
+        :return:                None
+        """
+        for row in self.rows:
+            for index in range(self.width):
+                row[index] >>= 1
+        self.total >>= 1
+
+    def reset(self):
+        """
+        Reset
+        Zeroes all counters.
+
+        :return:                None
+        """
+        for row in self.rows:
+            for index in range(self.width):
+                row[index] = 0
+        self.total = 0
+
+
+class TopK:
+    """
+    Top-K
+    Tracks k most frequent keys of a stream using count-min sketch for
+    frequency estimates. Keeps at most k keys in memory.
+    """
+
+    def __init__(self, k=20, width=2048, depth=4):
+        """
+        Create top-k tracker
+        :param k:               int, number of keys to track
+        :param width:           int, sketch width
+        :param depth:           int, sketch depth
+        """
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.top = dict()
+        self.floor = 0
+
+    def add(self, key, count=1):
+        """
+        Add
+        Counts key occurrence and updates top keys. Returns true if the key
+        is currently among top keys.
+
+        :param key:             hashable key
+        :param count:           int, occurrences to add
+        :return:                bool
+        """
+        estimate = self.sketch.add(key, count)
+        top = self.top
+        if key in top:
+            top[key] = estimate
+            return True
+
+        if len(top) < self.k:
+            top[key] = estimate
+            self.floor = min(top.values())
+            return True
+
+        if estimate <= self.floor:
+            return False
+
+        del top[min(top, key=top.get)]
+        top[key] = estimate
+        self.floor = min(top.values())
+        return True
+
+    def __contains__(self, key):
+        return key in self.top
+
+    def items(self):
+        """
+        Items
+        Returns top keys with their frequency estimates, most frequent first.
+
+        :return:                list of tuples
+        """
+        return sorted(self.top.items(), key=lambda item: -item[1])
+
+    def reset(self):
+        """
+        Reset
+        Forgets all keys and frequencies.
+
+        :return:                None
+        """
+        self.sketch.reset()
+        self.top = dict()
+        self.floor = 0
+
+
+class BloomFilter:
+    """
+    Bloom filter
+    Answers whether a key was possibly added or definitely was not. Bits
+    are laid out most significant first within each byte, same as redis
+    bitmaps, and keys are hashed with a stable hash, so filters can be
+    exchanged between processes.
+    """
+
+    def __init__(self, size=2 ** 22, hashes=5):
+        """
+        Create filter
+        :param size:            int, number of bits (multiple of 8)
+        :param hashes:          int, number of hash functions
+        """
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(size // 8)
+
+    def positions(self, key):
+        """
+        Positions
+        Returns bit positions of the key using double hashing.
+
+        :param key:             string or bytes key
+        :return:                list of ints
+        """
+        if isinstance(key, str):
+            key = key.encode()
+        digest = blake2b(key, digest_size=8).digest()
+        first = int.from_bytes(digest[:4], 'little')
+        second = int.from_bytes(digest[4:], 'little') | 1
+        size = self.size
+        return [(first + i * second) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        """
+        Add
+        Adds key to the filter and returns its bit positions.
+
+        :param key:             string or bytes key
+        :return:                list of ints
+        """
+        positions = self.positions(key)
+        self.set_bits(positions)
+        return positions
+
+    def set_bits(self, positions):
+        """
+        Set bits
+        Sets bits at given positions.
+
+        :param positions:       iterable of ints
+        :return:                None
+        """
+        bits = self.bits
+        for position in positions:
+            bits[position >> 3] |= 0x80 >> (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            if not bits[position >> 3] & (0x80 >> (position & 7)):
+                return False
+        return True
+
+    def load(self, data):
+        """
+        Load
+        Replaces filter bits with raw bitmap, padding or truncating it to
+        filter size.
+
+        :param data:            bytes
+        :return:                None
+        """
+        length = len(self.bits)
+        data = bytes(data[:length])
+        self.bits = bytearray(data + bytes(length - len(data)))
+
+    def clear(self):
+        """
+        Clear
+        Removes all keys from the filter.
+
+        :return:                None
+        """
+        self.bits = bytearray(len(self.bits))
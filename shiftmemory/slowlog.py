@@ -0,0 +1,182 @@
+"""
+Slow log
+Records cache operations exceeding a latency threshold to a bounded ring
+buffer, so that the occasional delete by tags expanding to thousands of
+deletes or a long optimize pass can be found after the fact. Each entry
+has the operation, its key, number of keys and tags, bytes, duration and
+number of round trips and commands sent to the server.
+
+Slow log is a hook (see hooks module). Entries are kept in the process,
+and adapters able to store them (redis) also share them with other
+processes, so that they can be inspected from the command line.
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+
+from shiftmemory import exceptions
+from shiftmemory.hooks import Hook
+
+
+class SlowLog(Hook):
+    """
+    Slow log
+    Keeps last entries of operations slower than threshold, newest first.
+    Entries are shared with the cache from a background thread, like trace
+    recorder does, so that a request that was already slow (often because
+    the server is) does not wait for another round trip to it. When sharing
+    falls behind and the queue is full the oldest queued entries are only
+    kept locally and counted as dropped.
+    """
+
+    def __init__(self, threshold=0.05, size=128, cache=None):
+        """
+        Create slow log
+        :param threshold:       float, seconds an operation may take
+        :param size:            int, maximum number of entries
+        :param cache:           optional adapter to share entries with
+        """
+        if threshold is None or threshold < 0:
+            msg = 'Slow log threshold must be zero or more seconds'
+            raise exceptions.ConfigurationException(msg)
+
+        self.threshold = threshold
+        self.size = size
+        self.cache = cache
+        self.entries = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.pending = queue.Queue(size)
+        self.dropped = 0
+        self.sharer = None
+
+    def after(self, event):
+        if event.duration is None or event.duration < self.threshold:
+            return
+
+        entry = dict(
+            time=time.time(),
+            operation=event.operation,
+            cache=event.cache,
+            adapter=event.adapter,
+            key=event.key,
+            keys=event.keys,
+            tags=event.tags,
+            bytes=event.bytes,
+            duration=event.duration,
+            round_trips=event.round_trips,
+            commands=event.commands,
+            pipeline=event.pipeline,
+            error=repr(event.error) if event.error is not None else None,
+        )
+
+        with self.lock:
+            self.entries.appendleft(entry)
+
+        if not hasattr(self.cache, 'push_slow_log'):
+            return
+
+        if self.sharer is None:
+            self.start()
+        while True:
+            try:
+                self.pending.put_nowait(entry)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.pending.get_nowait()
+                self.pending.task_done()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def start(self):
+        """
+        Start
+        Starts background thread sharing entries with the cache.
+
+        :return:                None
+        """
+        with self.lock:
+            if self.sharer is not None:
+                return
+            self.sharer = threading.Thread(
+                target=self.share,
+                name='shiftmemory-slowlog',
+                daemon=True
+            )
+            self.sharer.start()
+            atexit.register(self.flush, timeout=1)
+
+    def share(self):
+        """
+        Share
+        Sharing thread loop. Pushes queued entries to the cache.
+
+        :return:                None
+        """
+        while True:
+            entry = self.pending.get()
+            try:
+                self.cache.push_slow_log(entry, self.size)
+            except Exception:
+                # never fail because the slow log could not be shared
+                pass
+            finally:
+                self.pending.task_done()
+
+    def flush(self, timeout=None):
+        """
+        Flush
+        Waits until queued entries are shared with the cache.
+
+        :param timeout:         float, maximum seconds to wait
+        :return:                bool, whether all entries were shared
+        """
+        pending = self.pending
+        with pending.all_tasks_done:
+            return pending.all_tasks_done.wait_for(
+                lambda: not pending.unfinished_tasks,
+                timeout
+            )
+
+    def get_entries(self, limit=None):
+        """
+        Get entries
+        Returns entries recorded by this process, newest first.
+
+        :param limit:           int, number of entries to return
+        :return:                list of dicts
+        """
+        with self.lock:
+            entries = list(self.entries)
+        return entries[:limit] if limit is not None else entries
+
+    def clear(self):
+        """
+        Clear
+        Drops all entries recorded by this process.
+
+        :return:                None
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+def create(config, cache=None):
+    """
+    Create
+    Returns slow log from cache configuration, which is either true for
+    defaults, threshold in seconds or a dictionary of SlowLog options.
+
+    :param config:              bool, float or dict, slow log options
+    :param cache:               optional adapter to share entries with
+    :return:                    SlowLog
+    """
+    if config is True:
+        return SlowLog(cache=cache)
+    if isinstance(config, dict):
+        return SlowLog(cache=cache, **config)
+    return SlowLog(threshold=config, cache=cache)
@@ -0,0 +1,169 @@
+"""
+Snapshot
+Exports cache items to compact snapshot files and loads them back, so that
+caches can be warmed up after deploys or failovers instead of starting
+cold and sending every request to the backend.
+
+Snapshot file is gzipped JSON lines: a header followed by one record per
+item with its key (relative to namespace), value, remaining ttl in
+milliseconds and tags. Items can be exported from any adapter able to
+iterate its items. Files are written and read as streams, so that
+memory use does not depend on number of items.
+"""
+import base64
+import collections
+import gzip
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from shiftmemory import exceptions
+
+FORMAT = 'shiftmemory-snapshot'
+VERSION = 1
+
+# flag of records holding base64 encoded bytes
+BYTES = 1
+
+
+def write(path, records, cache=None):
+    """
+    Write
+    Writes (key, value, ttl, tags) records to snapshot file. Values must be
+    strings, numbers or bytes. Returns number of written items and time
+    taken.
+
+    :param path:                string, snapshot file path
+    :param records:             iterable of records
+    :param cache:               string, optional name of exported cache
+    :return:                    dict
+    """
+    started = time.perf_counter()
+    header = dict(format=FORMAT, version=VERSION, cache=cache)
+    header['created'] = time.time()
+
+    keys = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        file.write(json.dumps(header) + '\n')
+        for key, value, ttl, tags in records:
+            record = [key, value, ttl, tags]
+            if isinstance(value, bytes):
+                record[1] = base64.b64encode(value).decode('ascii')
+                record.append(BYTES)
+            try:
+                line = json.dumps(record, separators=(',', ':'))
+            except (TypeError, ValueError):
+                msg = 'Can not snapshot value of item [{}]'.format(key)
+                raise exceptions.ValueException(msg)
+            file.write(line + '\n')
+            keys += 1
+
+    return dict(keys=keys, time=time.perf_counter() - started)
+
+
+def read(path):
+    """
+    Read
+    Reads snapshot file. Returns its header and a generator of records.
+
+    :param path:                string, snapshot file path
+    :return:                    tuple, (header dict, generator)
+    """
+    file = gzip.open(path, 'rt', encoding='utf-8')
+    try:
+        header = json.loads(file.readline())
+    except (OSError, ValueError):
+        header = None
+
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        file.close()
+        raise exceptions.ValueException('Not a snapshot file: ' + path)
+
+    def records():
+        with file:
+            for line in file:
+                record = json.loads(line)
+                key, value, ttl, tags = record[:4]
+                if record[4:] == [BYTES]:
+                    value = base64.b64decode(value)
+                yield key, value, ttl, tags
+
+    return header, records()
+
+
+def batched(records, size):
+    """
+    Batched
+    Groups records into lists of given size.
+
+    :param records:             iterable of records
+    :param size:                int, records per batch
+    :return:                    generator of lists
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_batch(cache, batch):
+    """
+    Import batch
+    Writes records with adapter's bulk import if it has one, otherwise
+    sets items one by one.
+
+    :param cache:               adapter instance
+    :param batch:               list of records
+    :return:                    int, number of written items
+    """
+    if hasattr(cache, 'import_items'):
+        return cache.import_items(batch)
+
+    for key, value, ttl, tags in batch:
+        ttl = -(-ttl // 1000) if ttl else None
+        cache.set(key, value, tags=tags, ttl=ttl)
+    return len(batch)
+
+
+def load(cache, records, batch_size=1000, workers=4, rate_limit=None):
+    """
+    Load
+    Writes records to cache in batches on a pool of workers, keeping no
+    more than two batches per worker in flight. Sleeps between batches to
+    keep under rate limit (keys per second). Returns number of loaded
+    items and time taken. First failed batch stops loading.
+
+    :param cache:               adapter instance
+    :param records:             iterable of records
+    :param batch_size:          int, records per batch
+    :param workers:             int, concurrent batches
+    :param rate_limit:          float, maximum keys per second
+    :return:                    dict
+    """
+    started = time.perf_counter()
+    result = dict(keys=0)
+    pending = collections.deque()
+    submitted = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for batch in batched(records, batch_size):
+            while len(pending) >= max(1, workers) * 2:
+                result['keys'] += pending.popleft().result()
+
+            pending.append(executor.submit(import_batch, cache, batch))
+            submitted += len(batch)
+            if rate_limit:
+                elapsed = time.perf_counter() - started
+                ahead = submitted / rate_limit - elapsed
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        while pending:
+            result['keys'] += pending.popleft().result()
+
+    result['time'] = time.perf_counter() - started
+    return result
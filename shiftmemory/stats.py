@@ -0,0 +1,189 @@
+"""
+Stats utilities
+A collection of sampling and estimation helpers used to profile caches
+without walking every item. May be used across all cache adapters that
+support stats.
+"""
+import math
+import random
+
+
+class Reservoir:
+    """
+    Reservoir
+    Keeps uniform random sample of fixed size from a stream of unknown
+    length (algorithm R), so that huge namespaces can be sampled in
+    constant memory.
+    """
+
+    def __init__(self, size, seed=None):
+        """
+        Create reservoir
+        :param size:            int, sample size
+        :param seed:            optional random seed
+        """
+        self.size = size
+        self.items = []
+        self.seen = 0
+        self.random = random.Random(seed)
+
+    def add(self, item):
+        """
+        Add
+        Offers an item from the stream to the sample.
+
+        :param item:            sampled item
+        :return:                None
+        """
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+            return
+
+        index = self.random.randrange(self.seen)
+        if index < self.size:
+            self.items[index] = item
+
+
+def estimate(values, population=None, z=1.96):
+    """
+    Estimate
+    Returns mean of sampled values with confidence interval (95% by
+    default). If population size is given also estimates population
+    total with its bounds.
+
+    :param values:              list of numbers
+    :param population:          int, population size
+    :param z:                   float, z-score of confidence level
+    :return:                    dict
+    """
+    values = [value for value in values if value is not None]
+    count = len(values)
+    if not count:
+        return dict(samples=0, mean=None, low=None, high=None)
+
+    mean = sum(values) / count
+    variance = 0
+    if count > 1:
+        variance = sum((value - mean) ** 2 for value in values) / (count - 1)
+
+    error = z * math.sqrt(variance / count)
+
+    # finite population correction
+    if population and population > 1 and count < population:
+        error *= math.sqrt((population - count) / (population - 1))
+    if population and count >= population:
+        error = 0
+
+    result = dict(
+        samples=count,
+        mean=mean,
+        low=max(0, mean - error),
+        high=mean + error
+    )
+    if population is not None:
+        result['total'] = mean * population
+        result['total_low'] = result['low'] * population
+        result['total_high'] = result['high'] * population
+
+    return result
+
+
+def proportion(hits, trials, z=1.96):
+    """
+    Proportion
+    Estimates proportion from the number of hits in trials with Wilson
+    score interval.
+
+    :param hits:                int, successful trials
+    :param trials:              int, total trials
+    :param z:                   float, z-score of confidence level
+    :return:                    tuple, (proportion, low, high)
+    """
+    if not trials:
+        return 0, 0, 1
+
+    p = hits / trials
+    denominator = 1 + z ** 2 / trials
+    center = (p + z ** 2 / (2 * trials)) / denominator
+    spread = z * math.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2))
+    spread /= denominator
+    return p, max(0, center - spread), min(1, center + spread)
+
+
+def size_histogram(values):
+    """
+    Size histogram
+    Counts values into power of two buckets. Returns a list of
+    (upper bound, count) tuples for non-empty buckets.
+
+    :param values:              list of sizes
+    :return:                    list
+    """
+    buckets = dict()
+    for value in values:
+        if value is None:
+            continue
+        bound = 1 if value <= 1 else 2 ** math.ceil(math.log2(value))
+        buckets[bound] = buckets.get(bound, 0) + 1
+
+    return sorted(buckets.items())
+
+
+def ttl_histogram(ttls):
+    """
+    TTL histogram
+    Counts remaining ttls (seconds, negative for no expiration) into
+    human readable buckets.
+
+    :param ttls:                list of ttls
+    :return:                    dict
+    """
+    buckets = [
+        ('1m', 60),
+        ('1h', 3600),
+        ('1d', 86400),
+        ('1w', 604800),
+    ]
+    histogram = dict(none=0)
+    for label, _ in buckets:
+        histogram['<' + label] = 0
+    histogram['>=1w'] = 0
+
+    for ttl in ttls:
+        if ttl is None:
+            continue
+        if ttl < 0:
+            histogram['none'] += 1
+            continue
+        for label, bound in buckets:
+            if ttl < bound:
+                histogram['<' + label] += 1
+                break
+        else:
+            histogram['>=1w'] += 1
+
+    return histogram
+
+
+def percentiles(values, points=(50, 90, 99, 99.9)):
+    """
+    Percentiles
+    Returns nearest-rank percentiles of values along with minimum and
+    maximum, e.g. for latency distributions.
+
+    :param values:              list of numbers
+    :param points:              iterable of percentiles (0-100)
+    :return:                    dict
+    """
+    values = sorted(values)
+    count = len(values)
+    if not count:
+        return dict(count=0)
+
+    result = dict(count=count, min=values[0], max=values[-1])
+    for point in points:
+        rank = max(1, math.ceil(point / 100 * count))
+        result['p{:g}'.format(point)] = values[rank - 1]
+
+    return result
@@ -0,0 +1,441 @@
+"""
+Trace
+Records compact binary traces of cache operations and replays them
+against adapters or simulated policies, so that cache sizing questions
+(what happens with twice the capacity?) can be answered offline.
+
+Trace file starts with a header (magic and sample rate) followed by fixed
+size records: timestamp, hashed key, value size, ttl, operation and flags.
+Keys are never stored, only their 64-bit hashes. Sampling is done by key
+hash, so either all or none of the operations on a key are recorded.
+"""
+import atexit
+import collections
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+from hashlib import blake2b
+
+from shiftmemory import exceptions, policy, stats
+
+MAGIC = b'SMTRACE1'
+HEADER = struct.Struct('<8sd')
+RECORD = struct.Struct('<dQIiBB')
+
+OPERATIONS = ('get', 'set', 'add', 'delete', 'delete_tags', 'delete_all')
+HIT = 1
+
+Record = collections.namedtuple(
+    'Record',
+    ['timestamp', 'operation', 'key', 'size', 'ttl', 'hit']
+)
+
+
+def hash_key(key):
+    """
+    Hash key
+    Returns stable 64-bit hash of the key.
+
+    :param key:                 string or bytes key
+    :return:                    int
+    """
+    if isinstance(key, str):
+        key = key.encode()
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), 'little')
+
+
+def get_size(value):
+    """
+    Get size
+    Returns size of cached value in bytes (characters for strings).
+
+    :param value:               cached value
+    :return:                    int
+    """
+    if value is None:
+        return 0
+    try:
+        return len(value)
+    except TypeError:
+        return len(str(value))
+
+
+class Recorder:
+    """
+    Recorder
+    Buffers trace records in memory and writes them to file from a
+    background thread, so recording costs a hash and a queue put. When
+    writer falls behind and buffer is full records are dropped and counted
+    rather than slowing the cache down.
+    """
+
+    def __init__(
+        self,
+        path,
+        sample_rate=1.0,
+        buffer_size=65536,
+        flush_interval=1
+    ):
+        """
+        Create recorder
+        :param path:            string, trace file path
+        :param sample_rate:     float, share of keys to record (0-1)
+        :param buffer_size:     int, maximum records waiting to be written
+        :param flush_interval:  float, seconds between writes
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.threshold = int(sample_rate * 2 ** 64)
+        self.flush_interval = flush_interval
+        self.buffer = queue.Queue(buffer_size)
+        self.dropped = 0
+        self.recorded = 0
+        self.writer = None
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def record(self, operation, key=None, size=0, ttl=None, hit=False):
+        """
+        Record
+        Puts operation on sampled key into write buffer.
+
+        :param operation:       string, one of OPERATIONS
+        :param key:             string, item key (None for bulk operations)
+        :param size:            int, value size
+        :param ttl:             int, item ttl (None if not given)
+        :param hit:             bool, whether get found the item
+        :return:                bool, whether operation was recorded
+        """
+        key_hash = hash_key(key) if key is not None else 0
+        if key is not None and key_hash >= self.threshold:
+            return False
+
+        if self.writer is None:
+            self.start()
+
+        data = RECORD.pack(
+            time.time(),
+            key_hash,
+            min(size, 0xFFFFFFFF),
+            -1 if ttl is None else int(ttl),
+            OPERATIONS.index(operation),
+            HIT if hit else 0
+        )
+        try:
+            self.buffer.put_nowait(data)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        self.recorded += 1
+        return True
+
+    def start(self):
+        """
+        Start
+        Opens trace file (writing header to new files) and starts
+        background writer.
+
+        :return:                None
+        """
+        with self.lock:
+            if self.writer is not None:
+                return
+
+            file = open(self.path, 'ab')
+            if not file.tell():
+                file.write(HEADER.pack(MAGIC, self.sample_rate))
+
+            self.writer = threading.Thread(
+                target=self.write,
+                args=(file,),
+                name='shiftmemory-trace',
+                daemon=True
+            )
+            self.writer.start()
+            atexit.register(self.close)
+
+    def write(self, file):
+        """
+        Write
+        Writer thread loop. Drains buffer into file until closed.
+
+        :param file:            open trace file
+        :return:                None
+        """
+        with file:
+            while True:
+                batch = []
+                closing = False
+                try:
+                    item = self.buffer.get(timeout=self.flush_interval)
+                    while item is not None:
+                        batch.append(item)
+                        item = self.buffer.get_nowait()
+                    closing = True
+                except queue.Empty:
+                    pass
+
+                if batch:
+                    file.write(b''.join(batch))
+                    file.flush()
+                if closing:
+                    return
+
+    def close(self):
+        """
+        Close
+        Writes out buffered records and stops writer.
+
+        :return:                None
+        """
+        with self.lock:
+            if self.writer is None or self.closed:
+                return
+            self.closed = True
+
+        self.buffer.put(None)
+        self.writer.join()
+
+
+def read(path):
+    """
+    Read
+    Reads trace file. Returns its sample rate and a generator of records.
+
+    :param path:                string, trace file path
+    :return:                    tuple, (sample rate, generator)
+    """
+    file = open(path, 'rb')
+    header = file.read(HEADER.size)
+    if len(header) < HEADER.size or header[:8] != MAGIC:
+        file.close()
+        raise exceptions.ValueException('Not a trace file: ' + path)
+
+    sample_rate = HEADER.unpack(header)[1]
+
+    def records():
+        with file:
+            while True:
+                data = file.read(RECORD.size * 4096)
+                usable = len(data) - len(data) % RECORD.size
+                for fields in RECORD.iter_unpack(data[:usable]):
+                    timestamp, key, size, ttl, operation, flags = fields
+                    yield Record(
+                        timestamp,
+                        OPERATIONS[operation],
+                        key,
+                        size,
+                        None if ttl < 0 else ttl,
+                        bool(flags & HIT)
+                    )
+                if len(data) < RECORD.size * 4096:
+                    return
+
+    return sample_rate, records()
+
+
+class Traced:
+    """
+    Traced cache
+    Wraps any adapter and records its operations to trace recorder. All
+    other attributes are delegated to the adapter.
+    """
+
+    def __init__(self, cache, recorder):
+        """
+        Wrap adapter
+        :param cache:           adapter instance
+        :param recorder:        Recorder instance
+        """
+        self.cache = cache
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def get(self, key=None):
+        value = self.cache.get(key)
+        hit = value is not None
+        self.recorder.record('get', key, get_size(value), hit=hit)
+        return value
+
+    def set(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        result = self.cache.set(
+            key,
+            value,
+            tags=tags,
+            ttl=ttl,
+            expires_at=expires_at
+        )
+        self.recorder.record('set', key, get_size(value), ttl)
+        return result
+
+    def add(self, key, value, *, tags=None, ttl=None, expires_at=None):
+        result = self.cache.add(
+            key,
+            value,
+            tags=tags,
+            ttl=ttl,
+            expires_at=expires_at
+        )
+        if result:
+            self.recorder.record('add', key, get_size(value), ttl)
+        return result
+
+    def delete(self, key=None, *, tags=None, disjunction=False):
+        result = self.cache.delete(key, tags=tags, disjunction=disjunction)
+        if key:
+            self.recorder.record('delete', key)
+        else:
+            self.recorder.record('delete_tags')
+        return result
+
+    def delete_all(self):
+        result = self.cache.delete_all()
+        self.recorder.record('delete_all')
+        return result
+
+
+def create_recorder(name, config):
+    """
+    Create recorder
+    Creates recorder for cache by name from trace config, which is
+    either true for defaults or a dictionary of Recorder options.
+
+    :param name:                string, cache name
+    :param config:              bool or dict, trace config
+    :return:                    Recorder
+    """
+    options = dict(config) if isinstance(config, dict) else dict()
+    if 'path' not in options:
+        filename = 'shiftmemory-{}.trace'.format(name)
+        options['path'] = os.path.join(tempfile.gettempdir(), filename)
+    return Recorder(**options)
+
+
+# -----------------------------------------------------------------------------
+# Replay
+# -----------------------------------------------------------------------------
+
+def replay(records, target, sample_rate=1.0):
+    """
+    Replay
+    Runs trace records against a target, which is either an adapter
+    instance or a policy, as fast as possible. Gets are counted as hits
+    or misses, sets, adds and deletes are applied. Bulk deletes are only
+    applied to adapters. Expiration is not simulated for policies.
+
+    Returns number of requests, hits, misses and hit ratio of gets,
+    memory used by items at the end (resident value bytes for policies,
+    adapter estimate if available, scaled up by sample rate) and latency
+    distribution per operation in microseconds.
+
+    :param records:             iterable of Record
+    :param target:              adapter or policy instance
+    :param sample_rate:         float, trace sample rate
+    :return:                    dict
+    """
+    simulated = not hasattr(target, 'get')
+    sizes = dict()
+    resident = 0
+    hits = misses = 0
+    latencies = collections.defaultdict(list)
+    clock = time.perf_counter
+
+    for record in records:
+        operation = record.operation
+        key = 'k{:016x}'.format(record.key)
+        started = clock()
+
+        if simulated:
+            if operation == 'get':
+                hit = key in target
+                if hit:
+                    target.access(key)
+            elif operation in ('set', 'add'):
+                if key in target:
+                    resident += record.size - sizes.get(key, 0)
+                    target.access(key)
+                else:
+                    resident += record.size
+                    for evicted in target.admit(key):
+                        resident -= sizes.get(evicted, 0)
+                sizes[key] = record.size
+            elif operation == 'delete' and key in target:
+                target.remove(key)
+                resident -= sizes.get(key, 0)
+        else:
+            if operation == 'get':
+                hit = target.get(key) is not None
+            elif operation in ('set', 'add'):
+                method = getattr(target, operation)
+                method(key, 'x' * record.size, ttl=record.ttl)
+            elif operation == 'delete':
+                target.delete(key)
+            elif operation == 'delete_all':
+                target.delete_all()
+
+        latencies[operation].append((clock() - started) * 1e6)
+        if operation == 'get':
+            if hit:
+                hits += 1
+            else:
+                misses += 1
+
+    requests = hits + misses
+    scale = 1 / sample_rate if sample_rate else 1
+    memory = resident if simulated else get_memory(target)
+    latency = dict()
+    for operation, values in latencies.items():
+        latency[operation] = stats.percentiles(values)
+
+    return dict(
+        requests=requests,
+        hits=hits,
+        misses=misses,
+        hit_ratio=hits / requests if requests else 0,
+        memory=memory * scale if memory is not None else None,
+        latency=latency,
+    )
+
+
+def get_memory(cache):
+    """
+    Get memory
+    Returns memory used by adapter if it can tell, otherwise None.
+
+    :param cache:               adapter instance
+    :return:                    int or None
+    """
+    if hasattr(cache, 'get_size'):
+        return cache.get_size()
+    if hasattr(cache, 'stats'):
+        return cache.stats()['memory'].get('total')
+    return None
+
+
+def simulate(path, capacities, policies=('lru', 'lfu', 'tinylfu')):
+    """
+    Simulate
+    Replays trace file against policies of every given capacity. Capacity
+    is in items at full scale and is scaled down by trace sample rate.
+
+    :param path:                string, trace file path
+    :param capacities:          iterable of ints, capacities in items
+    :param policies:            iterable of policy names
+    :return:                    list of dicts
+    """
+    results = []
+    for capacity in capacities:
+        for name in policies:
+            sample_rate, records = read(path)
+            scaled = max(1, int(capacity * sample_rate))
+            result = replay(records, policy.create(name, scaled), sample_rate)
+            result.update(policy=name, capacity=capacity)
+            results.append(result)
+
+    return results
@@ -0,0 +1,277 @@
+"""
+Write-behind
+Bounded in-process buffer for fire-and-forget writes. Writes are queued
+by key, so repeated writes of the same key are coalesced, and a background
+flusher sends them to the cache in batches once enough of them are pending
+or the oldest one waited long enough.
+
+Writes still in the buffer are lost if the process dies. Readers in the
+same process see pending writes, other processes see them after a flush.
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+from shiftmemory import exceptions
+
+OVERFLOW = ('block', 'drop', 'sync')
+
+
+class WriteBuffer:
+    """
+    Write buffer
+    Queues items by key and writes them with the given writer function,
+    which receives a list of queued items. When buffer is full new keys
+    either wait for the flusher (block), are discarded (drop) or are
+    written right away by the caller (sync).
+    """
+
+    def __init__(
+        self,
+        writer,
+        max_items=10000,
+        batch_size=500,
+        interval=0.05,
+        overflow='block'
+    ):
+        """
+        Create buffer
+        :param writer:          callable, writes a list of items
+        :param max_items:       int, maximum number of pending keys
+        :param batch_size:      int, items per write, flush trigger
+        :param interval:        float, maximum seconds a write waits
+        :param overflow:        string, block, drop or sync
+        """
+        if overflow not in OVERFLOW:
+            msg = 'Unknown overflow policy [{}], use one of: {}'
+            msg = msg.format(overflow, ', '.join(OVERFLOW))
+            raise exceptions.ConfigurationException(msg)
+
+        self.writer = writer
+        self.max_items = max_items
+        self.batch_size = batch_size
+        self.interval = interval
+        self.overflow = overflow
+
+        self.items = OrderedDict()
+        self.inflight = dict()
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.stopped = False
+        self.flusher = None
+
+        self.counts = dict(
+            written=0,
+            coalesced=0,
+            blocked=0,
+            dropped=0,
+            synced=0,
+            errors=0,
+        )
+
+    def put(self, key, item):
+        """
+        Put
+        Queues item by key replacing pending item of the same key. Returns
+        false if item was dropped because buffer is full. Once buffer is
+        closed items are written right away.
+
+        :param key:             string, item key
+        :param item:            item to write
+        :return:                bool
+        """
+        if self.flusher is None:
+            self.start()
+
+        with self.condition:
+            if key in self.items:
+                self.items[key] = (item, self.items[key][1])
+                self.counts['coalesced'] += 1
+                return True
+
+            full = len(self.items) >= self.max_items or self.stopped
+            if full and self.overflow == 'block' and not self.stopped:
+                self.counts['blocked'] += 1
+                while len(self.items) >= self.max_items and not self.stopped:
+                    self.condition.notify_all()
+                    self.condition.wait(self.interval)
+                full = len(self.items) >= self.max_items or self.stopped
+
+            if not full:
+                self.items[key] = (item, time.monotonic())
+                if len(self.items) >= self.batch_size:
+                    self.condition.notify_all()
+                return True
+
+            if self.overflow == 'drop' and not self.stopped:
+                self.counts['dropped'] += 1
+                return False
+
+            self.counts['synced'] += 1
+
+        self.writer([item])
+        return True
+
+    def get(self, key):
+        """
+        Get
+        Returns pending item by key, including items being written now.
+
+        :param key:             string, item key
+        :return:                item or None
+        """
+        with self.condition:
+            if key in self.items:
+                return self.items[key][0]
+            return self.inflight.get(key)
+
+    def discard(self, key):
+        """
+        Discard
+        Drops pending item by key and waits for it to be written if it is
+        being written now, so that it does not land after a delete.
+
+        :param key:             string, item key
+        :return:                bool, whether item was pending
+        """
+        with self.condition:
+            pending = self.items.pop(key, None) is not None
+            while key in self.inflight:
+                self.condition.wait()
+            return pending
+
+    def clear(self):
+        """
+        Clear
+        Drops all pending items and waits for current write to finish.
+
+        :return:                None
+        """
+        with self.condition:
+            self.items.clear()
+            while self.inflight:
+                self.condition.wait()
+
+    def write_next(self):
+        """
+        Write next
+        Writes a batch of oldest pending items. Returns number of items in
+        the batch. Failed batches are counted and discarded.
+
+        :return:                int
+        """
+        with self.write_lock:
+            with self.condition:
+                batch = []
+                while self.items and len(batch) < self.batch_size:
+                    key, (item, _) = self.items.popitem(last=False)
+                    batch.append((key, item))
+                self.inflight = dict(batch)
+
+            if not batch:
+                return 0
+
+            try:
+                self.writer([item for _, item in batch])
+                self.counts['written'] += len(batch)
+            except Exception:
+                self.counts['errors'] += 1
+            finally:
+                with self.condition:
+                    self.inflight = dict()
+                    self.condition.notify_all()
+
+            return len(batch)
+
+    def flush(self):
+        """
+        Flush
+        Writes all pending items.
+
+        :return:                None
+        """
+        while self.write_next():
+            pass
+
+    def start(self):
+        """
+        Start
+        Starts background flusher.
+
+        :return:                None
+        """
+        with self.condition:
+            if self.flusher is not None:
+                return
+
+            self.flusher = threading.Thread(
+                target=self.run,
+                name='shiftmemory-write-behind',
+                daemon=True
+            )
+            self.flusher.start()
+            atexit.register(self.close)
+
+    def run(self):
+        """
+        Run
+        Flusher thread loop. Writes a batch when enough items are pending
+        or the oldest one waited for the interval.
+
+        :return:                None
+        """
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    if len(self.items) >= self.batch_size:
+                        break
+
+                    timeout = self.interval
+                    if self.items:
+                        enqueued = next(iter(self.items.values()))[1]
+                        timeout -= time.monotonic() - enqueued
+                        if timeout <= 0:
+                            break
+
+                    self.condition.wait(timeout)
+
+                if self.stopped:
+                    return
+
+            self.write_next()
+
+    def close(self):
+        """
+        Close
+        Stops flusher and writes all pending items.
+
+        :return:                None
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
+
+    def stats(self):
+        """
+        Stats
+        Returns buffer metrics: number of pending items (depth), age of
+        the oldest pending item in seconds and counters of written,
+        coalesced, blocked, dropped and synchronously written items and of
+        failed batches.
+
+        :return:                dict
+        """
+        with self.condition:
+            oldest = 0
+            if self.items:
+                oldest = time.monotonic() - next(iter(self.items.values()))[1]
+            return dict(
+                depth=len(self.items),
+                oldest_age=oldest,
+                **self.counts
+            )
@@ -0,0 +1,77 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import os
+import shutil
+import tempfile
+
+from shiftmemory.adapter import Redis, Local, Sqlite, Shared
+from shiftmemory.conformance import Conformance
+
+
+@attr('integration', 'redis', 'conformance')
+class RedisConformanceTest(Conformance, TestCase):
+    """ Redis adapter, the reference """
+
+    def tearDown(self):
+        Redis('test').get_redis().flushdb()
+        TestCase.tearDown(self)
+
+    def create_adapter(self, namespace='test'):
+        return Redis(namespace, optimize_after=None)
+
+
+@attr('integration', 'redis', 'conformance')
+class RedisOptionsConformanceTest(RedisConformanceTest):
+    """ Redis adapter with tag versioning, compact keys and packing """
+
+    def create_adapter(self, namespace='test'):
+        return Redis(
+            namespace,
+            optimize_after=None,
+            tag_versioning=True,
+            compact_keys=dict(threshold=4),
+            packed=dict(max_size=16),
+            layout='string'
+        )
+
+
+@attr('local', 'conformance')
+class LocalConformanceTest(Conformance, TestCase):
+    """ In-process adapter """
+
+    def create_adapter(self, namespace='test'):
+        return Local(namespace)
+
+
+@attr('sqlite', 'conformance')
+class SqliteConformanceTest(Conformance, TestCase):
+    """ SQLite adapter """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    def create_adapter(self, namespace='test'):
+        path = os.path.join(self.dir, 'test.sqlite')
+        return Sqlite(namespace, config=dict(path=path))
+
+
+@attr('shared', 'conformance')
+class SharedConformanceTest(Conformance, TestCase):
+    """ Shared memory adapter, namespaces sharing a file """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    def create_adapter(self, namespace='test'):
+        path = os.path.join(self.dir, 'test.cache')
+        return Shared(namespace, config=dict(path=path, slots=256))
@@ -0,0 +1,127 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import time
+
+from shiftmemory import Memory, exceptions
+from shiftmemory.adapter import Local
+
+
+@attr('local')
+class LocalTest(TestCase):
+    """ This holds tests for in-process adapter """
+
+    def create(self, **config):
+        return Local('test', config=config)
+
+    # -------------------------------------------------------------------------
+
+    def test_create_via_memory(self):
+        """ Creating local cache from memory config """
+        memory = Memory(
+            adapters=dict(local=dict(type='local', config=dict(max_items=5))),
+            caches=dict(demo=dict(adapter='local', ttl=10))
+        )
+        cache = memory.get_cache('demo')
+        self.assertIsInstance(cache, Local)
+        self.assertEqual(5, cache.policy.capacity)
+
+    def test_raise_on_unknown_policy(self):
+        """ Raise on unknown policy """
+        with self.assertRaises(exceptions.ConfigurationException):
+            self.create(policy='random')
+
+    def test_set_and_get(self):
+        """ Setting and getting items """
+        cache = self.create()
+        self.assertTrue(cache.set('key', 'value'))
+        self.assertEqual('value', cache.get('key'))
+        self.assertTrue(cache.exists('key'))
+        self.assertFalse(cache.add('key', 'other'))
+        self.assertIsNone(cache.get('missing'))
+
+    def test_expire_items(self):
+        """ Items expire after ttl """
+        cache = self.create()
+        cache.set('key', 'value', ttl=0.05, tags=['tag'])
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(set(), cache.get_tagged_items('tag'))
+
+    def test_delete_by_tags(self):
+        """ Deleting items by tags with conjunction and disjunction """
+        cache = self.create()
+        cache.set('key1', 'value', tags=['tag1', 'tag2'])
+        cache.set('key2', 'value', tags=['tag2'])
+        cache.set('key3', 'value', tags=['tag3'])
+
+        self.assertTrue(cache.delete(tags=['tag1', 'tag2']))
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual('value', cache.get('key2'))
+
+        cache.delete(tags=['tag2', 'tag3'], disjunction=True)
+        self.assertFalse(cache.exists('key2'))
+        self.assertFalse(cache.exists('key3'))
+
+    def test_retag_item(self):
+        """ Overwriting item replaces its tags """
+        cache = self.create()
+        cache.set('key', 'value', tags=['one'])
+        cache.set('key', 'value', tags=['two'])
+        self.assertEqual(['two'], cache.get_item_tags('key'))
+        self.assertEqual(set(), cache.get_tagged_items('one'))
+
+    def test_lru_eviction(self):
+        """ Evicting least recently used item """
+        cache = self.create(max_items=2, policy='lru')
+        cache.set('key1', 'value')
+        cache.set('key2', 'value')
+        cache.get('key1')
+        cache.set('key3', 'value', tags=['tag'])
+        self.assertIsNone(cache.get('key2'))
+        self.assertEqual(2, len(cache.items))
+
+    def test_tinylfu_keeps_popular_items_during_scan(self):
+        """ One-off keys do not evict popular items """
+        cache = self.create(max_items=100)
+        for _ in range(5):
+            for i in range(50):
+                if not cache.get('hot{}'.format(i)):
+                    cache.set('hot{}'.format(i), 'value')
+
+        for i in range(1000):
+            cache.set('scan{}'.format(i), 'value')
+
+        hot = sum(cache.exists('hot{}'.format(i)) for i in range(50))
+        self.assertTrue(hot >= 45)
+        self.assertTrue(len(cache.items) <= 100)
+
+    def test_optimize_removes_expired_items(self):
+        """ Optimizing drops expired items """
+        cache = self.create()
+        cache.set('key1', 'value', ttl=0.05)
+        cache.set('key2', 'value')
+        time.sleep(0.06)
+        cache.optimize()
+        self.assertEqual(['key2'], list(cache.items))
+        self.assertEqual(1, len(cache.policy))
+
+    def test_iter_items(self):
+        """ Iterating items by pattern and tag """
+        cache = self.create()
+        cache.set('one', 1, tags=['odd'], ttl=30)
+        cache.set('two', 2)
+        cache.set('three', 3, tags=['odd'])
+        cache.set('gone', 4, ttl=0.01)
+        time.sleep(0.02)
+
+        items = {r[0]: r for r in cache.iter_items(batch_size=2)}
+        self.assertEqual({'one', 'two', 'three'}, set(items))
+        key, value, ttl, tags = items['one']
+        self.assertEqual((1, ['odd']), (value, tags))
+        self.assertTrue(0 < ttl <= 30000)
+        self.assertIsNone(items['two'][3])
+
+        odd = sorted(r[0] for r in cache.iter_items(tag='odd'))
+        self.assertEqual(['one', 'three'], odd)
+        matched = [r[0] for r in cache.iter_items('t*', tag='odd')]
+        self.assertEqual(['three'], matched)
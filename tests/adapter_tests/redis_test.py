@@ -1,12 +1,24 @@
 from unittest import TestCase, mock
 from nose.plugins.attrib import attr
 from redis import StrictRedis
+from redis.exceptions import ConnectionError as RedisConnectionError
+import multiprocessing
+import os
+import tempfile
+import threading
 import time
 
-from shiftmemory import Memory, exceptions
+from shiftmemory import Memory, exceptions, benchmark, hooks, slowlog
 from shiftmemory.adapter import Redis
 
 
+def add_items(worker, count):
+    """ Races to add items from another process and counts wins """
+    redis = Redis('test')
+    added = redis.add_many({'lock-{}'.format(i): worker for i in range(count)})
+    redis.get_redis().incrby('test-wins', len(added))
+
+
 @attr('integration', 'redis')
 class RedisTest(TestCase):
     """ This holds tests for the main memory api """
@@ -185,6 +197,92 @@ class RedisTest(TestCase):
         self.assertFalse(redis.add(key, data2))
         self.assertEqual(data1, redis.get(key))
 
+    def test_add_item_with_tags_and_ttl(self):
+        """ Adding tagged item with custom ttl """
+        redis = Redis('test')
+        self.assertTrue(redis.add('key', 'value', tags=['a', 'b'], ttl=30))
+        self.assertFalse(redis.add('key', 'other', tags=['c']))
+
+        key = redis.get_full_item_key('key')
+        self.assertEqual('value', redis.get('key'))
+        self.assertTrue(0 < redis.get_redis().ttl(key) <= 30)
+        self.assertEqual(['a', 'b'], redis.get_item_tags('key'))
+        self.assertIn(key, redis.get_tagged_items('b'))
+
+    def test_add_replaces_stale_item(self):
+        """ Items of invalidated tag generations can be added again """
+        redis = Redis('test', tag_versioning=True)
+        self.assertTrue(redis.add('key', 'old', tags=['tag']))
+        redis.invalidate_tags(['tag'])
+        self.assertTrue(redis.add('key', 'new', tags=['tag']))
+        self.assertEqual('new', redis.get('key'))
+
+    def test_add_in_every_layout(self):
+        """ Adding plain, packed and tagged items """
+        options = [
+            dict(layout='string'),
+            dict(packed=dict(max_size=10)),
+            dict(compact_keys=dict(threshold=10)),
+        ]
+        for config in options:
+            redis = Redis('test', **config)
+            self.assertTrue(redis.add('tiny', '1'))
+            self.assertFalse(redis.add('tiny', '2'))
+            self.assertTrue(redis.add('tagged-item', '3', tags=['tag']))
+            self.assertFalse(redis.add('tagged-item', '4'))
+            self.assertEqual('1', redis.get('tiny'))
+            self.assertEqual('3', redis.get('tagged-item'))
+            self.assertTrue(redis.delete(tags=['tag']))
+            self.assertIsNone(redis.get('tagged-item'))
+            redis.delete_all()
+
+    def test_add_many(self):
+        """ Adding many items returns keys that were added """
+        redis = Redis('test')
+        redis.set('two', 'existing')
+        added = redis.add_many(dict(one='1', two='2', three='3'), ttl=30)
+        self.assertEqual(['one', 'three'], sorted(added))
+        self.assertEqual('existing', redis.get('two'))
+        self.assertEqual('3', redis.get('three'))
+
+    def test_add_from_many_threads(self):
+        """ Exactly one of concurrent adds in threads succeeds """
+        wins = []
+
+        def add(worker):
+            redis = Redis('test')
+            for i in range(50):
+                if redis.add('lock-{}'.format(i), worker, tags=['lock']):
+                    wins.append(i)
+
+        threads = [
+            threading.Thread(target=add, args=(str(worker),))
+            for worker in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(list(range(50)), sorted(wins))
+        self.assertEqual(50, len(Redis('test').get_tagged_items('lock')))
+
+    def test_add_from_many_processes(self):
+        """ Exactly one of concurrent adds in processes succeeds """
+        workers = [
+            multiprocessing.Process(target=add_items, args=(worker, 50))
+            for worker in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        redis = Redis('test')
+        self.assertEqual('50', redis.get_redis().get('test-wins'))
+        for i in range(50):
+            self.assertIn(redis.get('lock-{}'.format(i)), ['0', '1', '2', '3'])
+
     def test_can_get_by_key(self):
         """ Getting item by key """
         key = 'itemkey'
@@ -320,6 +418,126 @@ class RedisTest(TestCase):
 
         self.assertIsNone(redis.get_item_tags('no-item'))
 
+    # -------------------------------------------------------------------------
+    # Tag versioning
+    # -------------------------------------------------------------------------
+
+    def test_set_remembers_tag_versions(self):
+        """ Versioned set stores current tag generations with item """
+        redis = Redis('test', tag_versioning=True)
+        redis.invalidate_tags(['tag2'])
+        redis.set('item', 'data', tags=['tag1', 'tag2'])
+        self.assertEqual(['0', '1'], redis.get_item_tag_versions('item'))
+
+    def test_raise_on_invalidating_tags_without_versioning(self):
+        """ Raise when invalidating tags with versioning disabled """
+        redis = Redis('test')
+        with self.assertRaises(exceptions.AdapterFeatureMissingException):
+            redis.invalidate_tags(['tag'])
+
+    def test_delete_by_tags_increments_generations(self):
+        """ Deleting by versioned tags invalidates items lazily """
+        redis = Redis('test', tag_versioning=True)
+        redis.set('item1', 'data1', tags=['tag1', 'tag2'])
+        redis.set('item2', 'data2', tags=['tag2'])
+        redis.set('item3', 'data3', tags=['tag3'])
+
+        redis.delete(tags=['tag1', 'tag3'], disjunction=True)
+        self.assertIsNone(redis.get('item1'))
+        self.assertFalse(redis.exists('item3'))
+        self.assertEqual('data2', redis.get('item2'))
+
+        # stale item removed on read
+        full_key = redis.get_full_item_key('item1')
+        self.assertFalse(redis.get_redis().exists(full_key))
+
+    def test_delete_by_versioned_tags_with_conjunction(self):
+        """ Conjunction delete with versioned tags removes matching items """
+        redis = Redis('test', tag_versioning=True)
+        redis.set('item1', 'data1', tags=['tag1', 'tag2'])
+        redis.set('item2', 'data2', tags=['tag2'])
+
+        redis.delete(tags=['tag1', 'tag2'])
+        self.assertIsNone(redis.get('item1'))
+        self.assertEqual('data2', redis.get('item2'))
+
+    def test_item_written_after_invalidation_is_valid(self):
+        """ Items written after tag invalidation are not stale """
+        redis = Redis('test', tag_versioning=True)
+        redis.set('item', 'old', tags=['tag'])
+        redis.delete(tags=['tag'])
+        redis.set('item', 'new', tags=['tag'])
+        self.assertEqual('new', redis.get('item'))
+
+    def test_untagged_overwrite_after_tag_invalidation(self):
+        """ Overwriting invalidated item without tags makes it valid """
+        redis = Redis('test', tag_versioning=True)
+        redis.set('item', 'old', tags=['tag'])
+        redis.delete(tags=['tag'])
+        redis.set('item', 'new')
+        self.assertEqual('new', redis.get('item'))
+        self.assertIsNone(redis.get_item_tags('item'))
+
+    def test_retag_drops_old_tags(self):
+        """ Rewritten item is removed from sets of its old tags """
+        for options in (dict(), dict(compact_keys=dict(threshold=4))):
+            redis = Redis('test', **options)
+            redis.set('item', 'data', tags=['old', 'shared-long-tag'])
+            redis.set('item', 'data', tags=['new', 'shared-long-tag'])
+            self.assertEqual(set(), redis.get_tagged_items('old'))
+            self.assertEqual(1, len(redis.get_tagged_items('new')))
+            self.assertEqual(1, len(redis.get_tagged_items('shared-long-tag')))
+
+            redis.set('item', 'data')
+            self.assertEqual(set(), redis.get_tagged_items('new'))
+            redis.delete(tags=['old'])
+            self.assertEqual('data', redis.get('item'))
+            redis.get_redis().flushdb()
+
+    # -------------------------------------------------------------------------
+    # Namespace versioning
+    # -------------------------------------------------------------------------
+
+    def test_versioned_namespace_key_includes_generation(self):
+        """ Versioned namespace includes generation into item keys """
+        redis = Redis('test', namespace_versioning=True)
+        self.assertEqual('test::0::key', redis.get_full_item_key('key'))
+        self.assertEqual('test::0::tags::tag', redis.get_tag_set_key('tag'))
+
+    def test_delete_all_switches_namespace_generation(self):
+        """ Deleting all items in versioned namespace bumps generation """
+        redis = Redis('test', namespace_versioning=True)
+        redis.set('item', 'data', tags=['tag'])
+        old_key = redis.get_full_item_key('item')
+
+        self.assertTrue(redis.delete_all())
+        self.assertIsNone(redis.get('item'))
+        self.assertEqual('test::1::item', redis.get_full_item_key('item'))
+        self.assertTrue(redis.get_redis().exists(old_key))
+
+    def test_pick_up_generation_change_after_refresh(self):
+        """ Other adapters pick up namespace generation after refresh """
+        redis1 = Redis('test', namespace_versioning=True, namespace_refresh=0)
+        redis2 = Redis('test', namespace_versioning=True, namespace_refresh=0)
+        redis1.set('item', 'data')
+        self.assertEqual('data', redis2.get('item'))
+        redis1.delete_all()
+        self.assertIsNone(redis2.get('item'))
+
+    def test_sweep_removes_previous_generations(self):
+        """ Sweeping removes keys of previous namespace generations """
+        redis = Redis('test', namespace_versioning=True)
+        redis.set('item', 'data', tags=['tag'])
+        old_key = redis.get_full_item_key('item')
+        old_tag = redis.get_tag_set_key('tag')
+        redis.delete_all()
+        redis.set('item', 'data')
+
+        self.assertTrue(redis.sweep() >= 2)
+        self.assertFalse(redis.get_redis().exists(old_key))
+        self.assertFalse(redis.get_redis().exists(old_tag))
+        self.assertEqual('data', redis.get('item'))
+
     # -------------------------------------------------------------------------
     # Optimizing
     # -------------------------------------------------------------------------
@@ -367,6 +585,928 @@ class RedisTest(TestCase):
         self.assertNotIn('tag5', redis.get_item_tags('item3'))
         self.assertNotIn('tag5', redis.get_item_tags('item4'))
 
+    # -------------------------------------------------------------------------
+    # Stats
+    # -------------------------------------------------------------------------
+
+    def test_stats(self):
+        """ Collecting namespace stats """
+        redis = Redis('test')
+        for i in range(50):
+            tags = ['big'] if i % 2 else ['big', 'small']
+            redis.set('item{}'.format(i), 'x' * i, tags=tags)
+
+        result = redis.stats(sample_size=20)
+        self.assertTrue(result['complete'])
+        self.assertEqual(50, result['items']['count'])
+        self.assertEqual(2, result['tags'])
+        self.assertEqual(20, result['value_size']['samples'])
+        ttls = result['ttl_histogram']
+        self.assertEqual(20, ttls['<1m'] + ttls['<1h'])
+        self.assertEqual(dict(tag='big', items=50), result['top_tags'][0])
+
+    def test_estimate_stats_from_partial_scan(self):
+        """ Estimating item count when scan is limited """
+        redis = Redis('test')
+        for i in range(100):
+            redis.set('item{}'.format(i), 'data')
+
+        result = redis.stats(sample_size=10, scan_limit=10, batch_size=10)
+        self.assertFalse(result['complete'])
+        items = result['items']
+        self.assertTrue(items['low'] <= 100 <= items['high'])
+
+    # -------------------------------------------------------------------------
+    # Compact keys
+    # -------------------------------------------------------------------------
+
+    def test_compact_namespace_and_long_keys(self):
+        """ Compacting namespace names and long keys """
+        redis = Redis('test', compact_keys=dict(threshold=10))
+        other = Redis('other', compact_keys=True)
+        self.assertEqual('@1::', redis.namespace_prefix)
+        self.assertEqual('@2::', other.namespace_prefix)
+        self.assertEqual('@1::', Redis('test', compact_keys=True).item_prefix)
+
+        self.assertEqual('@1::short', redis.get_full_item_key('short'))
+        long_key = redis.get_full_item_key('x' * 100)
+        self.assertEqual(len('@1::') + 23, len(long_key))
+        self.assertEqual(long_key, redis.get_full_item_key('x' * 100))
+
+    def test_version_long_tags_with_compact_keys(self):
+        """ Tag versioning works with long tags and compact keys """
+        redis = Redis(
+            'test',
+            compact_keys=dict(threshold=10),
+            tag_versioning=True
+        )
+        tag = 'a-rather-long-tag-name'
+        redis.delete(tags=[tag])
+        redis.set('key', 'value', tags=[tag])
+        self.assertEqual('value', redis.get('key'))
+        redis.delete(tags=[tag])
+        self.assertIsNone(redis.get('key'))
+
+    def test_compact_tag_sets(self):
+        """ Tag sets store keys without namespace """
+        redis = Redis('test', compact_keys=dict(threshold=10))
+        key = 'https://example.com/' + 'a' * 50
+        redis.set(key, 'value', tags=['tag1', 'long tag name'])
+        redis.set('other', 'value', tags=['tag1'])
+
+        tag_key = redis.get_tag_set_key('tag1')
+        members = redis.get_redis().smembers(tag_key)
+        self.assertIn('other', members)
+        self.assertEqual({'@1::other', redis.get_full_item_key(key)},
+                         redis.get_tagged_items('tag1'))
+
+        batches = list(redis.scan_tagged(['tag1', 'long tag name']))
+        self.assertEqual([[redis.get_full_item_key(key)]], batches)
+
+        redis.delete(tags=['tag1', 'long tag name'])
+        self.assertIsNone(redis.get(key))
+        redis.delete(tags=['tag1'])
+        self.assertIsNone(redis.get('other'))
+
+    def test_read_legacy_keys_in_compat_mode(self):
+        """ Reading and deleting items stored with full keys """
+        legacy = Redis('test')
+        legacy.set('key', 'old', tags=['tag'])
+        legacy.set('other', 'old')
+
+        redis = Redis('test', compact_keys=dict(compat=True))
+        self.assertEqual('old', redis.get('key'))
+        self.assertTrue(redis.exists('other'))
+        self.assertIsNone(Redis('test', compact_keys=True).get('key'))
+
+        redis.set('key', 'new')
+        self.assertEqual('new', redis.get('key'))
+
+        redis.delete(tags=['tag'])
+        redis.delete('key')
+        self.assertIsNone(redis.get('key'))
+        redis.delete('other')
+        self.assertIsNone(legacy.get('other'))
+
+    def test_delete_legacy_items_once(self):
+        """ Deleting by tags in compat mode deletes legacy items once """
+        redis = Redis('test', compact_keys=dict(compat=True))
+        redis.set('one', '1', tags=['tag'])
+        redis.set('two', '2', tags=['tag'])
+
+        with mock.patch.object(redis.legacy, 'delete') as delete:
+            redis.delete(tags=['tag'], disjunction=True)
+        delete.assert_called_once_with(None, tags=['tag'], disjunction=True)
+        self.assertIsNone(redis.get('one'))
+        self.assertIsNone(redis.get('two'))
+
+    def test_compare_key_memory(self):
+        """ Compact keys take less memory """
+        result = benchmark.compare_key_memory(count=50, key_length=120)
+        plain, compact = result['plain'], result['compact']
+        self.assertEqual(50 + 10, plain['keys'])
+        self.assertTrue(compact['key_bytes'] < plain['key_bytes'] / 3)
+
+    # -------------------------------------------------------------------------
+    # Write-behind
+    # -------------------------------------------------------------------------
+
+    def test_buffer_writes(self):
+        """ Writes are buffered and visible in process until flushed """
+        redis = Redis('test', write_behind=dict(interval=60))
+        other = Redis('test')
+        redis.set('key', 'value')
+        redis.set('tagged', 'value', tags=['tag'])
+        self.assertEqual('value', redis.get('key'))
+        self.assertTrue(redis.exists('key'))
+        self.assertEqual(dict(key='value'), redis.get_many(['key']))
+        self.assertIsNone(other.get('key'))
+        self.assertEqual(2, redis.write_behind_stats()['depth'])
+
+        redis.flush_writes()
+        self.assertEqual('value', other.get('key'))
+        self.assertEqual('value', other.get('tagged'))
+        self.assertEqual(['tag'], other.get_item_tags('tagged'))
+        self.assertEqual(0, redis.write_behind_stats()['depth'])
+
+    def test_flush_writes_in_background(self):
+        """ Buffered writes are flushed in background """
+        redis = Redis('test', write_behind=dict(interval=0.01))
+        redis.set_many(dict(one='1', two='2'), ttl=30)
+        time.sleep(0.1)
+        other = Redis('test')
+        result = other.get_many(['one', 'two'])
+        self.assertEqual(dict(one='1', two='2'), result)
+        ttl = other.get_redis().ttl(other.get_full_item_key('one'))
+        self.assertTrue(0 < ttl <= 30)
+
+    def test_delete_buffered_writes(self):
+        """ Deleting drops buffered writes """
+        redis = Redis('test', write_behind=dict(interval=60))
+        redis.set('key', 'value')
+        redis.delete('key')
+        redis.set('other', 'value')
+        redis.delete_all()
+        redis.flush_writes()
+        self.assertIsNone(redis.get('key'))
+        self.assertIsNone(redis.get('other'))
+
+    def test_buffered_writes_keep_tag_generations(self):
+        """ Buffered writes invalidated before flush are stale """
+        redis = Redis(
+            'test',
+            tag_versioning=True,
+            write_behind=dict(interval=60)
+        )
+        other = Redis('test', tag_versioning=True)
+        redis.set('key', 'value', tags=['tag'])
+        other.invalidate_tags(['tag'])
+        redis.flush_writes()
+        self.assertIsNone(other.get('key'))
+
+    def test_add_and_incr_flush_buffered_writes(self):
+        """ Adds and increments see buffered writes """
+        redis = Redis('test', write_behind=dict(interval=60))
+        redis.set('key', 'value')
+        self.assertFalse(redis.add('key', 'other'))
+        redis.set('count', '5')
+        self.assertEqual(6, redis.incr('count'))
+
+    # -------------------------------------------------------------------------
+    # Read batching
+    # -------------------------------------------------------------------------
+
+    def test_batch_concurrent_reads(self):
+        """ Concurrent gets and existence checks are batched """
+        redis = Redis(
+            'test',
+            optimize_after=None,
+            batch_reads=dict(window=0.05)
+        )
+        for i in range(10):
+            redis.set('key{}'.format(i), str(i))
+
+        results = dict()
+        barrier = threading.Barrier(20)
+
+        def read(i):
+            barrier.wait()
+            key = 'key{}'.format(i % 10)
+            if i < 10:
+                results[i] = redis.get(key)
+            else:
+                results[i] = redis.exists(key)
+
+        threads = [threading.Thread(target=read, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(10):
+            self.assertEqual(str(i), results[i])
+            self.assertTrue(results[i + 10])
+
+        stats = redis.batch_stats()
+        self.assertEqual(10, stats['get']['requests'])
+        self.assertTrue(stats['get']['batches'] < 10)
+        self.assertTrue(stats['exists']['batches'] < 10)
+
+    def test_batch_reads_of_every_layout(self):
+        """ Batched reads see items of every layout """
+        redis = Redis(
+            'test',
+            packed=dict(max_size=5),
+            tag_versioning=True,
+            batch_reads=dict(window=0.001)
+        )
+        redis.set('tiny', '1')
+        redis.set('large', 'x' * 10)
+        redis.set('tagged', 'value', tags=['tag'])
+        self.assertEqual('1', redis.get('tiny'))
+        self.assertEqual('x' * 10, redis.get('large'))
+        self.assertEqual('value', redis.get('tagged'))
+        redis.delete(tags=['tag'])
+        self.assertIsNone(redis.get('tagged'))
+        self.assertIsNone(redis.get('missing'))
+
+    # -------------------------------------------------------------------------
+    # Resilience
+    # -------------------------------------------------------------------------
+
+    def fail(self, redis):
+        """ Makes every command of the adapter fail """
+        client = redis.get_redis()
+        error = RedisConnectionError('Connection refused')
+        return (
+            mock.patch.object(client, 'execute_command', side_effect=error),
+            mock.patch.object(client, 'pipeline', side_effect=error)
+        )
+
+    def test_set_resilience_timeouts(self):
+        """ Resilience sets short connection timeouts """
+        redis = Redis('test', resilience=dict(timeout=0.2))
+        self.assertEqual(0.2, redis.config['socket_timeout'])
+        self.assertEqual(0.1, redis.config['socket_connect_timeout'])
+
+        config = dict(socket_timeout=3)
+        redis = Redis('test', resilience=True, config=config)
+        self.assertEqual(3, redis.config['socket_timeout'])
+
+    def test_fail_open(self):
+        """ Failing redis results in misses and skipped writes """
+        redis = Redis(
+            'test',
+            optimize_after=None,
+            resilience=dict(retries=0, failure_threshold=2)
+        )
+        redis.set('key', 'value')
+        command, pipeline = self.fail(redis)
+        with command as execute, pipeline as pipe:
+            self.assertIsNone(redis.get('key'))
+            self.assertFalse(redis.set('key', 'other'))
+            self.assertFalse(redis.exists('key'))
+            self.assertEqual(dict(key=None), redis.get_many(['key']))
+            self.assertEqual(2, execute.call_count + pipe.call_count)
+
+        stats = redis.resilience_stats()
+        self.assertEqual('open', stats['state'])
+        self.assertEqual(2, stats['rejected'])
+
+    def test_recover_after_reset_timeout(self):
+        """ Breaker closes after successful probe """
+        redis = Redis(
+            'test',
+            optimize_after=None,
+            resilience=dict(retries=0, failure_threshold=1, reset_timeout=0.01)
+        )
+        redis.set('key', 'value')
+        command, pipeline = self.fail(redis)
+        with command, pipeline:
+            self.assertIsNone(redis.get('key'))
+
+        time.sleep(0.02)
+        self.assertEqual('value', redis.get('key'))
+        self.assertEqual('closed', redis.resilience_stats()['state'])
+
+    def test_serve_from_fallback_while_failing(self):
+        """ In-process fallback serves calls while redis is failing """
+        redis = Redis(
+            'test',
+            optimize_after=None,
+            resilience=dict(
+                retries=0,
+                failure_threshold=1,
+                reset_timeout=0.01,
+                fallback=dict(max_items=100)
+            )
+        )
+        command, pipeline = self.fail(redis)
+        with command, pipeline:
+            self.assertTrue(redis.set('key', 'value'))
+            self.assertEqual('value', redis.get('key'))
+            self.assertEqual(2, redis.resilience_stats()['fallbacks'])
+
+        time.sleep(0.02)
+        self.assertIsNone(redis.get('key'))
+        self.assertIsNone(redis.guard.fallback.get('key'))
+
+    def test_retry_failed_commands(self):
+        """ Failed commands are retried """
+        redis = Redis(
+            'test',
+            optimize_after=None,
+            resilience=dict(retries=1, backoff=0)
+        )
+        redis.set('key', 'value')
+        client = redis.get_redis()
+        original = client.execute_command
+        errors = [RedisConnectionError('Connection reset')]
+
+        def flaky(*args, **kwargs):
+            if errors:
+                raise errors.pop()
+            return original(*args, **kwargs)
+
+        with mock.patch.object(client, 'execute_command', side_effect=flaky):
+            self.assertEqual('value', redis.get('key'))
+        self.assertEqual(1, redis.resilience_stats()['retries'])
+
+    def test_get_by_tags(self):
+        """ Getting items by tags in one call """
+        options = [
+            dict(),
+            dict(compact_keys=dict(threshold=10)),
+            dict(tag_versioning=True),
+        ]
+        for config in options:
+            redis = Redis('test', optimize_after=None, **config)
+            redis.set('one', '1', tags=['a'])
+            redis.set('two', '2', tags=['a', 'b'])
+            redis.set('three-with-long-key', '3', tags=['b', 'c'])
+            redis.set('untagged', '4')
+
+            self.assertEqual(dict(two='2'), redis.get_by_tags(['a', 'b']))
+            result = redis.get_by_tags(['a', 'c'], disjunction=True)
+            self.assertEqual(3, len(result))
+            self.assertIn('1', result.values())
+            self.assertEqual(1, len(redis.get_by_tags(['a'], limit=1)))
+            self.assertEqual({}, redis.get_by_tags(['missing']))
+            self.assertEqual({}, redis.get_by_tags([]))
+
+            redis.delete('one')
+            self.assertEqual(['2'], list(redis.get_by_tags(['a']).values()))
+            redis.delete(tags=['b'])
+            self.assertEqual({}, redis.get_by_tags(['a', 'b', 'c'], True))
+            redis.get_redis().flushdb()
+
+    def test_iter_by_tags(self):
+        """ Streaming items by tags in batches """
+        redis = Redis('test', optimize_after=None, tag_versioning=True)
+        for i in range(20):
+            tags = ['all', 'even' if i % 2 == 0 else 'odd']
+            if i % 3 == 0:
+                tags.append('third')
+            redis.set('item{}'.format(i), str(i), tags=tags)
+
+        odd = dict(redis.iter_by_tags(['odd'], batch_size=3))
+        self.assertEqual(10, len(odd))
+        self.assertEqual('3', odd['item3'])
+
+        both = dict(redis.iter_by_tags(['odd', 'third'], batch_size=3))
+        self.assertEqual({'item3', 'item9', 'item15'}, set(both))
+
+        pairs = list(redis.iter_by_tags(['odd', 'third'], True, 4))
+        self.assertEqual(14, len(pairs))
+        self.assertEqual(14, len(dict(pairs)))
+
+        redis.delete(tags=['third'])
+        self.assertEqual(7, len(list(redis.iter_by_tags(['odd']))))
+
+    # -------------------------------------------------------------------------
+    # Snapshots
+    # -------------------------------------------------------------------------
+
+    def test_export_and_import_items(self):
+        """ Exporting items and importing them into another cache """
+        options = [
+            dict(),
+            dict(layout='string'),
+            dict(packed=dict(max_size=10)),
+            dict(compact_keys=dict(threshold=10)),
+        ]
+        for config in options:
+            redis = Redis('test', optimize_after=None, **config)
+            redis.set('tiny', '1', ttl=30)
+            redis.set('tagged-item-with-long-key', 'value', tags=['a', 'b'])
+            redis.incr('views', 5)
+
+            records = []
+            for batch in redis.export_items(batch_size=2):
+                records += batch
+            records = {record[0]: record for record in records}
+            self.assertEqual(3, len(records))
+
+            other = Redis('other', optimize_after=None, **config)
+            self.assertEqual(3, other.import_items(list(records.values())))
+            self.assertEqual('1', other.get('tiny'))
+            self.assertEqual('5', other.get('views'))
+            key = 'tagged-item-with-long-key'
+            self.assertEqual('value', other.get(key))
+            self.assertEqual(['a', 'b'], other.get_item_tags(key))
+            self.assertTrue(other.delete(tags=['b']))
+            self.assertIsNone(other.get(key))
+
+            tiny = other.get_full_item_key('tiny')
+            ttl = other.get_redis().pttl(tiny)
+            if config.get('packed'):
+                ttl = other.get_redis().pttl(other.get_bucket(tiny)[0])
+            self.assertTrue(0 < ttl <= 30000)
+            redis.get_redis().flushdb()
+
+    def test_export_skips_invalidated_items(self):
+        """ Items of invalidated tag generations are not exported """
+        redis = Redis('test', tag_versioning=True, optimize_after=None)
+        redis.set('stale', 'value', tags=['tag'])
+        redis.invalidate_tags(['tag'])
+        redis.set('fresh', 'value', tags=['tag'])
+        records = [r for batch in redis.export_items() for r in batch]
+        self.assertEqual(['fresh'], [record[0] for record in records])
+
+    def test_export_given_keys(self):
+        """ Exporting selected keys, including packed ones """
+        redis = Redis('test', packed=dict(max_size=10), optimize_after=None)
+        redis.set('one', '1')
+        redis.set('two', 'long enough value')
+        redis.set('three', '3')
+        keys = ['one', 'two', 'missing']
+        records = [r for batch in redis.export_items(keys=keys) for r in batch]
+        self.assertEqual(['two', 'one'], [record[0] for record in records])
+
+    def test_iter_items(self):
+        """ Iterating items by pattern and tag """
+        redis = Redis('test', optimize_after=None, packed=dict(max_size=5))
+        for i in range(12):
+            tags = ['odd'] if i % 2 else None
+            redis.set('item{}'.format(i), 'value{}'.format(i), tags=tags)
+        redis.set('tiny', '1')
+
+        items = {r[0]: r for r in redis.iter_items(batch_size=5)}
+        self.assertEqual(13, len(items))
+        self.assertEqual(('value3', ['odd']), items['item3'][1:4:2])
+        self.assertEqual('1', items['tiny'][1])
+
+        odd = sorted(r[0] for r in redis.iter_items(tag='odd'))
+        self.assertEqual(6, len(odd))
+        matched = [r[0] for r in redis.iter_items('item1*', tag='odd')]
+        self.assertEqual(['item1', 'item11'], sorted(matched))
+
+        memory = Memory(
+            adapters=dict(redis=dict(type='redis')),
+            caches=dict(test=dict(adapter='redis', ttl=60))
+        )
+        items = list(memory.iter_items('test', 'item?', tag='odd'))
+        self.assertEqual(5, len(items))
+
+    def test_delete_all_in_batches(self):
+        """ Dropping namespace walks it with scan """
+        redis = Redis('test', optimize_after=None)
+        other = Redis('other', optimize_after=None)
+        for i in range(30):
+            redis.set('item{}'.format(i), 'value', tags=['tag'])
+        other.set('item', 'value')
+
+        self.assertEqual(31, redis.delete_all())
+        self.assertIsNone(redis.get('item1'))
+        self.assertEqual('value', other.get('item'))
+        self.assertFalse(redis.delete_all())
+
+    def test_snapshot_and_warmup_via_memory(self):
+        """ Warming up cache from snapshot of another """
+        memory = Memory(
+            adapters=dict(redis=dict(type='redis')),
+            caches=dict(
+                test=dict(adapter='redis', ttl=60, optimize_after=None),
+                other=dict(adapter='redis', ttl=60, optimize_after=None),
+            )
+        )
+        cache = memory.get_cache('test')
+        for i in range(25):
+            cache.set('item{}'.format(i), str(i), tags=['all'])
+        cache.set('skipped', 'value')
+
+        path = tempfile.mktemp(suffix='.snapshot')
+        try:
+            options = dict(match='item*', batch_size=10)
+            result = memory.snapshot_cache('test', path, **options)
+            self.assertEqual(25, result['keys'])
+
+            options = dict(batch_size=4, workers=3)
+            result = memory.warmup_cache('other', path, **options)
+            self.assertEqual(25, result['keys'])
+        finally:
+            os.remove(path)
+
+        other = memory.get_cache('other')
+        self.assertEqual('7', other.get('item7'))
+        self.assertIsNone(other.get('skipped'))
+        self.assertEqual(25, len(other.get_tagged_items('all')))
+
+    # -------------------------------------------------------------------------
+    # Hooks
+    # -------------------------------------------------------------------------
+
+    def test_count_round_trips(self):
+        """ Hooks see round trips and pipelines of operations """
+        events = []
+
+        class Recorder(hooks.Hook):
+            def after(self, event):
+                events.append(event)
+
+        redis = hooks.Instrumented(
+            Redis('test', optimize_after=None),
+            [Recorder()]
+        )
+        redis.set('key', 'value', tags=['a', 'b'])
+        redis.get('key')
+        redis.set_many(dict(one='1', two='2', three='3'))
+
+        tagged, get, many = events
+        self.assertEqual(1, tagged.round_trips)
+        self.assertEqual(1, get.round_trips)
+        self.assertEqual(1, many.round_trips)
+        self.assertEqual(3, many.pipeline)
+        self.assertEqual(3, many.keys)
+        self.assertEqual('Redis', many.adapter)
+
+    def test_share_slow_log(self):
+        """ Slow operations are shared with other processes """
+        redis = Redis('test', optimize_after=None)
+        log = slowlog.SlowLog(threshold=0, size=2, cache=redis)
+        cache = hooks.Instrumented(redis, [log])
+        cache.set('key', 'value', tags=['a', 'b'])
+        cache.get('key')
+        cache.delete(tags=['a'])
+        log.flush()
+
+        entries = Redis('test').get_slow_log()
+        self.assertEqual(['delete', 'get'], [e['operation'] for e in entries])
+        self.assertEqual(1, entries[0]['tags'])
+        self.assertEqual(1, entries[1]['round_trips'])
+        self.assertEqual(1, len(redis.get_slow_log(limit=1)))
+
+    # -------------------------------------------------------------------------
+    # Counters
+    # -------------------------------------------------------------------------
+
+    def test_incr_and_decr(self):
+        """ Incrementing and decrementing counters """
+        for layout in ('hash', 'string'):
+            redis = Redis('test', layout=layout)
+            self.assertEqual(1, redis.incr('views'))
+            self.assertEqual(6, redis.incr('views', 5))
+            self.assertEqual(4, redis.decr('views', 2))
+            self.assertEqual('4', redis.get('views'))
+            redis.delete_all()
+
+    def test_set_counter_ttl_on_create(self):
+        """ Counter ttl is set on create and not extended """
+        redis = Redis('test')
+        redis.incr('views', ttl=30)
+        redis.get_redis().expire(redis.get_full_item_key('views'), 10)
+        redis.incr('views', ttl=30)
+        ttl = redis.get_redis().ttl(redis.get_full_item_key('views'))
+        self.assertTrue(0 < ttl <= 10)
+
+    def test_incr_existing_items(self):
+        """ Incrementing items written with set """
+        redis = Redis('test', packed=dict(max_size=10))
+        redis.set('packed', '5', ttl=30)
+        redis.set('tagged', '5', tags=['tag'])
+        self.assertEqual(6, redis.incr('packed'))
+        self.assertEqual(6, redis.incr('tagged'))
+        self.assertEqual('6', redis.get('packed'))
+        self.assertEqual('6', redis.get('tagged'))
+
+        ttl = redis.get_redis().ttl(redis.get_full_item_key('packed'))
+        self.assertTrue(0 < ttl <= 30)
+
+    def test_incr_many(self):
+        """ Incrementing many counters at once """
+        redis = Redis('test')
+        redis.incr('one')
+        result = redis.incr_many(dict(one=2, two=3))
+        self.assertEqual(dict(one=3, two=3), result)
+
+    def test_rate_limit(self):
+        """ Sliding window rate limit """
+        redis = Redis('test')
+        self.assertEqual((True, 1, 0.0), redis.rate_limit('user', 2, 10))
+        self.assertEqual((True, 0, 0.0), redis.rate_limit('user', 2, 10))
+        allowed, remaining, retry = redis.rate_limit('user', 2, 10)
+        self.assertFalse(allowed)
+        self.assertEqual(0, remaining)
+        self.assertTrue(9 < retry <= 10)
+        self.assertTrue(redis.rate_limit('other', 2, 10)[0])
+
+    def test_rate_limit_window_slides(self):
+        """ Requests leave rate limit window """
+        redis = Redis('test')
+        self.assertTrue(redis.rate_limit('user', 1, 0.05)[0])
+        self.assertFalse(redis.rate_limit('user', 1, 0.05)[0])
+        time.sleep(0.06)
+        self.assertTrue(redis.rate_limit('user', 1, 0.05)[0])
+
+    # -------------------------------------------------------------------------
+    # Packing
+    # -------------------------------------------------------------------------
+
+    def test_pack_tiny_untagged_items(self):
+        """ Tiny untagged items are packed into buckets """
+        redis = Redis('test', packed=dict(buckets=4, max_size=10))
+        redis.set('flag', '1')
+        redis.set('tagged', '1', tags=['tag'])
+        redis.set('large', 'x' * 11)
+
+        bucket, field = redis.get_bucket(redis.get_full_item_key('flag'))
+        self.assertEqual('flag', field)
+        self.assertTrue(bucket.startswith(redis.bucket_prefix))
+        packed = redis.get_redis().hget(bucket, 'flag')
+        self.assertTrue(packed.endswith('|1'))
+        self.assertTrue(redis.get_redis().ttl(bucket) > 0)
+
+        self.assertEqual('1', redis.get('flag'))
+        self.assertEqual('1', redis.get('tagged'))
+        self.assertEqual('x' * 11, redis.get('large'))
+        self.assertTrue(redis.exists('flag'))
+        self.assertEqual(1, redis.stats()['buckets'])
+
+    def test_repacking_replaces_item(self):
+        """ Switching item between layouts leaves no stale copy """
+        redis = Redis('test', packed=dict(buckets=4, max_size=10))
+        redis.set('key', 'x' * 20)
+        redis.set('key', 'small')
+        self.assertEqual('small', redis.get('key'))
+        item_key = redis.get_full_item_key('key')
+        self.assertFalse(redis.get_redis().exists(item_key))
+
+        redis.set('key', 'y' * 20)
+        self.assertEqual('y' * 20, redis.get('key'))
+        self.assertTrue(redis.delete('key'))
+        self.assertIsNone(redis.get('key'))
+
+    def test_expire_packed_items(self):
+        """ Packed items expire by embedded timestamp """
+        redis = Redis('test', packed=dict(buckets=1))
+        redis.set('short', '1', ttl=0.05)
+        redis.set('expired', '1', ttl=0.05)
+        redis.set('long', '1', ttl=60)
+        time.sleep(0.06)
+
+        self.assertIsNone(redis.get('short'))
+        redis.optimize()
+        bucket, _ = redis.get_bucket(redis.get_full_item_key('long'))
+        self.assertEqual(['long'], redis.get_redis().hkeys(bucket))
+
+    def test_compare_packed_memory(self):
+        """ Packing reduces number of keys """
+        result = benchmark.compare_packed_memory(count=200)
+        self.assertEqual(200, result['plain']['keys'])
+        self.assertEqual(2, result['packed']['keys'])
+
+    # -------------------------------------------------------------------------
+    # Layout
+    # -------------------------------------------------------------------------
+
+    def test_raise_on_unknown_layout(self):
+        """ Raise on unknown item layout """
+        with self.assertRaises(exceptions.ConfigurationException):
+            Redis('test', layout='list')
+
+    def test_store_untagged_items_as_strings(self):
+        """ Untagged items are plain strings, tagged ones hashes """
+        redis = Redis('test', layout='string')
+        redis.set('plain', 'value', ttl=30)
+        redis.set('tagged', 'value', tags=['tag'])
+
+        client = redis.get_redis()
+        plain = redis.get_full_item_key('plain')
+        self.assertEqual('string', client.type(plain))
+        self.assertTrue(0 < client.ttl(plain) <= 30)
+        tagged = redis.get_full_item_key('tagged')
+        self.assertEqual('hash', client.type(tagged))
+
+        self.assertEqual('value', redis.get('plain'))
+        self.assertEqual('value', redis.get('tagged'))
+        self.assertTrue(redis.exists('plain'))
+        self.assertIsNone(redis.get_item_tags('plain'))
+        self.assertEqual(['tag'], redis.get_item_tags('tagged'))
+
+    def test_switch_item_between_layouts(self):
+        """ Tagging and untagging an item replaces its layout """
+        redis = Redis('test', layout='string')
+        redis.set('key', 'plain')
+        redis.set('key', 'tagged', tags=['tag'])
+        self.assertEqual('tagged', redis.get('key'))
+        redis.set('key', 'plain again')
+        self.assertEqual('plain again', redis.get('key'))
+        self.assertIsNone(redis.get_item_tags('key'))
+        self.assertTrue(redis.delete('key'))
+        self.assertIsNone(redis.get('key'))
+
+    def test_read_both_layouts_transparently(self):
+        """ Items written in either layout are readable by both """
+        Redis('test', layout='string').set('string', 'value')
+        Redis('test').set('hash', 'value')
+
+        for layout in ('hash', 'string'):
+            redis = Redis('test', layout=layout)
+            self.assertEqual('value', redis.get('string'))
+            self.assertEqual('value', redis.get('hash'))
+
+        versioned = Redis('test', tag_versioning=True)
+        self.assertEqual('value', versioned.get('string'))
+
+    def test_get_many(self):
+        """ Getting many items at once """
+        for layout in ('hash', 'string'):
+            redis = Redis('test', layout=layout)
+            redis.set('one', '1')
+            redis.set('two', '2', tags=['tag'])
+            result = redis.get_many(['one', 'two', 'missing'])
+            self.assertEqual(dict(one='1', two='2', missing=None), result)
+            redis.delete_all()
+
+    def test_get_many_packed_and_versioned(self):
+        """ Getting many packed items with tag versioning """
+        redis = Redis('test', packed=dict(), tag_versioning=True)
+        redis.set('tiny', '1')
+        redis.set('tagged', '2', tags=['tag'])
+        result = redis.get_many(['tiny', 'tagged'])
+        self.assertEqual(dict(tiny='1', tagged='2'), result)
+
+        redis.delete(tags=['tag'])
+        self.assertIsNone(redis.get_many(['tagged'])['tagged'])
+
+    def test_optimize_skips_string_items(self):
+        """ Optimization leaves string items alone """
+        redis = Redis('test', layout='string', optimize_after=None)
+        redis.set('plain', 'value')
+        redis.set('tagged', 'value', tags=['tag'])
+        redis.optimize()
+        self.assertEqual('value', redis.get('plain'))
+        self.assertEqual('value', redis.get('tagged'))
+
+    # -------------------------------------------------------------------------
+    # Misses
+    # -------------------------------------------------------------------------
+
+    def test_remember_misses(self):
+        """ Misses are remembered for negative ttl """
+        redis = Redis('test', negative_ttl=10)
+        self.assertIsNone(redis.get('key'))
+
+        Redis('test').set('key', 'value')
+        self.assertIsNone(redis.get('key'))
+        self.assertFalse(redis.exists('key'))
+
+        redis.set('key', 'value')
+        self.assertEqual('value', redis.get('key'))
+
+    def test_skip_redis_for_keys_never_written(self):
+        """ Bloom filter short-circuits misses """
+        Redis('test').set('old', 'value')
+        redis = Redis('test', bloom=dict(size=1024, sync_interval=60))
+        self.assertEqual('value', redis.get('old'))
+        redis.join_background()
+        self.assertTrue(redis.bloom_ready)
+
+        redis.set('new', 'value')
+        with mock.patch.object(redis, 'fetch') as fetch:
+            self.assertIsNone(redis.get('missing'))
+            self.assertFalse(fetch.called)
+        self.assertEqual('value', redis.get('new'))
+
+    def test_share_bloom_filter_between_processes(self):
+        """ Written keys are picked up by other processes on sync """
+        options = dict(bloom=dict(size=1024, sync_interval=60))
+        one = Redis('test', **options)
+        two = Redis('test', **options)
+        self.assertIsNone(two.get('key'))
+        two.join_background()
+
+        one.set('key', 'value')
+        one.join_background()
+        one.sync_bloom()
+        self.assertIsNone(two.get('key'))
+        two.sync_bloom()
+        self.assertEqual('value', two.get('key'))
+
+    def test_rebuild_bloom_filter_on_optimize(self):
+        """ Optimizing drops bits of deleted items """
+        redis = Redis('test', bloom=dict(size=1024, sync_interval=60))
+        redis.set('key', 'value')
+        redis.join_background()
+        redis.sync_bloom()
+        redis.delete('key')
+        redis.optimize()
+        redis.sync_bloom()
+        self.assertNotIn('key', redis.bloom)
+
+    def test_sync_bloom_filter_in_background(self):
+        """ Bloom filter syncs off the request, failures keep bits """
+        redis = Redis('test', bloom=dict(size=1024, sync_interval=60))
+        redis.set('key', 'value')
+        redis.join_background()
+        self.assertTrue(redis.bloom_ready)
+
+        error = RedisConnectionError('Connection refused')
+        redis.bloom_synced_at = None
+        with mock.patch.object(redis, 'sync_bloom', side_effect=error):
+            self.assertEqual('value', redis.get('key'))
+            redis.join_background()
+
+        redis.bloom_synced_at = time.monotonic()
+        redis.set('other', 'value')
+        raw = redis.get_raw_redis()
+        with mock.patch.object(raw, 'pipeline', side_effect=error):
+            with self.assertRaises(RedisConnectionError):
+                redis.sync_bloom()
+        self.assertTrue(redis.bloom_pending)
+
+        redis.sync_bloom()
+        self.assertEqual([], redis.bloom_pending)
+        other = Redis('test', bloom=dict(size=1024, sync_interval=60))
+        other.sync_bloom()
+        self.assertIn('other', other.bloom)
+
+    # -------------------------------------------------------------------------
+    # Profiling
+    # -------------------------------------------------------------------------
+
+    def test_profile_hot_keys(self):
+        """ Profiling hot keys and sharing them via redis """
+        redis = Redis('test', profile=dict(sample_rate=1, top=2))
+        redis.set('hot', 'data')
+        redis.set('cold', 'data')
+        for _ in range(10):
+            redis.get('hot')
+        redis.get('cold')
+
+        local = redis.profiler.hot_keys('get')
+        self.assertEqual(('hot', 10), local[0])
+
+        redis.flush_profile()
+        redis.get('hot')
+        redis.flush_profile()
+        shared = Redis('test').get_hot_keys('get')
+        self.assertEqual(('hot', 11), shared[0])
+        self.assertEqual(2, len(Redis('test').get_hot_keys('set')))
+
+    def test_flush_profile_in_background(self):
+        """ Hot keys are flushed off the request, failures are ignored """
+        profile = dict(sample_rate=1, flush_interval=0)
+        redis = Redis('test', profile=profile)
+        error = RedisConnectionError('Connection refused')
+        with mock.patch.object(redis, 'flush_profile', side_effect=error):
+            self.assertIsNone(redis.get('key'))
+            redis.join_background()
+
+        redis.get('key')
+        redis.join_background()
+        self.assertEqual('key', Redis('test').get_hot_keys('get')[0][0])
+
+    def test_serve_hot_keys_from_near_cache(self):
+        """ Hot keys are served from near cache until changed """
+        profile = dict(sample_rate=1, top=2, near_cache=True, near_ttl=10)
+        redis = Redis('test', profile=profile)
+        redis.set('hot', 'one')
+        self.assertEqual('one', redis.get('hot'))
+
+        Redis('test').set('hot', 'two')
+        self.assertEqual('one', redis.get('hot'))
+
+        redis.set('hot', 'three')
+        self.assertEqual('three', redis.get('hot'))
+        redis.delete('hot')
+        self.assertIsNone(redis.get('hot'))
+
+    def test_hot_keys_via_memory(self):
+        """ Getting hot keys via memory """
+        memory = Memory(
+            adapters=dict(redis=dict(type='redis')),
+            caches=dict(test=dict(
+                adapter='redis',
+                ttl=60,
+                profile=dict(sample_rate=1)
+            ))
+        )
+        cache = memory.get_cache('test')
+        cache.get('key')
+        self.assertEqual([('key', 1)], memory.hot_keys('test', local=True))
+        self.assertEqual([('key', 1)], memory.hot_keys('test'))
+
     def test_collect_garbage_initial(self):
         """ Garbage collect does nothing on first run """
         redis = Redis('test')
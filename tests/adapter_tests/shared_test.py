@@ -0,0 +1,251 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from shiftmemory import Memory, exceptions
+from shiftmemory.adapter import Shared
+
+
+def write_items(path, worker, count):
+    """ Writes items to shared cache from another process """
+    cache = Shared('test', config=dict(path=path, slots=1024, shards=8))
+    for i in range(count):
+        cache.set('{}-{}'.format(worker, i), str(i), tags=['worker'])
+    cache.close()
+
+
+@attr('shared')
+class SharedTest(TestCase):
+    """ This holds tests for shared memory adapter """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    def create(self, **config):
+        config.setdefault('path', self.path)
+        config.setdefault('slots', 256)
+        config.setdefault('shards', 4)
+        config.setdefault('slot_size', 256)
+        return Shared('test', config=config)
+
+    # -------------------------------------------------------------------------
+
+    def test_create_adapter(self):
+        """ Creating adapter creates storage file """
+        cache = self.create()
+        self.assertIsInstance(cache, Shared)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(cache.size, os.path.getsize(self.path))
+
+    def test_create_via_memory(self):
+        """ Creating shared cache from memory config """
+        memory = Memory(
+            adapters=dict(
+                shm=dict(type='shared', config=dict(path=self.path))
+            ),
+            caches=dict(demo=dict(adapter='shm', ttl=10))
+        )
+        cache = memory.get_cache('demo')
+        self.assertIsInstance(cache, Shared)
+        self.assertEqual(10, cache.ttl)
+
+    def test_raise_on_layout_mismatch(self):
+        """ Raise when opening existing file with different geometry """
+        self.create()
+        with self.assertRaises(exceptions.ConfigurationException):
+            self.create(slot_size=512)
+
+    def test_set_and_get(self):
+        """ Setting and getting items """
+        cache = self.create()
+        self.assertTrue(cache.set('key', 'value'))
+        self.assertTrue(cache.set('bytes', b'\x00\x01'))
+        self.assertEqual('value', cache.get('key'))
+        self.assertEqual(b'\x00\x01', cache.get('bytes'))
+        self.assertTrue(cache.exists('key'))
+        self.assertIsNone(cache.get('missing'))
+
+    def test_get_view(self):
+        """ Getting zero-copy view of item data """
+        cache = self.create()
+        cache.set('key', 'value')
+        view = cache.get_view('key')
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(b'value', bytes(view))
+
+    def test_refuse_items_not_fitting_slot(self):
+        """ Items larger than slot are not cached """
+        cache = self.create()
+        self.assertFalse(cache.set('key', 'x' * 1024))
+        self.assertIsNone(cache.get('key'))
+
+    def test_expire_items(self):
+        """ Items expire after ttl """
+        cache = self.create()
+        cache.set('key', 'value', ttl=0.05)
+        self.assertEqual('value', cache.get('key'))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('key'))
+
+    def test_add(self):
+        """ Add item if not exist """
+        cache = self.create()
+        self.assertTrue(cache.add('key', 'one'))
+        self.assertFalse(cache.add('key', 'two'))
+        self.assertEqual('one', cache.get('key'))
+
+    def test_evict_when_full(self):
+        """ Evict items when probe window is full """
+        cache = self.create(slots=32, shards=1, probe=4)
+        for i in range(100):
+            self.assertTrue(cache.set('key{}'.format(i), 'value'))
+
+        found = [i for i in range(100) if cache.get('key{}'.format(i))]
+        self.assertTrue(0 < len(found) <= 32)
+        self.assertIn(99, found)
+
+    def test_delete_by_key(self):
+        """ Deleting item by key """
+        cache = self.create()
+        cache.set('key', 'value', tags=['tag'])
+        self.assertTrue(cache.delete('key'))
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(set(), cache.get_tagged_items('tag'))
+
+    def test_tags(self):
+        """ Tagging items and getting them back by tag """
+        cache = self.create()
+        cache.set('key1', 'value', tags=['tag1', 'tag2'])
+        cache.set('key2', 'value', tags=['tag2'])
+        self.assertEqual(['tag1', 'tag2'], cache.get_item_tags('key1'))
+        self.assertEqual({'key1', 'key2'}, cache.get_tagged_items('tag2'))
+
+        # retag
+        cache.set('key1', 'value', tags=['tag3'])
+        self.assertEqual({'key2'}, cache.get_tagged_items('tag2'))
+
+    def test_delete_by_tags(self):
+        """ Deleting items by tags with conjunction and disjunction """
+        cache = self.create()
+        cache.set('key1', 'value', tags=['tag1', 'tag2'])
+        cache.set('key2', 'value', tags=['tag2'])
+        cache.set('key3', 'value', tags=['tag3'])
+
+        cache.delete(tags=['tag1', 'tag2'])
+        self.assertIsNone(cache.get('key1'))
+        self.assertIsNotNone(cache.get('key2'))
+
+        cache.delete(tags=['tag2', 'tag3'], disjunction=True)
+        self.assertIsNone(cache.get('key2'))
+        self.assertIsNone(cache.get('key3'))
+
+    def test_fall_back_to_scan_on_tag_index_overflow(self):
+        """ Finding tagged items when tag index overflows """
+        cache = self.create(tag_slots=2)
+        for i in range(4):
+            cache.set('key{}'.format(i), 'value', tags=['tag{}'.format(i)])
+
+        self.assertTrue(cache.is_overflown())
+        for i in range(4):
+            tagged = cache.get_tagged_items('tag{}'.format(i))
+            self.assertEqual({'key{}'.format(i)}, tagged)
+
+    def test_delete_all(self):
+        """ Deleting all items """
+        cache = self.create()
+        cache.set('key1', 'value', tags=['tag'])
+        cache.set('key2', 'value')
+        cache.delete_all()
+        self.assertIsNone(cache.get('key1'))
+        self.assertIsNone(cache.get('key2'))
+        self.assertEqual(set(), cache.get_tagged_items('tag'))
+
+    def test_isolate_namespaces_sharing_file(self):
+        """ Caches sharing a file do not see each other's items """
+        memory = Memory(
+            adapters=dict(
+                shm=dict(type='shared', config=dict(path=self.path))
+            ),
+            caches=dict(
+                one=dict(adapter='shm', ttl=10),
+                two=dict(adapter='shm', ttl=10),
+            )
+        )
+        one = memory.get_cache('one')
+        two = memory.get_cache('two')
+        one.set('key', 'one', tags=['tag'])
+        two.set('key', 'two', tags=['tag'])
+        self.assertEqual('one', one.get('key'))
+        self.assertEqual('two', two.get('key'))
+        self.assertEqual(['tag'], two.get_item_tags('key'))
+
+        one.delete(tags=['tag'])
+        self.assertIsNone(one.get('key'))
+        self.assertEqual('two', two.get('key'))
+
+        one.set('other', 'one')
+        two.delete_all()
+        self.assertEqual('one', one.get('other'))
+        self.assertEqual([], list(two.iter_items()))
+        self.assertEqual(['other'], [r[0] for r in one.iter_items()])
+
+    def test_optimize(self):
+        """ Optimizing clears expired items and tag bits """
+        cache = self.create()
+        cache.set('key', 'value', ttl=0.05, tags=['tag'])
+        self.assertIsNotNone(cache.find_tag(cache.prefix + 'tag'))
+        time.sleep(0.06)
+        cache.optimize()
+        self.assertIsNone(cache.find_tag(cache.prefix + 'tag'))
+
+    def test_share_items_between_processes(self):
+        """ Items written by other processes are visible """
+        config = dict(path=self.path, slots=1024, shards=8)
+        cache = Shared('test', config=config)
+        workers = [
+            multiprocessing.Process(
+                target=write_items,
+                args=(self.path, worker, 20)
+            ) for worker in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        for worker in range(4):
+            for i in range(20):
+                key = '{}-{}'.format(worker, i)
+                self.assertEqual(str(i), cache.get(key))
+
+        self.assertEqual(80, len(cache.get_tagged_items('worker')))
+
+    def test_iter_items(self):
+        """ Iterating live items of all slots """
+        cache = self.create()
+        cache.set('one', 'value', tags=['odd'], ttl=30)
+        cache.set('two', b'\x00')
+        cache.set('three', 'value', tags=['odd'])
+        cache.set('gone', 'value', ttl=0.01)
+        time.sleep(0.02)
+
+        items = {r[0]: r for r in cache.iter_items(batch_size=10)}
+        self.assertEqual({'one', 'two', 'three'}, set(items))
+        self.assertEqual(b'\x00', items['two'][1])
+        key, value, ttl, tags = items['one']
+        self.assertEqual(('value', ['odd']), (value, tags))
+        self.assertTrue(0 < ttl <= 30000)
+
+        odd = sorted(r[0] for r in cache.iter_items(tag='odd'))
+        self.assertEqual(['one', 'three'], odd)
+        self.assertEqual(['two'], [r[0] for r in cache.iter_items('tw?')])
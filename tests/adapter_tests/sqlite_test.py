@@ -0,0 +1,213 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from shiftmemory import Memory
+from shiftmemory.adapter import Sqlite
+
+
+@attr('sqlite')
+class SqliteTest(TestCase):
+    """ This holds tests for sqlite adapter """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    def create(self, namespace='test', **config):
+        config.setdefault('path', self.path)
+        return Sqlite(namespace, config=config)
+
+    # -------------------------------------------------------------------------
+
+    def test_create_adapter(self):
+        """ Creating adapter in wal mode """
+        cache = self.create()
+        self.assertIsInstance(cache, Sqlite)
+        mode = cache.get_connection().execute('PRAGMA journal_mode')
+        self.assertEqual('wal', mode.fetchone()[0])
+
+    def test_create_via_memory(self):
+        """ Creating sqlite cache from memory config """
+        memory = Memory(
+            adapters=dict(
+                disk=dict(type='sqlite', config=dict(path=self.path))
+            ),
+            caches=dict(demo=dict(adapter='disk', ttl=10))
+        )
+        self.assertIsInstance(memory.get_cache('demo'), Sqlite)
+
+    def test_set_and_get(self):
+        """ Setting and getting items """
+        cache = self.create()
+        self.assertTrue(cache.set('key', 'value'))
+        self.assertTrue(cache.set('bytes', b'\x00\x01'))
+        self.assertEqual('value', cache.get('key'))
+        self.assertEqual(b'\x00\x01', cache.get('bytes'))
+        self.assertTrue(cache.exists('key'))
+        self.assertIsNone(cache.get('missing'))
+
+    def test_namespaces_are_isolated(self):
+        """ Caches sharing database file do not see each other's items """
+        one = self.create('one')
+        two = self.create('two')
+        one.set('key', 'value')
+        self.assertIsNone(two.get('key'))
+        two.delete_all()
+        self.assertEqual('value', one.get('key'))
+
+    def test_expire_items(self):
+        """ Items expire after ttl """
+        cache = self.create()
+        cache.set('key', 'value', ttl=0.05)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.exists('key'))
+
+    def test_add(self):
+        """ Add item if not exist """
+        cache = self.create()
+        self.assertTrue(cache.add('key', 'one'))
+        self.assertFalse(cache.add('key', 'two'))
+        self.assertEqual('one', cache.get('key'))
+
+    def test_add_is_atomic(self):
+        """ Only one of concurrent adds succeeds """
+        self.create()
+        results = []
+
+        def add():
+            cache = self.create()
+            results.append(cache.add('key', threading.current_thread().name))
+
+        threads = [threading.Thread(target=add) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, results.count(True))
+
+    def test_set_many_in_single_transaction(self):
+        """ Writing batch of items """
+        cache = self.create()
+        cache.set_many(dict(key1='value1'))
+        cache.set_many(dict(key2='value2', key3='value3'), tags=['tag'])
+        self.assertEqual('value1', cache.get('key1'))
+        self.assertEqual({'key2', 'key3'}, cache.get_tagged_items('tag'))
+
+    def test_delete_by_empty_tags(self):
+        """ Deleting by empty tags deletes nothing """
+        cache = self.create()
+        cache.set('key', 'value', tags=['tag'])
+        self.assertFalse(cache.delete(tags=[]))
+        self.assertEqual('value', cache.get('key'))
+
+    def test_rollback_failed_batch(self):
+        """ Failed batch writes nothing """
+        cache = self.create()
+        with self.assertRaises(RuntimeError):
+            with cache.batch():
+                cache.write('key', 'value', None, None, None)
+                raise RuntimeError('fail')
+        self.assertIsNone(cache.get('key'))
+
+    def test_stream_large_items(self):
+        """ Reading large items in chunks """
+        cache = self.create()
+        data = os.urandom(10000)
+        cache.set('key', data)
+        chunks = list(cache.stream('key', chunk_size=4096))
+        self.assertEqual(3, len(chunks))
+        self.assertEqual(data, b''.join(chunks))
+        self.assertEqual([], list(cache.stream('missing')))
+
+    def test_tags(self):
+        """ Tagging items """
+        cache = self.create()
+        cache.set('key1', 'value', tags=['tag1', 'tag2'])
+        cache.set('key2', 'value', tags=['tag2'])
+        self.assertEqual(['tag1', 'tag2'], cache.get_item_tags('key1'))
+        self.assertEqual({'key1', 'key2'}, cache.get_tagged_items('tag2'))
+
+        cache.set('key1', 'value', tags=['tag3'])
+        self.assertEqual({'key2'}, cache.get_tagged_items('tag2'))
+
+    def test_delete_by_tags(self):
+        """ Deleting items by tags with conjunction and disjunction """
+        cache = self.create()
+        cache.set('key1', 'value', tags=['tag1', 'tag2'])
+        cache.set('key2', 'value', tags=['tag2'])
+        cache.set('key3', 'value', tags=['tag3'])
+
+        self.assertTrue(cache.delete(tags=['tag1', 'tag2']))
+        self.assertIsNone(cache.get('key1'))
+        self.assertIsNotNone(cache.get('key2'))
+
+        cache.delete(tags=['tag2', 'tag3'], disjunction=True)
+        self.assertIsNone(cache.get('key2'))
+        self.assertIsNone(cache.get('key3'))
+        self.assertEqual(set(), cache.get_tagged_items('tag2'))
+
+    def test_delete_by_key(self):
+        """ Deleting item by key """
+        cache = self.create()
+        cache.set('key', 'value')
+        self.assertTrue(cache.delete('key'))
+        self.assertFalse(cache.delete('key'))
+
+    def test_evict_least_recently_used(self):
+        """ Evicting least recently used items over maximum size """
+        cache = self.create(max_size=3000, touch_after=0)
+        cache.set('key1', 'x' * 1000)
+        cache.set('key2', 'x' * 1000)
+        cache.set('key3', 'x' * 1000)
+        cache.get('key1')
+        cache.set('key4', 'x' * 1000)
+
+        self.assertIsNotNone(cache.get('key1'))
+        self.assertIsNone(cache.get('key2'))
+        self.assertTrue(cache.get_size() <= 3000)
+
+    def test_optimize_removes_expired_items_and_tags(self):
+        """ Optimizing removes expired items and their tags """
+        cache = self.create()
+        cache.set('key1', 'value', ttl=0.05, tags=['tag'])
+        cache.set('key2', 'value', tags=['tag'])
+        time.sleep(0.06)
+        cache.optimize()
+
+        self.assertEqual({'key2'}, cache.get_tagged_items('tag'))
+        self.assertEqual(len('value'), cache.get_size())
+
+    def test_iter_items(self):
+        """ Iterating items of namespace in pages """
+        cache = self.create()
+        self.create('other').set('item0', 'other')
+        for i in range(7):
+            tags = ['odd'] if i % 2 else None
+            cache.set('item{}'.format(i), str(i), tags=tags, ttl=30)
+        cache.set('bytes', b'\x00\x01')
+        cache.set('gone', 'value', ttl=0.01)
+        time.sleep(0.02)
+
+        items = {r[0]: r for r in cache.iter_items(batch_size=3)}
+        self.assertEqual(8, len(items))
+        self.assertEqual(b'\x00\x01', items['bytes'][1])
+        key, value, ttl, tags = items['item1']
+        self.assertEqual(('1', ['odd']), (value, tags))
+        self.assertTrue(0 < ttl <= 30000)
+
+        odd = [r[0] for r in cache.iter_items(tag='odd', batch_size=2)]
+        self.assertEqual(['item1', 'item3', 'item5'], odd)
+        matched = [r[0] for r in cache.iter_items('item[0-2]')]
+        self.assertEqual(['item0', 'item1', 'item2'], matched)
@@ -0,0 +1,74 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import threading
+
+from shiftmemory.batcher import Batcher
+
+
+@attr('batcher')
+class BatcherTest(TestCase):
+    """
+    Batcher tests
+    This holds tests for automatic batching of reads
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.calls = []
+
+    def loader(self, keys):
+        self.calls.append(keys)
+        return {key: key.upper() for key in keys}
+
+    def run_concurrently(self, batcher, keys):
+        results = dict()
+        barrier = threading.Barrier(len(keys))
+
+        def load(index, key):
+            barrier.wait()
+            results[index] = batcher.load(key)
+
+        threads = [
+            threading.Thread(target=load, args=(index, key))
+            for index, key in enumerate(keys)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [results[index] for index in range(len(keys))]
+
+    def test_load_single_key(self):
+        """ Loading single key """
+        batcher = Batcher(self.loader, window=0.001)
+        self.assertEqual('A', batcher.load('a'))
+        self.assertEqual([['a']], self.calls)
+
+    def test_batch_concurrent_loads(self):
+        """ Concurrent loads are batched and deduplicated """
+        batcher = Batcher(self.loader, window=0.1)
+        keys = ['a', 'b', 'a', 'c', 'b', 'a']
+        results = self.run_concurrently(batcher, keys)
+        self.assertEqual([key.upper() for key in keys], results)
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(['a', 'b', 'c'], sorted(self.calls[0]))
+
+        stats = batcher.stats()
+        self.assertEqual(dict(requests=6, keys=3, batches=1), stats)
+
+    def test_split_batches_by_size(self):
+        """ Full batches are loaded without waiting for window """
+        batcher = Batcher(self.loader, window=10, max_keys=2)
+        keys = ['a', 'b', 'c', 'd']
+        results = self.run_concurrently(batcher, keys)
+        self.assertEqual(['A', 'B', 'C', 'D'], results)
+        self.assertEqual(2, len(self.calls))
+
+    def test_raise_loader_errors_to_all_callers(self):
+        """ Loader errors are raised to every caller of the batch """
+        def loader(keys):
+            raise RuntimeError('Server gone')
+
+        batcher = Batcher(loader, window=0.001)
+        with self.assertRaises(RuntimeError):
+            batcher.load('a')
@@ -0,0 +1,58 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import os
+import tempfile
+
+from shiftmemory import benchmark, policy
+
+
+@attr('benchmark')
+class BenchmarkTest(TestCase):
+    """
+    Benchmark tests
+    This holds tests for cache policies and trace replay
+    """
+
+    def test_policies_respect_capacity(self):
+        """ Policies never keep more keys than capacity """
+        trace = benchmark.zipf_trace(5000, 500, seed=1)
+        for name in ('lru', 'lfu', 'tinylfu'):
+            cache_policy = policy.create(name, 50)
+            benchmark.replay(trace, cache_policy)
+            self.assertTrue(len(cache_policy) <= 50, name)
+
+    def test_lfu_evicts_least_frequent(self):
+        """ LFU evicts least frequently used key """
+        cache_policy = policy.create('lfu', 2)
+        cache_policy.admit('one')
+        cache_policy.admit('two')
+        cache_policy.access('one')
+        self.assertEqual(['two'], cache_policy.admit('three'))
+
+    def test_tinylfu_resists_scans(self):
+        """ TinyLFU beats LRU on trace with scans """
+        trace = benchmark.zipf_trace(
+            20000,
+            2000,
+            skew=0.9,
+            scan_every=2000,
+            scan_size=300,
+            seed=1
+        )
+        results = benchmark.compare(trace, 200, policies=('lru', 'tinylfu'))
+        lru = results['lru']['hit_ratio']
+        self.assertTrue(results['tinylfu']['hit_ratio'] > lru)
+        self.assertEqual(results['lru']['requests'], len(trace))
+
+    def test_read_text_trace(self):
+        """ Reading text traces """
+        with tempfile.NamedTemporaryFile('w', delete=False) as file:
+            file.write('# comment\nkey1\nset key2\n\nDELETE key1\n')
+
+        try:
+            trace = list(benchmark.read_trace(file.name))
+        finally:
+            os.unlink(file.name)
+
+        expected = [('get', 'key1'), ('set', 'key2'), ('delete', 'key1')]
+        self.assertEqual(expected, trace)
@@ -0,0 +1,184 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+from click.testing import CliRunner
+import json
+import os
+import shutil
+import tempfile
+
+from shiftmemory.adapter import Redis
+from shiftmemory.cli.console import cli
+
+
+@attr('cli')
+class CliTest(TestCase):
+    """ This holds tests for management console """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.config = os.path.join(self.dir, 'shiftmemory.cfg')
+        config = dict(
+            adapters=dict(
+                disk=dict(
+                    type='sqlite',
+                    config=dict(path=os.path.join(self.dir, 'db.sqlite'))
+                ),
+                redis=dict(type='redis', config=dict(db=1)),
+            ),
+            caches=dict(
+                files=dict(adapter='disk', ttl=10),
+                pages=dict(adapter='redis', ttl=10),
+            )
+        )
+        with open(self.config, 'w') as file:
+            json.dump(config, file)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    def invoke(self, *args):
+        runner = CliRunner()
+        result = runner.invoke(cli, ['--config', self.config] + list(args))
+        if result.exception and not isinstance(result.exception, SystemExit):
+            raise result.exception
+        return result
+
+    # -------------------------------------------------------------------------
+
+    def test_fail_on_missing_config(self):
+        """ Fail with error message if config can't be loaded """
+        runner = CliRunner()
+        result = runner.invoke(cli, ['--config', 'nope.cfg', 'list-caches'])
+        self.assertEqual(1, result.exit_code)
+        self.assertIn('Unable to load config', result.output)
+
+    def test_list_caches(self):
+        """ Listing configured caches as JSON """
+        result = self.invoke('list-caches', '--json')
+        caches = json.loads(result.output)
+        self.assertEqual(['files', 'pages'], [c['name'] for c in caches])
+        self.assertEqual('sqlite', caches[0]['type'])
+
+    def test_delete_cache_without_scan_support(self):
+        """ Dropping cache of adapter that can't scan """
+        result = self.invoke('delete-cache', 'files', '--json')
+        self.assertEqual(0, result.exit_code)
+        self.assertIsNone(json.loads(result.output)['keys'])
+
+    def test_fail_dry_run_without_scan_support(self):
+        """ Dry run requires adapter that can scan """
+        result = self.invoke('delete-cache', 'files', '--dry-run')
+        self.assertEqual(1, result.exit_code)
+
+    @attr('integration', 'redis')
+    def test_delete_by_tags_in_batches(self):
+        """ Deleting items by tags in batches with dry run """
+        redis = Redis('pages', db=1)
+        for i in range(10):
+            tags = ['one', 'two'] if i % 2 else ['one']
+            redis.set('item{}'.format(i), 'data', tags=tags)
+
+        args = ['delete', 'pages', '--tags', 'one,two', '--batch-size', '2']
+        result = json.loads(self.invoke(*args, '--dry-run', '--json').output)
+        self.assertEqual(5, result['keys'])
+        self.assertEqual('data', redis.get('item1'))
+
+        result = json.loads(self.invoke(*args, '--json').output)
+        self.assertEqual(5, result['keys'])
+        self.assertIsNone(redis.get('item1'))
+        self.assertEqual('data', redis.get('item2'))
+        redis.get_redis().flushdb()
+
+    @attr('integration', 'redis')
+    def test_delete_by_tags_invalidates_tags(self):
+        """ Deleting items by tags in batches invalidates tags """
+        with open(self.config, 'w') as file:
+            json.dump(dict(
+                adapters=dict(redis=dict(type='redis', config=dict(db=1))),
+                caches=dict(
+                    pages=dict(adapter='redis', ttl=10, tag_versioning=True)
+                ),
+            ), file)
+
+        redis = Redis('pages', db=1, tag_versioning=True)
+        for i in range(5):
+            redis.set('item{}'.format(i), 'data', tags=['page'])
+        version = redis.get_tag_versions(['page'])
+
+        args = ['delete', 'pages', '--tags', 'page', '--batch-size', '2']
+        result = json.loads(self.invoke(*args, '--json').output)
+        self.assertEqual(5, result['keys'])
+        self.assertIsNone(redis.get('item1'))
+        self.assertNotEqual(version, redis.get_tag_versions(['page']))
+        self.assertFalse(redis.get_tagged_items('page'))
+        client = redis.get_redis()
+        self.assertFalse(client.exists(redis.get_tag_set_key('page')))
+        client.flushdb()
+
+    @attr('integration', 'redis')
+    def test_delete_cache_in_batches(self):
+        """ Dropping cache in batches """
+        redis = Redis('pages', db=1, optimize_after=None)
+        for i in range(10):
+            redis.set('item{}'.format(i), 'data')
+
+        args = ['delete-cache', 'pages', '--batch-size', '3', '--json']
+        result = json.loads(self.invoke(*args).output)
+        self.assertTrue(result['keys'] >= 10)
+        self.assertIsNone(redis.get('item1'))
+        redis.get_redis().flushdb()
+
+    @attr('integration', 'redis')
+    def test_show_slow_log(self):
+        """ Displaying slow operations shared by other processes """
+        redis = Redis('pages', db=1, optimize_after=None)
+        redis.push_slow_log(dict(
+            time=0,
+            operation='delete',
+            cache='pages',
+            adapter='Redis',
+            key=None,
+            keys=0,
+            tags=2,
+            bytes=0,
+            duration=0.5,
+            round_trips=40,
+            commands=40000,
+            pipeline=1000,
+            error=None,
+        ))
+
+        result = json.loads(self.invoke('slow-log', 'pages', '--json').output)
+        self.assertEqual(40000, result[0]['commands'])
+        result = self.invoke('slow-log', 'pages')
+        self.assertIn('500.0ms', result.output)
+        redis.get_redis().flushdb()
+
+    def test_load_test(self):
+        """ Load testing cache from several processes """
+        args = ['load-test', 'files', '--processes', '2', '--keys', '10']
+        result = self.invoke(*args, '--operations', '50', '--json')
+        data = json.loads(result.output)
+        self.assertTrue(data['ok'])
+        self.assertEqual(100, data['operations'])
+
+    @attr('integration', 'redis')
+    def test_snapshot_and_warmup(self):
+        """ Exporting cache to snapshot and loading it back """
+        redis = Redis('pages', db=1, optimize_after=None)
+        for i in range(10):
+            redis.set('item{}'.format(i), 'data', tags=['page'])
+
+        path = os.path.join(self.dir, 'pages.snapshot')
+        result = self.invoke('snapshot', 'pages', path, '--json')
+        self.assertEqual(10, json.loads(result.output)['keys'])
+
+        redis.delete_all()
+        args = ['warmup', 'pages', path, '--batch-size', '3', '--json']
+        result = self.invoke(*args)
+        self.assertEqual(10, json.loads(result.output)['keys'])
+        self.assertEqual('data', redis.get('item3'))
+        self.assertEqual(10, len(redis.get_tagged_items('page')))
+        redis.get_redis().flushdb()
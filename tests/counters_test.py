@@ -0,0 +1,61 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import time
+
+from shiftmemory.adapter import Redis
+from shiftmemory.counters import CounterBuffer
+
+
+@attr('integration', 'redis')
+class CountersTest(TestCase):
+    """
+    Counters tests
+    This holds tests for buffered counters
+    """
+
+    def tearDown(self):
+        Redis('test').get_redis().flushdb()
+        TestCase.tearDown(self)
+
+    def test_aggregate_increments(self):
+        """ Increments are summed locally until flushed """
+        redis = Redis('test')
+        counters = CounterBuffer(redis, interval=60)
+        for i in range(1000):
+            counters.incr('views')
+        counters.decr('views', 10)
+        counters.incr('clicks', ttl=30)
+        self.assertIsNone(redis.get('views'))
+
+        self.assertEqual(2, counters.flush())
+        self.assertEqual('990', redis.get('views'))
+        self.assertEqual('1', redis.get('clicks'))
+        self.assertEqual(0, counters.flush())
+        counters.close()
+
+    def test_flush_periodically(self):
+        """ Increments are flushed in background """
+        redis = Redis('test')
+        counters = CounterBuffer(redis, interval=0.01)
+        counters.incr('views', 5)
+        time.sleep(0.1)
+        self.assertEqual('5', redis.get('views'))
+        counters.close()
+
+    def test_flush_when_full(self):
+        """ Increments are flushed when too many keys are pending """
+        redis = Redis('test')
+        counters = CounterBuffer(redis, interval=60, max_keys=2)
+        counters.incr('one')
+        self.assertIsNone(redis.get('one'))
+        counters.incr('two')
+        self.assertEqual('1', redis.get('one'))
+        counters.close()
+
+    def test_flush_on_close(self):
+        """ Closing buffer flushes remaining increments """
+        redis = Redis('test')
+        counters = CounterBuffer(redis, interval=60)
+        counters.incr('views')
+        counters.close()
+        self.assertEqual('1', redis.get('views'))
@@ -0,0 +1,164 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import os
+import shutil
+import tempfile
+
+from shiftmemory import Memory, hooks, exceptions
+from shiftmemory.adapter import Local, Sqlite
+
+
+class Recorder(hooks.Hook):
+    """ Hook remembering events """
+
+    def __init__(self):
+        self.started = []
+        self.events = []
+
+    def before(self, event):
+        self.started.append(event.operation)
+
+    def after(self, event):
+        self.events.append(event)
+
+
+class Span:
+    """ Fake span """
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.exceptions = []
+        self.ended = False
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def record_exception(self, error):
+        self.exceptions.append(error)
+
+    def end(self):
+        self.ended = True
+
+
+class Tracer:
+    """ Fake tracer """
+
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, attributes=None):
+        span = Span(name, attributes or {})
+        self.spans.append(span)
+        return span
+
+
+@attr('hooks')
+class HooksTest(TestCase):
+    """
+    Hooks tests
+    This holds tests for operation hooks
+    """
+
+    def test_call_hooks_around_operations(self):
+        """ Hooks are called around every operation """
+        recorder = Recorder()
+        cache = hooks.Instrumented(Local('test'), [recorder])
+        cache.set('key', 'value')
+        self.assertEqual('value', cache.get('key'))
+        self.assertIsNone(cache.get('missing'))
+        cache.delete('key')
+
+        self.assertEqual(['set', 'get', 'get', 'delete'], recorder.started)
+        event = recorder.events[1]
+        self.assertEqual('get', event.operation)
+        self.assertEqual('test', event.cache)
+        self.assertEqual('Local', event.adapter)
+        self.assertEqual(1, event.keys)
+        self.assertEqual(5, event.bytes)
+        self.assertTrue(event.duration >= 0)
+        self.assertEqual(0, recorder.events[2].bytes)
+
+    def test_report_errors(self):
+        """ Failed operations are reported and raised """
+        recorder = Recorder()
+        cache = hooks.Instrumented(Local('test'), [recorder])
+        with self.assertRaises(TypeError):
+            cache.delete(tags=None)
+        self.assertIsInstance(recorder.events[0].error, TypeError)
+
+    def test_measure_writes_of_other_adapters(self):
+        """ Measuring writes of adapters other than redis """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'test.sqlite')
+        recorder = Recorder()
+        cache = hooks.Instrumented(Sqlite('test', path=path), [recorder])
+
+        self.assertTrue(cache.set_many(dict(one='1', two='22')))
+        self.assertEqual('22', cache.get('two'))
+        event = recorder.events[0]
+        self.assertEqual((2, 3), (event.keys, event.bytes))
+        self.assertIsNone(event.error)
+
+    def test_ignore_hook_errors(self):
+        """ Failing hooks do not change result or error of operations """
+        class Failing(hooks.Hook):
+            def before(self, event):
+                raise RuntimeError('before')
+
+            def after(self, event):
+                raise RuntimeError('after')
+
+        recorder = Recorder()
+        cache = hooks.Instrumented(Local('test'), [Failing(), recorder])
+        self.assertTrue(cache.set('key', 'value'))
+        self.assertEqual('value', cache.get('key'))
+        with self.assertRaises(TypeError):
+            cache.delete(tags=None)
+        self.assertEqual(3, len(recorder.events))
+
+    def test_delegate_other_attributes(self):
+        """ Other attributes are delegated to adapter """
+        recorder = Recorder()
+        cache = hooks.Instrumented(Local('test'), [recorder])
+        self.assertEqual('test', cache.namespace)
+        cache.find('key')
+        self.assertEqual([], recorder.events)
+
+    def test_emit_opentelemetry_spans(self):
+        """ OpenTelemetry hook emits a span per operation """
+        tracer = Tracer()
+        cache = hooks.Instrumented(
+            Local('test'),
+            [hooks.OpenTelemetryHook(tracer)]
+        )
+        cache.set('key', 'value')
+        span = tracer.spans[0]
+        self.assertEqual('cache.set', span.name)
+        self.assertEqual('test', span.attributes['cache.name'])
+        self.assertEqual(5, span.attributes['cache.bytes'])
+        self.assertTrue(span.ended)
+
+    def test_raise_on_unknown_hook(self):
+        """ Raise on unknown hook name """
+        with self.assertRaises(exceptions.ConfigurationException):
+            hooks.create(['statsd'])
+
+    def test_configure_hooks_via_memory(self):
+        """ Memory wraps caches with hooks """
+        everywhere = Recorder()
+        demo_only = Recorder()
+        memory = Memory(
+            adapters=dict(local=dict(type='local')),
+            caches=dict(
+                demo=dict(adapter='local', ttl=60, hooks=[demo_only]),
+                other=dict(adapter='local', ttl=60),
+            ),
+            hooks=[everywhere]
+        )
+        memory.get_cache('demo').set('key', 'value')
+        memory.get_cache('other').get('key')
+        self.assertEqual(['set', 'get'], everywhere.started)
+        self.assertEqual(['set'], demo_only.started)
+        self.assertEqual('demo', demo_only.events[0].cache)
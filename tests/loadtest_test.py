@@ -0,0 +1,106 @@
+from unittest import TestCase, skipUnless
+from nose.plugins.attrib import attr
+import functools
+import os
+import shutil
+import tempfile
+
+from shiftmemory import Memory, loadtest, exceptions
+from shiftmemory.adapter import Redis, Sqlite, Shared
+
+
+class ForgetfulSqlite(Sqlite):
+    """ Sqlite adapter dropping worker tags of contended items """
+
+    def set(self, key, value, *, tags=None, **kwargs):
+        if key.startswith('tagged:'):
+            tags = ['all']
+        return Sqlite.set(self, key, value, tags=tags, **kwargs)
+
+
+@attr('loadtest')
+class LoadTestTest(TestCase):
+    """
+    Load test tests
+    This holds tests for multi-process load harness
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    def assertPasses(self, report):
+        self.assertEqual([], report['errors'])
+        self.assertEqual(0, report['add_violations'])
+        self.assertEqual(0, report['lost_tags'])
+        self.assertEqual(0, report['stale_reads'])
+        self.assertTrue(report['ok'])
+        self.assertEqual(3 * 200, report['operations'])
+        self.assertTrue(report['throughput'] > 0)
+
+    # -------------------------------------------------------------------------
+
+    def test_load_test_sqlite(self):
+        """ Sqlite adapter keeps guarantees across processes """
+        path = os.path.join(self.dir, 'test.sqlite')
+        factory = functools.partial(Sqlite, 'test', config=dict(path=path))
+        report = loadtest.run(factory, processes=3, keys=20, operations=200)
+        self.assertPasses(report)
+        self.assertEqual('Sqlite', report['adapter'])
+
+    def test_load_test_shared(self):
+        """ Shared memory adapter keeps guarantees across processes """
+        path = os.path.join(self.dir, 'test.cache')
+        config = dict(path=path, slots=1024)
+        factory = functools.partial(Shared, 'test', config=config)
+        report = loadtest.run(factory, processes=3, keys=20, operations=200)
+        self.assertPasses(report)
+
+    def test_detect_lost_tags(self):
+        """ Items missing tags of the winning writer fail the report """
+        path = os.path.join(self.dir, 'test.sqlite')
+        factory = functools.partial(
+            ForgetfulSqlite,
+            'test',
+            config=dict(path=path)
+        )
+        report = loadtest.run(factory, processes=2, keys=10, operations=10)
+        self.assertEqual(10, report['lost_tags'])
+        self.assertFalse(report['ok'])
+
+    def test_load_test_configured_cache(self):
+        """ Running load test against cache from memory configuration """
+        path = os.path.join(self.dir, 'test.sqlite')
+        memory = Memory(
+            adapters=dict(disk=dict(type='sqlite', config=dict(path=path))),
+            caches=dict(files=dict(adapter='disk', ttl=10))
+        )
+        factory = loadtest.memory_factory(memory, 'files')
+        report = loadtest.run(factory, processes=2, keys=10, operations=50)
+        self.assertTrue(report['ok'])
+        self.assertEqual(2, report['processes'])
+
+    @skipUnless(shutil.which('redis-server'), 'requires redis-server')
+    @attr('integration', 'redis')
+    def test_load_test_spawned_redis(self):
+        """ Redis adapter keeps guarantees across processes """
+        with loadtest.spawn_redis() as config:
+            factory = functools.partial(Redis, 'test', config=config)
+            report = loadtest.run(
+                factory,
+                processes=3,
+                keys=20,
+                operations=200
+            )
+        self.assertPasses(report)
+
+    @skipUnless(not shutil.which('redis-server'), 'redis-server installed')
+    def test_spawn_redis_requires_binary(self):
+        """ Spawning redis fails without redis-server binary """
+        with self.assertRaises(exceptions.ConfigurationException):
+            with loadtest.spawn_redis():
+                pass
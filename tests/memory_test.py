@@ -111,6 +111,78 @@ class MemoryTest(TestCase):
         memory.drop_all_caches()
         self.assertTrue(cache.delete_all.called)
 
+    def test_drop_all_caches_reports_results(self):
+        """ Dropping all caches reports per cache results and failures """
+        memory = Memory(
+            adapters=self.adapters,
+            caches=dict(
+                ok=dict(adapter='test'),
+                failing=dict(adapter='test'),
+                dummy_one=dict(adapter='dummy', ttl=10),
+            )
+        )
+        ok = mock.Mock()
+        ok.delete_all.return_value = 'deleted'
+        failing = mock.Mock()
+        failing.delete_all.side_effect = RuntimeError('boom')
+        memory._cache_instances['ok'] = ok
+        memory._cache_instances['failing'] = failing
+
+        results = memory.drop_all_caches()
+        self.assertEqual('deleted', results['ok']['result'])
+        self.assertIsNone(results['ok']['error'])
+        self.assertIsInstance(results['failing']['error'], RuntimeError)
+        self.assertTrue(results['dummy_one']['skipped'])
+        self.assertTrue(ok.delete_all.called)
+
+    def test_get_server_key(self):
+        """ Caches sharing redis server have the same server key """
+        memory = Memory(
+            adapters=dict(
+                one=dict(type='redis', config=dict(host='redis', db=1)),
+                two=dict(type='redis', config=dict(host='redis', db=2)),
+                three=dict(type='redis'),
+            ),
+            caches=dict(
+                a=dict(adapter='one'),
+                b=dict(adapter='two'),
+                c=dict(adapter='three'),
+            )
+        )
+        self.assertEqual(
+            memory.get_server_key('a'),
+            memory.get_server_key('b')
+        )
+        self.assertNotEqual(
+            memory.get_server_key('a'),
+            memory.get_server_key('c')
+        )
+
+    def test_get_server_key_of_other_adapters(self):
+        """ Caches of other adapters are not grouped with redis """
+        memory = Memory(
+            adapters=dict(
+                redis=dict(type='redis', config=dict(db=1)),
+                disk=dict(type='sqlite', config=dict(path='/tmp/a.db')),
+                copy=dict(type='sqlite', config=dict(path='/tmp/a.db')),
+                shared=dict(type='shared', config=dict(slots=256)),
+                local=dict(type='local'),
+            ),
+            caches=dict(
+                a=dict(adapter='redis'),
+                b=dict(adapter='disk'),
+                c=dict(adapter='copy'),
+                d=dict(adapter='shared'),
+                e=dict(adapter='local'),
+            )
+        )
+        keys = [memory.get_server_key(name) for name in 'abde']
+        self.assertEqual(4, len(set(keys)))
+        self.assertEqual(
+            memory.get_server_key('b'),
+            memory.get_server_key('c')
+        )
+
     def test_raise_feature_missing_on_optimizing(self):
         """ Raise if adapter is unable to optimize """
         with self.assertRaises(exceptions.AdapterFeatureMissingException):
@@ -163,10 +235,18 @@ class MemoryTest(TestCase):
         cache = memory.get_cache('demo_redis')
         self.assertIsInstance(cache, adapter.Redis)
 
+    @attr('integration', 'redis')
+    def test_pass_cache_options_to_adapter(self):
+        """ Passing extra cache options to adapter """
+        adapters = dict(redis_adapter=dict(type='redis'))
+        caches = dict(
+            demo_redis=dict(
+                adapter='redis_adapter',
+                ttl=20,
+                tag_versioning=True
+            )
+        )
 
-
-
-
-
-
-
+        memory = Memory(adapters=adapters, caches=caches)
+        cache = memory.get_cache('demo_redis')
+        self.assertTrue(cache.tag_versioning)
@@ -0,0 +1,114 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+
+from shiftmemory import resilience
+from shiftmemory.resilience import CircuitBreaker, Guard
+
+
+class Clock:
+    """ Manual clock """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class Server:
+    """ Flaky server """
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('Server gone')
+        return 'value'
+
+
+@attr('resilience')
+class ResilienceTest(TestCase):
+    """
+    Resilience tests
+    This holds tests for circuit breaker and guarded calls
+    """
+
+    def test_open_breaker_after_consecutive_failures(self):
+        """ Breaker opens after consecutive failures """
+        breaker = CircuitBreaker(failure_threshold=2, clock=Clock())
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+        self.assertEqual(resilience.OPEN, breaker.stats()['state'])
+        self.assertEqual(1, breaker.stats()['opened'])
+        self.assertEqual(1, breaker.stats()['rejected'])
+
+    def test_probe_half_open_breaker(self):
+        """ Half-open breaker lets a single probe through """
+        clock = Clock()
+        breaker = CircuitBreaker(1, reset_timeout=5, clock=clock)
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+        clock.now = 5
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertEqual(resilience.HALF_OPEN, breaker.stats()['state'])
+
+        breaker.failure()
+        self.assertEqual(resilience.OPEN, breaker.stats()['state'])
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.success())
+        self.assertEqual(resilience.CLOSED, breaker.stats()['state'])
+
+    def test_retry_failed_calls(self):
+        """ Failed calls are retried """
+        server = Server(failures=1)
+        guard = Guard((ConnectionError,), retries=1, backoff=0)
+        self.assertEqual('value', guard.call(server.get, ('key',), {}, None))
+        self.assertEqual(2, server.calls)
+        self.assertEqual(1, guard.stats()['retries'])
+
+    def test_return_default_on_failure(self):
+        """ Failed and rejected calls return default """
+        server = Server(failures=10)
+        guard = Guard((ConnectionError,), retries=0, failure_threshold=1)
+        self.assertEqual('miss', guard.call(server.get, ('k',), {}, 'miss'))
+        self.assertEqual('miss', guard.call(server.get, ('k',), {}, 'miss'))
+        self.assertEqual(1, server.calls)
+
+        default = lambda key: key + '?'
+        self.assertEqual('k?', guard.call(server.get, ('k',), {}, default))
+        self.assertEqual(3, guard.stats()['fallbacks'])
+
+    def test_serve_from_fallback(self):
+        """ Fallback serves calls while failing """
+        class Fallback:
+            def get(self, key):
+                return 'local'
+
+            def delete_all(self):
+                self.cleared = True
+
+        fallback = Fallback()
+        server = Server(failures=1)
+        guard = Guard((ConnectionError,), retries=0, fallback=fallback)
+        self.assertEqual('local', guard.call(server.get, ('k',), {}, None))
+
+    def test_raise_other_errors(self):
+        """ Errors other than failures are raised """
+        def broken(key):
+            raise KeyError(key)
+
+        guard = Guard((ConnectionError,))
+        with self.assertRaises(KeyError):
+            guard.call(broken, ('k',), {}, None)
+        self.assertEqual(resilience.CLOSED, guard.stats()['state'])
@@ -0,0 +1,96 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import random
+
+from shiftmemory.sketch import CountMinSketch, TopK, BloomFilter
+from shiftmemory.profiler import Profiler, NearCache
+
+
+@attr('sketch')
+class SketchTest(TestCase):
+    """
+    Sketch tests
+    This holds tests for frequency sketches and access profiler
+    """
+
+    def test_count_min_never_undercounts(self):
+        """ Count-min sketch estimates are upper bounds """
+        sketch = CountMinSketch(width=64, depth=4)
+        counts = dict()
+        for i in range(2000):
+            key = 'key{}'.format(i % 300)
+            counts[key] = counts.get(key, 0) + 1
+            sketch.add(key)
+
+        for key, count in counts.items():
+            self.assertTrue(sketch.estimate(key) >= count)
+        self.assertEqual(2000, sketch.total)
+        self.assertEqual([64] * 4, [len(row) for row in sketch.rows])
+
+    def test_count_min_decay(self):
+        """ Decaying halves counts """
+        sketch = CountMinSketch()
+        sketch.add('key', 10)
+        sketch.decay()
+        self.assertEqual(5, sketch.estimate('key'))
+
+    def test_top_k_finds_heavy_hitters(self):
+        """ Top-k keeps most frequent keys of skewed stream """
+        generator = random.Random(1)
+        top = TopK(k=5, width=512)
+        for _ in range(20000):
+            if generator.random() < 0.5:
+                top.add('hot{}'.format(generator.randrange(3)))
+            else:
+                top.add('cold{}'.format(generator.randrange(5000)))
+
+        keys = [key for key, _ in top.items()]
+        self.assertEqual(5, len(keys))
+        self.assertEqual({'hot0', 'hot1', 'hot2'}, set(keys[:3]))
+
+    def test_bloom_filter(self):
+        """ Bloom filter has no false negatives and few false positives """
+        bloom = BloomFilter(size=2 ** 16, hashes=5)
+        for i in range(1000):
+            bloom.add('key{}'.format(i))
+
+        for i in range(1000):
+            self.assertIn('key{}'.format(i), bloom)
+        false = sum('other{}'.format(i) in bloom for i in range(1000))
+        self.assertTrue(false < 20)
+
+    def test_bloom_filter_loads_redis_bitmaps(self):
+        """ Bits are laid out as in redis bitmaps """
+        bloom = BloomFilter(size=16)
+        bloom.set_bits([0, 9])
+        self.assertEqual(b'\x80\x40', bytes(bloom.bits))
+
+        copy = BloomFilter(size=16)
+        copy.load(b'\x80')
+        self.assertEqual(b'\x80\x00', bytes(copy.bits))
+
+    def test_profiler_samples_and_scales_counts(self):
+        """ Profiler samples accesses and scales counts by sample rate """
+        profiler = Profiler(sample_rate=0.1, top=3, seed=1)
+        for _ in range(10000):
+            profiler.record('get', 'hot')
+            profiler.record('get', 'warm')
+        profiler.record('set', 'other')
+
+        keys = profiler.hot_keys('get')
+        self.assertEqual({'hot', 'warm'}, {key for key, _ in keys})
+        count = dict(keys)['hot']
+        self.assertTrue(8000 < count < 12000)
+        self.assertEqual([], profiler.hot_keys('delete'))
+
+    def test_near_cache_expires_values(self):
+        """ Near cache drops stale and oldest values """
+        cache = NearCache(size=2, ttl=-1)
+        cache.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
+
+        cache = NearCache(size=2, ttl=10)
+        for key in ('one', 'two', 'three'):
+            cache.set(key, key)
+        self.assertIsNone(cache.get('one'))
+        self.assertEqual('three', cache.get('three'))
@@ -0,0 +1,133 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import threading
+import time
+
+from shiftmemory import Memory, hooks, slowlog, exceptions
+from shiftmemory.adapter import Local
+
+
+class SlowLocal(Local):
+    """ Local adapter with slow deletes """
+
+    def delete(self, *args, **kwargs):
+        time.sleep(0.01)
+        return super().delete(*args, **kwargs)
+
+
+@attr('slowlog')
+class SlowLogTest(TestCase):
+    """
+    Slow log tests
+    This holds tests for slow operations log
+    """
+
+    def test_record_slow_operations(self):
+        """ Only operations over threshold are recorded """
+        log = slowlog.SlowLog(threshold=0.005)
+        cache = hooks.Instrumented(SlowLocal('test'), [log])
+        cache.set('key', 'value', tags=['a'])
+        cache.get('key')
+        cache.delete(tags=['a', 'b'])
+        cache.delete('key')
+
+        entries = log.get_entries()
+        self.assertEqual(2, len(entries))
+        newest, oldest = entries
+        self.assertEqual('key', newest['key'])
+        self.assertEqual('delete', oldest['operation'])
+        self.assertIsNone(oldest['key'])
+        self.assertEqual(2, oldest['tags'])
+        self.assertEqual('test', oldest['cache'])
+        self.assertEqual('SlowLocal', oldest['adapter'])
+        self.assertTrue(oldest['duration'] >= 0.005)
+        self.assertIsNone(oldest['error'])
+        self.assertEqual(1, len(log.get_entries(limit=1)))
+
+    def test_keep_last_entries(self):
+        """ Slow log is a ring buffer """
+        log = slowlog.SlowLog(threshold=0, size=3)
+        cache = hooks.Instrumented(Local('test'), [log])
+        for i in range(5):
+            cache.get('key{}'.format(i))
+
+        keys = [entry['key'] for entry in log.get_entries()]
+        self.assertEqual(['key4', 'key3', 'key2'], keys)
+        log.clear()
+        self.assertEqual([], log.get_entries())
+
+    def test_record_failures(self):
+        """ Failed slow operations are recorded with error """
+        class Failing(Local):
+            def get(self, key):
+                raise ValueError('boom')
+
+        log = slowlog.SlowLog(threshold=0)
+        cache = hooks.Instrumented(Failing('test'), [log])
+        with self.assertRaises(ValueError):
+            cache.get('key')
+        self.assertIn('boom', log.get_entries()[0]['error'])
+
+    def test_share_entries_with_cache(self):
+        """ Entries are pushed to cache able to share them """
+        shared = []
+
+        class Sharing(Local):
+            def push_slow_log(self, entry, size):
+                shared.append((entry['operation'], size))
+
+        cache = Sharing('test')
+        log = slowlog.SlowLog(threshold=0, size=10, cache=cache)
+        hooks.Instrumented(cache, [log]).get('key')
+        log.flush()
+        self.assertEqual([('get', 10)], shared)
+        self.assertNotEqual(threading.current_thread(), log.sharer)
+
+    def test_share_entries_off_caller_thread(self):
+        """ Sharing does not block operations and drops oldest entries """
+        release = threading.Event()
+        shared = []
+
+        class Stalled(Local):
+            def push_slow_log(self, entry, size):
+                release.wait(5)
+                shared.append(entry['key'])
+
+        log = slowlog.SlowLog(threshold=0, size=2, cache=Stalled('test'))
+        cache = hooks.Instrumented(log.cache, [log])
+        started = time.perf_counter()
+        for i in range(5):
+            cache.get('key{}'.format(i))
+        self.assertTrue(time.perf_counter() - started < 1)
+
+        release.set()
+        log.flush()
+        self.assertEqual(['key3', 'key4'], shared[-2:])
+        self.assertEqual(5, len(shared) + log.dropped)
+
+    def test_create_from_config(self):
+        """ Creating slow log from cache config """
+        self.assertEqual(0.05, slowlog.create(True).threshold)
+        self.assertEqual(0.2, slowlog.create(0.2).threshold)
+        log = slowlog.create(dict(threshold=1, size=5))
+        self.assertEqual(5, log.size)
+        with self.assertRaises(exceptions.ConfigurationException):
+            slowlog.create(-1)
+
+    def test_read_slow_log_from_memory(self):
+        """ Memory returns slow log of cache """
+        memory = Memory(
+            adapters=dict(local=dict(type='local')),
+            caches=dict(
+                logged=dict(adapter='local', ttl=10, slow_log=0),
+                plain=dict(adapter='local', ttl=10),
+            )
+        )
+        memory.get_cache('logged').get('key')
+        entries = memory.slow_log('logged', local=True)
+        self.assertEqual(['get'], [entry['operation'] for entry in entries])
+
+        with self.assertRaises(exceptions.ConfigurationException):
+            memory.slow_log('plain', local=True)
+        with self.assertRaises(exceptions.AdapterFeatureMissingException):
+            memory.slow_log('logged')
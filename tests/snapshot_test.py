@@ -0,0 +1,105 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import gzip
+import os
+import shutil
+import tempfile
+
+from shiftmemory import Memory, snapshot, exceptions
+from shiftmemory.adapter import Local
+
+
+@attr('snapshot')
+class SnapshotTest(TestCase):
+    """
+    Snapshot tests
+    This holds tests for snapshot files
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    # -------------------------------------------------------------------------
+
+    def test_write_and_read_snapshot(self):
+        """ Records are streamed to file and back """
+        records = [
+            ('one', '1', 1500, None),
+            ('two', b'\x00\xff', None, ['a', 'b']),
+            ('three', 3, 100, ['a']),
+        ]
+        result = snapshot.write(self.path, iter(records), 'test')
+        self.assertEqual(3, result['keys'])
+
+        header, read = snapshot.read(self.path)
+        self.assertEqual('test', header['cache'])
+        self.assertEqual(snapshot.VERSION, header['version'])
+        self.assertEqual(records, list(read))
+
+    def test_fail_to_write_unsupported_values(self):
+        """ Only strings, numbers and bytes can be written """
+        records = [('key', object(), None, None)]
+        with self.assertRaises(exceptions.ValueException):
+            snapshot.write(self.path, records)
+
+    def test_fail_to_read_other_files(self):
+        """ Only snapshot files can be read """
+        with gzip.open(self.path, 'wt') as file:
+            file.write('{"format": "other"}\n')
+        with self.assertRaises(exceptions.ValueException):
+            snapshot.read(self.path)
+
+        with open(self.path, 'w') as file:
+            file.write('not gzipped')
+        with self.assertRaises(exceptions.ValueException):
+            snapshot.read(self.path)
+
+    def test_load_into_any_adapter(self):
+        """ Adapters without bulk import get items set one by one """
+        cache = Local('test')
+        records = [('item{}'.format(i), i, 1500, ['tag']) for i in range(10)]
+        result = snapshot.load(cache, iter(records), batch_size=3, workers=2)
+        self.assertEqual(10, result['keys'])
+        self.assertEqual(5, cache.get('item5'))
+        self.assertEqual(['tag'], cache.get_item_tags('item5'))
+
+    def test_load_with_rate_limit(self):
+        """ Loading slows down to keep under rate limit """
+        records = [('item{}'.format(i), i, None, None) for i in range(10)]
+        options = dict(batch_size=5, rate_limit=200)
+        result = snapshot.load(Local('test'), iter(records), **options)
+        self.assertTrue(result['time'] >= 0.045)
+
+    def test_stop_on_failed_batch(self):
+        """ Errors of batches are raised """
+        class Failing(Local):
+            def import_items(self, records):
+                raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            snapshot.load(Failing('test'), iter([('key', 1, None, None)]))
+
+    def test_snapshot_any_adapter_via_memory(self):
+        """ Adapters able to iterate items can be snapshotted """
+        memory = Memory(
+            adapters=dict(local=dict(type='local')),
+            caches=dict(
+                test=dict(adapter='local', ttl=60),
+                other=dict(adapter='local', ttl=60),
+            )
+        )
+        cache = memory.get_cache('test')
+        cache.set('one', '1', tags=['tag'])
+        cache.set('two', '2')
+
+        self.assertEqual(2, memory.snapshot_cache('test', self.path)['keys'])
+        self.assertEqual(2, memory.warmup_cache('other', self.path)['keys'])
+        other = memory.get_cache('other')
+        self.assertEqual('1', other.get('one'))
+        self.assertEqual({'one'}, other.get_tagged_items('tag'))
@@ -0,0 +1,76 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+
+from shiftmemory import stats
+
+
+@attr('stats')
+class StatsTest(TestCase):
+    """
+    Stats tests
+    This holds tests for sampling and estimation utilities
+    """
+
+    def test_reservoir_keeps_everything_until_full(self):
+        """ Reservoir keeps all items while stream is smaller than sample """
+        reservoir = stats.Reservoir(10)
+        for i in range(5):
+            reservoir.add(i)
+        self.assertEqual([0, 1, 2, 3, 4], reservoir.items)
+
+    def test_reservoir_sample_is_bounded_and_uniform(self):
+        """ Reservoir sample stays bounded and covers the whole stream """
+        reservoir = stats.Reservoir(1000, seed=1)
+        for i in range(100000):
+            reservoir.add(i)
+
+        self.assertEqual(1000, len(reservoir.items))
+        self.assertEqual(100000, reservoir.seen)
+        mean = sum(reservoir.items) / len(reservoir.items)
+        self.assertTrue(45000 < mean < 55000)
+
+    def test_estimate_with_bounds(self):
+        """ Estimating mean and total with confidence bounds """
+        result = stats.estimate([10, 20, 30, None], population=100)
+        self.assertEqual(3, result['samples'])
+        self.assertEqual(20, result['mean'])
+        self.assertTrue(result['low'] < 20 < result['high'])
+        self.assertEqual(2000, result['total'])
+
+    def test_estimate_is_exact_for_whole_population(self):
+        """ No error margin when whole population was sampled """
+        result = stats.estimate([10, 20, 30], population=3)
+        self.assertEqual(result['low'], result['high'])
+
+    def test_estimate_without_values(self):
+        """ Estimating nothing """
+        self.assertIsNone(stats.estimate([])['mean'])
+
+    def test_proportion(self):
+        """ Estimating proportion with wilson interval """
+        share, low, high = stats.proportion(50, 100)
+        self.assertEqual(0.5, share)
+        self.assertTrue(0.39 < low < 0.5 < high < 0.61)
+
+    def test_size_histogram(self):
+        """ Counting sizes into power of two buckets """
+        histogram = stats.size_histogram([1, 3, 4, 5, 1000, None])
+        self.assertEqual([(1, 1), (4, 2), (8, 1), (1024, 1)], histogram)
+
+    def test_ttl_histogram(self):
+        """ Counting ttls into buckets """
+        histogram = stats.ttl_histogram([-1, 10, 100, 100000, 10 ** 7])
+        self.assertEqual(1, histogram['none'])
+        self.assertEqual(1, histogram['<1m'])
+        self.assertEqual(1, histogram['<1h'])
+        self.assertEqual(1, histogram['<1w'])
+        self.assertEqual(1, histogram['>=1w'])
+
+    def test_percentiles(self):
+        """ Getting nearest-rank percentiles """
+        result = stats.percentiles(range(1, 101), points=(50, 99))
+        self.assertEqual(100, result['count'])
+        self.assertEqual(50, result['p50'])
+        self.assertEqual(99, result['p99'])
+        self.assertEqual(100, result['max'])
+        self.assertEqual(dict(count=0), stats.percentiles([]))
@@ -0,0 +1,114 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+from click.testing import CliRunner
+import json
+import os
+import shutil
+import tempfile
+
+from shiftmemory import Memory, trace, policy, exceptions
+from shiftmemory.adapter import Local
+from shiftmemory.cli.console import cli
+
+
+@attr('trace')
+class TraceTest(TestCase):
+    """
+    Trace tests
+    This holds tests for trace recording and replay
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.trace')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TestCase.tearDown(self)
+
+    def record_workload(self, sample_rate=1.0):
+        memory = Memory(
+            adapters=dict(local=dict(type='local')),
+            caches=dict(demo=dict(
+                adapter='local',
+                ttl=60,
+                trace=dict(path=self.path, sample_rate=sample_rate)
+            ))
+        )
+        cache = memory.get_cache('demo')
+        for i in range(200):
+            key = 'key{}'.format(i % 20)
+            if cache.get(key) is None:
+                cache.set(key, 'x' * 10, ttl=30)
+        cache.delete('key1')
+        cache.recorder.close()
+        return cache
+
+    # -------------------------------------------------------------------------
+
+    def test_record_and_read_trace(self):
+        """ Recording operations through memory and reading them back """
+        cache = self.record_workload()
+        self.assertIsInstance(cache.cache, Local)
+        self.assertEqual(0, cache.recorder.dropped)
+
+        sample_rate, records = trace.read(self.path)
+        records = list(records)
+        self.assertEqual(1.0, sample_rate)
+        self.assertEqual(200 + 20 + 1, len(records))
+
+        first, second = records[:2]
+        self.assertEqual('get', first.operation)
+        self.assertFalse(first.hit)
+        self.assertEqual(('set', 10, 30), second[1:2] + second[3:5])
+        self.assertEqual(trace.hash_key('key0'), second.key)
+        self.assertEqual('delete', records[-1].operation)
+
+    def test_sample_by_key(self):
+        """ Sampling records all or no operations of a key """
+        self.record_workload(sample_rate=0.3)
+        _, records = trace.read(self.path)
+        counts = dict()
+        for record in records:
+            if record.operation == 'get':
+                counts[record.key] = counts.get(record.key, 0) + 1
+
+        self.assertTrue(0 < len(counts) < 20)
+        self.assertEqual({10}, set(counts.values()))
+
+    def test_fail_on_reading_other_files(self):
+        """ Raise when reading something that is not a trace """
+        with open(self.path, 'wb') as file:
+            file.write(b'nope')
+        with self.assertRaises(exceptions.ValueException):
+            trace.read(self.path)
+
+    def test_replay_against_policy_and_adapter(self):
+        """ Replaying trace reports hit ratio, memory and latencies """
+        self.record_workload()
+        _, records = trace.read(self.path)
+        result = trace.replay(records, policy.create('lru', 100))
+        self.assertEqual(200, result['requests'])
+        self.assertEqual(180, result['hits'])
+        self.assertEqual(190, result['memory'])
+        self.assertEqual(200, result['latency']['get']['count'])
+
+        _, records = trace.read(self.path)
+        result = trace.replay(records, Local('replay'))
+        self.assertEqual(180, result['hits'])
+        self.assertIsNone(result['memory'])
+
+    def test_simulate_capacities_from_cli(self):
+        """ Simulating several capacities from console """
+        self.record_workload()
+        result = CliRunner().invoke(cli, [
+            'replay', self.path,
+            '--capacity', '5',
+            '--capacity', '40',
+            '--policy', 'lru',
+            '--json'
+        ])
+        results = json.loads(result.output)
+        self.assertEqual([5, 40], [r['capacity'] for r in results])
+        self.assertTrue(results[0]['hit_ratio'] < results[1]['hit_ratio'])
@@ -0,0 +1,149 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import threading
+import time
+
+from shiftmemory import exceptions
+from shiftmemory.writebehind import WriteBuffer
+
+
+@attr('writebehind')
+class WriteBehindTest(TestCase):
+    """
+    Write-behind tests
+    This holds tests for write-behind buffer
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.batches = []
+
+    def writer(self, batch):
+        self.batches.append(list(batch))
+
+    def test_raise_on_unknown_overflow_policy(self):
+        """ Raise on unknown overflow policy """
+        with self.assertRaises(exceptions.ConfigurationException):
+            WriteBuffer(self.writer, overflow='explode')
+
+    def test_coalesce_writes(self):
+        """ Repeated writes of a key are coalesced """
+        buffer = WriteBuffer(self.writer, interval=60)
+        buffer.put('a', 1)
+        buffer.put('b', 2)
+        buffer.put('a', 3)
+        self.assertEqual(3, buffer.get('a'))
+        self.assertEqual(2, buffer.stats()['depth'])
+        self.assertEqual(1, buffer.stats()['coalesced'])
+
+        buffer.flush()
+        self.assertEqual([[3, 2]], self.batches)
+        self.assertIsNone(buffer.get('a'))
+        buffer.close()
+
+    def test_flush_on_batch_size(self):
+        """ Full batches are written in background """
+        buffer = WriteBuffer(self.writer, batch_size=2, interval=60)
+        buffer.put('a', 1)
+        buffer.put('b', 2)
+        time.sleep(0.05)
+        self.assertEqual([[1, 2]], self.batches)
+        buffer.close()
+
+    def test_flush_on_interval(self):
+        """ Items are written once the oldest waited for interval """
+        buffer = WriteBuffer(self.writer, interval=0.01)
+        buffer.put('a', 1)
+        time.sleep(0.05)
+        self.assertEqual([[1]], self.batches)
+        self.assertEqual(1, buffer.stats()['written'])
+        buffer.close()
+
+    def test_report_oldest_age(self):
+        """ Reporting age of the oldest pending item """
+        buffer = WriteBuffer(self.writer, interval=60)
+        self.assertEqual(0, buffer.stats()['oldest_age'])
+        buffer.put('a', 1)
+        time.sleep(0.02)
+        buffer.put('b', 2)
+        self.assertTrue(buffer.stats()['oldest_age'] >= 0.02)
+        buffer.close()
+
+    def test_drop_when_full(self):
+        """ Drop overflow policy discards new keys """
+        buffer = WriteBuffer(self.writer, max_items=1, overflow='drop')
+        self.assertTrue(buffer.put('a', 1))
+        self.assertFalse(buffer.put('b', 2))
+        self.assertTrue(buffer.put('a', 3))
+        self.assertEqual(1, buffer.stats()['dropped'])
+        buffer.close()
+        self.assertEqual([[3]], self.batches)
+
+    def test_write_synchronously_when_full(self):
+        """ Sync overflow policy writes new keys right away """
+        buffer = WriteBuffer(
+            self.writer,
+            max_items=1,
+            interval=60,
+            overflow='sync'
+        )
+        buffer.put('a', 1)
+        buffer.put('b', 2)
+        self.assertEqual([[2]], self.batches)
+        self.assertEqual(1, buffer.stats()['synced'])
+        buffer.close()
+
+    def test_block_when_full(self):
+        """ Block overflow policy waits for flusher """
+        buffer = WriteBuffer(self.writer, max_items=1, interval=0.01)
+        buffer.put('a', 1)
+        buffer.put('b', 2)
+        buffer.close()
+        self.assertEqual([[1], [2]], self.batches)
+        self.assertEqual(1, buffer.stats()['blocked'])
+
+    def test_discard_pending_item(self):
+        """ Discarded items are not written """
+        buffer = WriteBuffer(self.writer, interval=60)
+        buffer.put('a', 1)
+        self.assertTrue(buffer.discard('a'))
+        self.assertFalse(buffer.discard('a'))
+        buffer.close()
+        self.assertEqual([], self.batches)
+
+    def test_discard_waits_for_write_in_progress(self):
+        """ Discarding item being written waits for the write """
+        started = threading.Event()
+
+        def writer(batch):
+            started.set()
+            time.sleep(0.05)
+            self.batches.append(batch)
+
+        buffer = WriteBuffer(writer, interval=0.01)
+        buffer.put('a', 1)
+        started.wait()
+        self.assertEqual(1, buffer.get('a'))
+        buffer.discard('a')
+        self.assertEqual([[1]], self.batches)
+        buffer.close()
+
+    def test_count_failed_batches(self):
+        """ Failed batches are counted and discarded """
+        def writer(batch):
+            raise RuntimeError('Server gone')
+
+        buffer = WriteBuffer(writer, interval=60)
+        buffer.put('a', 1)
+        buffer.flush()
+        self.assertEqual(1, buffer.stats()['errors'])
+        self.assertEqual(0, buffer.stats()['depth'])
+        buffer.close()
+
+    def test_write_after_close(self):
+        """ Items put after close are written right away """
+        buffer = WriteBuffer(self.writer, interval=60)
+        buffer.put('a', 1)
+        buffer.close()
+        buffer.put('b', 2)
+        self.assertEqual([[1], [2]], self.batches)